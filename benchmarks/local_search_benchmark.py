@@ -0,0 +1,72 @@
+"""
+Compares the local search matchmaking with the exact meet in the middle solver
+
+Recorded queues can be given as a JSON file holding a list of queues, each of them being a list of
+    {"player_id", "role", "duo_id", "trueskill_mu", "trueskill_sigma"} objects from the oldest to the newest
+    which is what GameQueue.get_snapshot() returns
+
+Without it, synthetic queues are used:
+    python -m benchmarks.local_search_benchmark [--queues recorded_queues.json]
+"""
+
+import argparse
+import time
+from typing import List
+
+from inhouse_bot.game_queue import QueuePlayerSnapshot
+from inhouse_bot.matchmaking_logic import local_search, meet_in_the_middle
+from inhouse_bot.matchmaking_logic.find_best_game import get_matchmaking_score
+
+from benchmarks.queue_utils import get_recorded_queues, get_synthetic_queue
+
+
+def run_benchmark(queues: List[List[QueuePlayerSnapshot]]):
+    print(f"{'players':>8} {'exact score':>12} {'exact time':>11} {'local score':>12} {'local time':>11}")
+
+    score_gaps = []
+
+    for queue in queues:
+        # We look for the best game, without stopping on good enough ones
+        start = time.perf_counter()
+        exact_composition = meet_in_the_middle.find_best_composition(queue, good_enough_score=0)
+        exact_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        local_composition = local_search.find_best_composition(queue, good_enough_score=0)
+        local_time = time.perf_counter() - start
+
+        if not exact_composition:
+            continue
+
+        exact_score = get_matchmaking_score(exact_composition)
+        local_score = get_matchmaking_score(local_composition)
+
+        score_gaps.append(local_score - exact_score)
+
+        print(
+            f"{len(queue):>8} {exact_score:>12.2e} {exact_time:>10.3f}s {local_score:>12.2e} {local_time:>10.3f}s"
+        )
+
+    print(
+        f"\nLocal search is {sum(score_gaps) / len(score_gaps) * 100:.4f}% winrate away from the best game on average, "
+        f"{max(score_gaps) * 100:.4f}% at most"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--queues", help="JSON file of recorded queues")
+    args = parser.parse_args()
+
+    if args.queues:
+        benchmark_queues = get_recorded_queues(args.queues)
+    else:
+        benchmark_queues = [
+            get_synthetic_queue(players_per_role, duos_count=players_per_role // 2, seed=seed)
+            for players_per_role in (4, 6, 8, 10)
+            for seed in range(3)
+        ]
+
+    run_benchmark(benchmark_queues)
@@ -0,0 +1,184 @@
+"""
+Times the matchmaking functions on in-memory queues, without any database
+
+Synthetic queues go from 2 to 8 players per role, with 0 to 4 duos and narrow or wide rating spreads
+Recorded queues can be given in the same JSON format as local_search_benchmark
+
+Results are written as JSON, and the results of a previous version can be given to compare both:
+    python -m benchmarks.matchmaking_benchmark [--queues recorded_queues.json] [--output results.json]
+        [--baseline previous_results.json]
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from inhouse_bot.game_queue import QueuePlayerSnapshot
+from inhouse_bot.matchmaking_logic import evaluate_game, find_best_game, SearchStats
+from inhouse_bot.matchmaking_logic.find_best_game import find_best_game_for_queue_players
+
+from benchmarks.queue_utils import (
+    get_in_memory_queue,
+    get_queue_players,
+    get_recorded_queues,
+    get_synthetic_queue,
+)
+
+# Standard deviation of the players’ mu around the default trueskill rating
+rating_spreads = {"narrow": 2, "wide": 8}
+
+
+def measure(function: Callable[[], int], repeats: int) -> Dict[str, float]:
+    """
+    Calls the function repeats times, which returns the number of compositions it evaluated
+
+    Peak memory is measured on an additional call, as tracemalloc slows everything down
+    """
+    latencies = []
+    compositions_evaluated = 0
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        compositions_evaluated += function()
+        latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    function()
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)) * 1000,
+        "p99_ms": float(np.percentile(latencies, 99)) * 1000,
+        "compositions_per_second": compositions_evaluated / sum(latencies),
+        "peak_memory_kb": peak_memory / 1024,
+    }
+
+
+def run_case(queue_snapshot: List[QueuePlayerSnapshot], repeats: int) -> Dict[str, Dict[str, float]]:
+    """
+    Times the three matchmaking entry points on the same queue
+
+    QueuePlayer objects and the GameQueue are built once, so only the matchmaking itself is timed
+    """
+    queue_players = get_queue_players(queue_snapshot)
+    queue = get_in_memory_queue(queue_players)
+
+    def run_find_best_game() -> int:
+        stats = SearchStats()
+        find_best_game(queue, stats=stats)
+        return stats.compositions_evaluated
+
+    def run_find_best_game_for_queue_players() -> int:
+        stats = SearchStats()
+        find_best_game_for_queue_players(queue_players, stats=stats)
+        return stats.compositions_evaluated
+
+    # evaluate_game is timed on the game the matchmaking picked
+    game = find_best_game_for_queue_players(queue_players)
+
+    def run_evaluate_game() -> int:
+        evaluate_game(game)
+        return 1
+
+    results = {
+        "find_best_game": measure(run_find_best_game, repeats),
+        "find_best_game_for_queue_players": measure(run_find_best_game_for_queue_players, repeats),
+    }
+
+    # Queues with no valid game, for example with duos in the same role, have nothing to evaluate
+    if game:
+        results["evaluate_game"] = measure(run_evaluate_game, repeats)
+
+    return results
+
+
+def get_version() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(cases: Dict[str, List[QueuePlayerSnapshot]], repeats: int) -> dict:
+    print(f"{'case':<24} {'function':<34} {'p50':>10} {'p99':>10} {'compositions/s':>15} {'peak memory':>12}")
+
+    results = {}
+
+    for case_name, queue_snapshot in cases.items():
+        results[case_name] = run_case(queue_snapshot, repeats)
+
+        for function_name, metrics in results[case_name].items():
+            print(
+                f"{case_name:<24} {function_name:<34} {metrics['p50_ms']:>8.2f}ms {metrics['p99_ms']:>8.2f}ms "
+                f"{metrics['compositions_per_second']:>15.0f} {metrics['peak_memory_kb']:>10.0f}kB"
+            )
+
+    return {
+        "version": get_version(),
+        "python": platform.python_version(),
+        "date": datetime.datetime.now().isoformat(),
+        "repeats": repeats,
+        "cases": results,
+    }
+
+
+def compare(results: dict, baseline: dict):
+    """
+    Prints the p50 latency ratio of every case and function found in both results, above 1 being slower
+    """
+    print(f"\nComparison with {baseline['version']} (p50 latency ratio, lower is better)")
+
+    for case_name, case_results in results["cases"].items():
+        for function_name, metrics in case_results.items():
+            try:
+                baseline_metrics = baseline["cases"][case_name][function_name]
+            except KeyError:
+                continue
+
+            print(
+                f"{case_name:<24} {function_name:<34} {metrics['p50_ms'] / baseline_metrics['p50_ms']:>6.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--queues", help="JSON file of recorded queues")
+    parser.add_argument("--repeats", type=int, default=20, help="Timed calls per case and function")
+    parser.add_argument("--output", default="matchmaking_benchmark.json", help="JSON file for the results")
+    parser.add_argument("--baseline", help="JSON results of a previous version to compare with")
+    args = parser.parse_args()
+
+    if args.queues:
+        benchmark_cases = {
+            f"recorded_{idx}": queue for idx, queue in enumerate(get_recorded_queues(args.queues))
+        }
+    else:
+        benchmark_cases = {
+            f"{players_per_role}pr_{duos_count}duos_{spread_name}": get_synthetic_queue(
+                players_per_role, duos_count, seed=players_per_role, rating_spread=spread
+            )
+            for players_per_role in (2, 4, 6, 8)
+            for duos_count in (0, 2, 4)
+            for spread_name, spread in rating_spreads.items()
+        }
+
+    benchmark_results = run_benchmark(benchmark_cases, args.repeats)
+
+    with open(args.output, "w") as file:
+        json.dump(benchmark_results, file, indent=4)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            compare(benchmark_results, json.load(file))
@@ -0,0 +1,93 @@
+"""
+In-memory queues shared by the benchmarks and the matchmaking tests, without any database
+"""
+
+import datetime
+import json
+import random
+from typing import List
+
+from inhouse_bot.database_orm import QueuePlayer, Player, PlayerRating
+from inhouse_bot.common_utils.fields import roles_list
+from inhouse_bot.game_queue import GameQueue, QueuePlayerSnapshot
+
+
+def get_synthetic_queue(
+    players_per_role: int, duos_count: int, seed: int, rating_spread: float = 5
+) -> List[QueuePlayerSnapshot]:
+    """
+    Random ratings around the default trueskill rating, with duos made of consecutive players
+    """
+    rng = random.Random(seed)
+
+    queue = [
+        QueuePlayerSnapshot(
+            player_id=player_id,
+            role=roles_list[player_id % len(roles_list)],
+            duo_id=None,
+            trueskill_mu=rng.gauss(25, rating_spread),
+            trueskill_sigma=rng.uniform(2, 25 / 3),
+        )
+        for player_id in range(players_per_role * len(roles_list))
+    ]
+
+    # Snapshots are immutable, so duo partners are replaced by linked copies
+    for duo_idx in range(duos_count):
+        first_qp, second_qp = queue[2 * duo_idx], queue[2 * duo_idx + 1]
+        queue[2 * duo_idx] = first_qp.replace(duo_id=second_qp.player_id)
+        queue[2 * duo_idx + 1] = second_qp.replace(duo_id=first_qp.player_id)
+
+    return queue
+
+
+def get_recorded_queues(file_name: str) -> List[List[QueuePlayerSnapshot]]:
+    with open(file_name) as file:
+        return [[QueuePlayerSnapshot(**row) for row in queue] for queue in json.load(file)]
+
+
+def get_queue_players(queue_snapshot: List[QueuePlayerSnapshot]) -> List[QueuePlayer]:
+    """
+    Creates the QueuePlayer objects of a snapshot without adding them to a session, oldest first
+    """
+    players = {}
+    queue_players = []
+
+    start = datetime.datetime.now()
+
+    for queue_idx, snapshot in enumerate(queue_snapshot):
+        player = players.setdefault(
+            snapshot.player_id, Player(id=snapshot.player_id, server_id=0, name=str(snapshot.player_id))
+        )
+
+        player.ratings[snapshot.role] = PlayerRating(player, snapshot.role)
+        player.ratings[snapshot.role].trueskill_mu = snapshot.trueskill_mu
+        player.ratings[snapshot.role].trueskill_sigma = snapshot.trueskill_sigma
+
+        queue_player = QueuePlayer(
+            channel_id=0,
+            player_id=snapshot.player_id,
+            player_server_id=0,
+            role=snapshot.role,
+            duo_id=snapshot.duo_id,
+            queue_time=start + datetime.timedelta(seconds=queue_idx),
+        )
+        queue_player.player = player
+
+        queue_players.append(queue_player)
+
+    return queue_players
+
+
+def get_in_memory_queue(queue_players: List[QueuePlayer]) -> GameQueue:
+    """
+    Creates a GameQueue object from in-memory QueuePlayers already ordered by age
+
+    GameQueue.__init__ would load them from the queue store or the database
+    """
+    queue = GameQueue.__new__(GameQueue)
+
+    queue.channel_id = 0
+    queue.server_id = 0
+    queue.queue_players = [QueuePlayerSnapshot.from_queue_player(qp) for qp in queue_players]
+
+    return queue
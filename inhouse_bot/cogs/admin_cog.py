@@ -1,14 +1,16 @@
-from typing import Union
+from typing import List, Optional, Tuple, Union
 
 import discord
 from discord.ext import commands
 from discord.ext.commands import guild_only
 
 from inhouse_bot import game_queue, matchmaking_logic
+from inhouse_bot.common_utils.fields import full_roles_dict
 from inhouse_bot.database_orm import session_scope
 from inhouse_bot.common_utils.get_last_game import get_last_game
 from inhouse_bot.inhouse_bot import InhouseBot
 from inhouse_bot.queue_channel_handler import queue_channel_handler
+from inhouse_bot.queue_channel_handler.queue_channel_handler import queue_channel_only
 from inhouse_bot.ranking_channel_handler.ranking_channel_handler import ranking_channel_handler
 
 
@@ -55,6 +57,145 @@ class AdminCog(commands.Cog, name="Admin"):
 
         await queue_channel_handler.update_queue_channels(bot=self.bot, server_id=ctx.guild.id)
 
+    @admin.command()
+    @queue_channel_only()
+    async def queue(self, ctx: commands.Context, *players_and_roles: str):
+        """
+        Adds many players to the current channel’s queue at once, each for the roles given after him
+
+        Example:
+            !admin queue @CoreJJ sup @Doublelift bot
+            !admin queue @Bjergsen mid @Jensen mid top
+        """
+        players_roles = await self.get_players_roles(ctx, players_and_roles)
+
+        if players_roles is None:
+            return
+
+        # Duplicate roles are only queued once
+        game_queue.add_queue_players(
+            list(
+                dict.fromkeys(
+                    game_queue.QueueRequest(member.id, role, member.display_name)
+                    for member, roles in players_roles
+                    for role in roles
+                )
+            ),
+            channel_id=ctx.channel.id,
+            server_id=ctx.guild.id,
+        )
+
+        await ctx.send(f"{len(players_roles)} players have been added to the queue")
+        await self.update_queue(ctx)
+
+    @admin.command()
+    @queue_channel_only()
+    async def duos(self, ctx: commands.Context, *players_and_roles: str):
+        """
+        Adds many duos to the current channel’s queue at once, each player being followed by his role
+
+        Example:
+            !admin duos @CoreJJ sup @Doublelift bot @Bjergsen mid @Jensen top
+        """
+        players_roles = await self.get_players_roles(ctx, players_and_roles)
+
+        if players_roles is None:
+            return
+
+        if len(players_roles) % 2 or any(len(roles) != 1 for member, roles in players_roles):
+            await ctx.send("Duos need an even number of players, each with a single role")
+            return
+
+        requests = [
+            game_queue.QueueRequest(member.id, roles[0], member.display_name)
+            for member, roles in players_roles
+        ]
+
+        game_queue.add_duos(
+            list(zip(requests[::2], requests[1::2])), channel_id=ctx.channel.id, server_id=ctx.guild.id,
+        )
+
+        await ctx.send(f"{len(requests) // 2} duos have been added to the queue")
+        await self.update_queue(ctx)
+
+    @admin.command()
+    @queue_channel_only()
+    async def remove(self, ctx: commands.Context, *members: discord.Member):
+        """
+        Removes many players from the current channel’s queue at once
+
+        Example:
+            !admin remove @CoreJJ @Doublelift
+        """
+        game_queue.remove_players({member.id for member in members}, channel_id=ctx.channel.id)
+
+        await ctx.send(f"{len(members)} players have been removed from the queue")
+        await queue_channel_handler.update_queue_channels(bot=self.bot, server_id=ctx.guild.id)
+
+    @admin.command()
+    @queue_channel_only()
+    async def ttl(self, ctx: commands.Context, minutes: int = None):
+        """
+        Sets the minutes after which idle players leave the current channel’s queue
+
+        0 never removes them, and no argument goes back to the bot’s default
+
+        Example:
+            !admin ttl 120
+        """
+        queue_channel_handler.set_queue_ttl(ctx.channel.id, minutes)
+
+        queue_ttl = queue_channel_handler.get_queue_ttls()[ctx.channel.id]
+
+        if queue_ttl:
+            await ctx.send(f"Players will be removed from this queue after {queue_ttl} minutes")
+        else:
+            await ctx.send("Players will not be removed from this queue anymore")
+
+    @staticmethod
+    async def get_players_roles(
+        ctx: commands.Context, players_and_roles: Tuple[str, ...]
+    ) -> Optional[List[Tuple[discord.Member, List[str]]]]:
+        """
+        Parses players each followed by their roles, or returns None after telling what was not understood
+
+        Roles have to be spelled exactly, so players whose names look like a role are not taken for one
+        """
+        players_roles = []
+
+        for argument in players_and_roles:
+            # Mentions and IDs never match a role, and other arguments are players unless they are exactly a role
+            role = full_roles_dict.get(argument.lower())
+
+            if role and players_roles:
+                players_roles[-1][1].append(role)
+                continue
+
+            try:
+                players_roles.append((await commands.MemberConverter().convert(ctx, argument), []))
+
+            except commands.BadArgument:
+                await ctx.send(f"`{argument}` was not understood as a player or a role")
+                return None
+
+        if not players_roles or any(not roles for member, roles in players_roles):
+            await ctx.send("Every player needs to be followed by at least one role")
+            return None
+
+        return players_roles
+
+    async def update_queue(self, ctx: commands.Context):
+        """
+        Runs the matchmaking for the new queue and updates the queue channels
+        """
+        queue_cog = self.bot.get_cog("Queue")
+
+        if queue_cog:
+            matchmaking_key = queue_cog.get_matchmaking_key(ctx.channel)
+            queue_cog.matchmaking_scheduler.mark_dirty(matchmaking_key, ctx.channel)
+
+        await queue_channel_handler.update_queue_channels(bot=self.bot, server_id=ctx.guild.id)
+
     @admin.command()
     async def won(self, ctx: commands.Context, member: discord.Member):
         """
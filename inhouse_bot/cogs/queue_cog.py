@@ -1,20 +1,24 @@
+import asyncio
+from collections import defaultdict
 from datetime import datetime, timedelta
+from typing import Dict, List
 
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 
 from inhouse_bot import game_queue
 from inhouse_bot import matchmaking_logic
 
 from inhouse_bot.common_utils.emoji_and_thumbnails import get_role_emoji
-from inhouse_bot.common_utils.fields import RoleConverter
+from inhouse_bot.common_utils.fields import RoleConverter, roles_list
 from inhouse_bot.common_utils.get_last_game import get_last_game
 from inhouse_bot.common_utils.validation_dialog import checkmark_validation
 
-from inhouse_bot.database_orm import session_scope
+from inhouse_bot.database_orm import session_scope, Game
 from inhouse_bot.inhouse_bot import InhouseBot
+from inhouse_bot.matchmaking_logic.matchmaking_scheduler import MatchmakingScheduler
 from inhouse_bot.queue_channel_handler import queue_channel_handler
-from inhouse_bot.queue_channel_handler.queue_channel_handler import queue_channel_only
+from inhouse_bot.queue_channel_handler.queue_channel_handler import queue_channel_only, queue_sweep_interval
 from inhouse_bot.ranking_channel_handler.ranking_channel_handler import ranking_channel_handler
 
 
@@ -32,115 +36,205 @@ class QueueCog(commands.Cog, name="Queue"):
 
         self.games_getting_scored_ids = set()
 
+        # Queue changes are coalesced, and each channel runs one matchmaking or ready check at a time
+        self.matchmaking_scheduler = MatchmakingScheduler(self.run_matchmaking_logic)
+
+        # Searches also run after cancelled ready checks, which can happen together with multiple games
+        #   channel_id (or server_id with server-wide matchmaking) -> asyncio.Lock
+        self.matchmaking_locks = defaultdict(asyncio.Lock)
+
+        self.sweep_idle_players.start()
+
+    def cog_unload(self):
+        self.sweep_idle_players.cancel()
+
+    @tasks.loop(seconds=queue_sweep_interval)
+    async def sweep_idle_players(self):
+        """
+        Removes idle players from the queues, with a single refresh of each channel they were removed from
+        """
+        channel_ids = game_queue.expire_queue_players(queue_channel_handler.get_queue_ttls())
+
+        for channel_id in channel_ids:
+            channel = self.bot.get_channel(channel_id)
+
+            if channel:
+                await queue_channel_handler.refresh_channel_queue(channel=channel, restart=False)
+
+    @sweep_idle_players.before_loop
+    async def before_sweep_idle_players(self):
+        await self.bot.wait_until_ready()
+
     async def run_matchmaking_logic(
-        self, ctx: commands.Context,
+        self, channel: discord.TextChannel, after_cancelled_ready_check=False,
     ):
         """
-        Runs the matchmaking logic in the channel defined by the context
+        Runs the matchmaking logic in the given channel, or in all queue channels of its server if server-wide
 
-        Should only be called inside guilds
+        Should only be called inside guilds, through the matchmaking scheduler
         """
-        queue = game_queue.GameQueue(ctx.channel.id)
+        # Ready checks can be cancelled at the same time, but their new searches never overlap
+        async with self.matchmaking_locks[self.get_matchmaking_key(channel)]:
+            if matchmaking_logic.server_wide_matchmaking:
+                channels_games = await self.find_server_games(channel.guild.id)
+
+            else:
+                queue = game_queue.GameQueue(channel.id)
 
-        game = matchmaking_logic.find_best_game(queue)
+                # After a cancelled ready check, a candidate game computed during it can often be used
+                game = matchmaking_logic.find_candidate_game(queue) if after_cancelled_ready_check else None
 
-        if not game:
-            return
+                # Busy channels can pop multiple games at once, the first one going to the oldest players
+                games = [game] if game else await matchmaking_logic.find_best_games_in_executor(queue)
 
-        elif game and game.matchmaking_score < 0.2:
-            embed = game.get_embed(embed_type="GAME_FOUND", validated_players=[], bot=self.bot)
+                channels_games = {channel: games}
 
-            # We notify the players and send the message
-            ready_check_message = await ctx.send(content=game.players_ping, embed=embed, delete_after=60 * 15)
+            ready_checks = []
 
-            # We mark the ready check as ongoing (which will be used to the queue)
-            game_queue.start_ready_check(
-                player_ids=game.player_ids_list,
-                channel_id=ctx.channel.id,
-                ready_check_message_id=ready_check_message.id,
-            )
+            for games_channel, games in channels_games.items():
+                if not games:
+                    continue
 
-            # We update the queue in all channels
-            await queue_channel_handler.update_queue_channels(bot=self.bot, server_id=ctx.guild.id)
-
-            # And then we wait for the validation
-            try:
-                ready, players_to_drop = await checkmark_validation(
-                    bot=self.bot,
-                    message=ready_check_message,
-                    validating_players_ids=game.player_ids_list,
-                    validation_threshold=10,
-                    game=game,
-                )
+                elif games[0].matchmaking_score >= 0.2:
+                    # One side has over 70% predicted winrate, we do not start anything
+                    #   With server-wide matchmaking, we only say it in the channel where somebody queued
+                    if games_channel.id != channel.id:
+                        continue
 
-            # We catch every error here to make sure it does not become blocking
-            except Exception as e:
-                self.bot.logger.error(e)
-                game_queue.cancel_ready_check(
-                    ready_check_id=ready_check_message.id,
-                    ids_to_drop=game.player_ids_list,
-                    server_id=ctx.guild.id,
-                )
-                await ctx.send(
-                    "There was a bug with the ready-check message, all players have been dropped from queue\n"
-                    "Please queue again to restart the process"
-                )
+                    await channel.send(
+                        f"The best match found had a side with a {(.5 + games[0].matchmaking_score)*100:.1f}%"
+                        f" predicted winrate and was not started"
+                    )
+                    continue
+
+                for game in games:
+                    embed = game.get_embed(embed_type="GAME_FOUND", validated_players=[], bot=self.bot)
+
+                    # We notify the players and send the message
+                    ready_check_message = await games_channel.send(
+                        content=game.players_ping, embed=embed, delete_after=60 * 15
+                    )
+
+                    # We mark the ready check as ongoing (which will be used to the queue)
+                    game_queue.start_ready_check(
+                        player_ids=game.player_ids_list,
+                        channel_id=games_channel.id,
+                        ready_check_message_id=ready_check_message.id,
+                    )
 
-                await queue_channel_handler.update_queue_channels(bot=self.bot, server_id=ctx.guild.id)
+                    ready_checks.append((games_channel, game, ready_check_message))
 
+            if not ready_checks:
                 return
 
-            if ready is True:
-                # We drop all 10 players from the queue
-                game_queue.validate_ready_check(ready_check_message.id)
+            # We update the queue in all channels
+            await queue_channel_handler.update_queue_channels(bot=self.bot, server_id=channel.guild.id)
 
-                # We commit the game to the database (without a winner)
-                with session_scope() as session:
-                    session.expire_on_commit = False
-                    game = session.merge(game)  # This gets us the game ID
+        # And then we wait for the validation of all games at the same time
+        await asyncio.gather(
+            *(
+                self.run_ready_check(games_channel, game, ready_check_message)
+                for games_channel, game, ready_check_message in ready_checks
+            )
+        )
 
-                queue_channel_handler.mark_queue_related_message(
-                    await ctx.send(embed=game.get_embed("GAME_ACCEPTED"),)
-                )
+    @staticmethod
+    def get_matchmaking_key(channel: discord.TextChannel) -> int:
+        """
+        Server-wide matchmaking runs one search per server, else it is one per channel
+        """
+        return channel.guild.id if matchmaking_logic.server_wide_matchmaking else channel.id
 
-            elif ready is False:
-                # We remove the player who cancelled
-                game_queue.cancel_ready_check(
-                    ready_check_id=ready_check_message.id,
-                    ids_to_drop=players_to_drop,
-                    channel_id=ctx.channel.id,
-                )
+    async def find_server_games(self, server_id: int) -> Dict[discord.TextChannel, List[Game]]:
+        """
+        Finds the games of all queue channels of the server in a single search
+        """
+        channels = [
+            channel
+            for channel in map(self.bot.get_channel, queue_channel_handler.get_server_queues(server_id))
+            if channel  # Channels that do not exist anymore are cleaned up when queues are updated
+        ]
 
-                await ctx.send(
-                    f"A player cancelled the game and was removed from the queue\n"
-                    f"All other players have been put back in the queue",
-                )
+        channels_games = await matchmaking_logic.find_server_games_in_executor(
+            {channel.id: game_queue.GameQueue(channel.id) for channel in channels}
+        )
 
-                # We restart the matchmaking logic
-                await self.run_matchmaking_logic(ctx)
+        return {channel: channels_games.get(channel.id, []) for channel in channels}
 
-            elif ready is None:
-                # We remove the timed out players from *all* channels (hence giving server id)
-                game_queue.cancel_ready_check(
-                    ready_check_id=ready_check_message.id,
-                    ids_to_drop=players_to_drop,
-                    server_id=ctx.guild.id,
-                )
+    async def run_ready_check(
+        self, channel: discord.TextChannel, game: Game, ready_check_message: discord.Message,
+    ):
+        """
+        Waits for the ready check of a game, and restarts the matchmaking logic if it gets cancelled
+        """
+        try:
+            ready, players_to_drop = await checkmark_validation(
+                bot=self.bot,
+                message=ready_check_message,
+                validating_players_ids=game.player_ids_list,
+                validation_threshold=10,
+                game=game,
+            )
 
-                await ctx.send(
-                    "The check timed out and players who did not answer have been dropped from all queues",
-                )
+        # We catch every error here to make sure it does not become blocking
+        except Exception as e:
+            self.bot.logger.error(e)
+            game_queue.cancel_ready_check(
+                ready_check_id=ready_check_message.id,
+                ids_to_drop=game.player_ids_list,
+                server_id=channel.guild.id,
+            )
+            await channel.send(
+                "There was a bug with the ready-check message, all players have been dropped from queue\n"
+                "Please queue again to restart the process"
+            )
+
+            await queue_channel_handler.update_queue_channels(bot=self.bot, server_id=channel.guild.id)
 
-                # We restart the matchmaking logic
-                await self.run_matchmaking_logic(ctx)
+            return
+
+        if ready is True:
+            # We drop all 10 players from the queue
+            game_queue.validate_ready_check(ready_check_message.id)
+
+            # We commit the game to the database (without a winner)
+            with session_scope() as session:
+                session.expire_on_commit = False
+                game = session.merge(game)  # This gets us the game ID
+
+            queue_channel_handler.mark_queue_related_message(
+                await channel.send(embed=game.get_embed("GAME_ACCEPTED"),)
+            )
+
+        elif ready is False:
+            # We remove the player who cancelled
+            game_queue.cancel_ready_check(
+                ready_check_id=ready_check_message.id, ids_to_drop=players_to_drop, channel_id=channel.id,
+            )
+
+            await channel.send(
+                f"A player cancelled the game and was removed from the queue\n"
+                f"All other players have been put back in the queue",
+            )
+
+            # We restart the matchmaking logic
+            await self.run_matchmaking_logic(channel, after_cancelled_ready_check=True)
+
+        elif ready is None:
+            # We remove the timed out players from *all* channels (hence giving server id)
+            game_queue.cancel_ready_check(
+                ready_check_id=ready_check_message.id,
+                ids_to_drop=players_to_drop,
+                server_id=channel.guild.id,
+            )
 
-        elif game and game.matchmaking_score >= 0.2:
-            # One side has over 70% predicted winrate, we do not start anything
-            await ctx.send(
-                f"The best match found had a side with a {(.5 + game.matchmaking_score)*100:.1f}%"
-                f" predicted winrate and was not started"
+            await channel.send(
+                "The check timed out and players who did not answer have been dropped from all queues",
             )
 
+            # We restart the matchmaking logic
+            await self.run_matchmaking_logic(channel, after_cancelled_ready_check=True)
+
     @commands.command(aliases=["view_queue", "refresh"])
     @queue_channel_only()
     async def view(
@@ -175,15 +269,7 @@ class QueueCog(commands.Cog, name="Queue"):
             !queue adc
             !queue adc @CoreJJ support
         """
-        # Checking if the last game of this player got cancelled
-        #   If so, we put them in the queue in front of other players
-        jump_ahead = False
-
-        # pop with two arguments returns the second one if the key was not found
-        if cancel_timestamp := self.players_whose_last_game_got_cancelled.pop(ctx.author.id, None):
-
-            if datetime.now() - cancel_timestamp < timedelta(hours=1):
-                jump_ahead = True
+        jump_ahead = self.get_jump_ahead(ctx.author.id)
 
         if not duo:
 
@@ -232,10 +318,74 @@ class QueueCog(commands.Cog, name="Queue"):
                 jump_ahead=jump_ahead,
             )
 
-        await self.run_matchmaking_logic(ctx=ctx)
+        # The matchmaking runs in the channel’s worker once the burst of queue changes is over
+        self.matchmaking_scheduler.mark_dirty(self.get_matchmaking_key(ctx.channel), ctx.channel)
 
         await queue_channel_handler.update_queue_channels(bot=self.bot, server_id=ctx.guild.id)
 
+    @commands.command()
+    @queue_channel_only()
+    async def flex(
+        self, ctx: commands.Context, *roles: RoleConverter(),
+    ):
+        """
+        Adds you to the current channel’s queue for multiple roles, from your favorite to your least liked
+
+        You will only get one of them, your favorite ones being picked first unless another role is needed
+            This replaces the roles you were queued for in the channel
+
+        Example:
+            !flex mid top
+            !flex jgl sup bot
+        """
+        if len(roles) < 2:
+            await ctx.send("You need to input at least two roles, or use !queue for a single one")
+            return
+
+        await self.queue_for_roles(ctx, list(dict.fromkeys(roles)))
+
+    @commands.command()
+    @queue_channel_only()
+    async def fill(
+        self, ctx: commands.Context, *roles: RoleConverter(),
+    ):
+        """
+        Adds you to the current channel’s queue for all roles, with the given ones as your favorites
+
+        Example:
+            !fill
+            !fill mid
+            !fill mid top
+        """
+        await self.queue_for_roles(ctx, list(dict.fromkeys(roles + tuple(roles_list))))
+
+    async def queue_for_roles(self, ctx: commands.Context, roles: List[str]):
+        """
+        Queues the author for the ranked roles and schedules the matchmaking
+        """
+        game_queue.add_flex_player(
+            player_id=ctx.author.id,
+            name=ctx.author.display_name,
+            roles=roles,
+            channel_id=ctx.channel.id,
+            server_id=ctx.guild.id,
+            jump_ahead=self.get_jump_ahead(ctx.author.id),
+        )
+
+        self.matchmaking_scheduler.mark_dirty(self.get_matchmaking_key(ctx.channel), ctx.channel)
+
+        await queue_channel_handler.update_queue_channels(bot=self.bot, server_id=ctx.guild.id)
+
+    def get_jump_ahead(self, player_id: int) -> bool:
+        """
+        Checks if the last game of this player got cancelled, in which case they jump ahead in queue
+        """
+        # pop with two arguments returns the second one if the key was not found
+        if cancel_timestamp := self.players_whose_last_game_got_cancelled.pop(player_id, None):
+            return datetime.now() - cancel_timestamp < timedelta(hours=1)
+
+        return False
+
     @commands.command(aliases=["leave_queue", "stop"])
     @queue_channel_only()
     async def leave(
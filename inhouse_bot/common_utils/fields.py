@@ -1,3 +1,5 @@
+from typing import Optional
+
 from discord.ext import commands
 from discord.ext.commands import ConversionError
 from sqlalchemy import Enum
@@ -26,19 +28,28 @@ full_roles_dict = {
 }
 
 
+def match_role(argument: str) -> Optional[str]:
+    """
+    Returns the clean role matching the input string, or None if it was not understood
+    """
+    matched_string, ratio = rapidfuzz.process.extractOne(argument, full_roles_dict.keys())
+
+    return full_roles_dict[matched_string] if ratio >= 85 else None
+
+
 class RoleConverter(commands.Converter):
     async def convert(self, ctx, argument):
         """
         Converts an input string to a clean role
         """
-        matched_string, ratio = rapidfuzz.process.extractOne(argument, full_roles_dict.keys())
+        role = match_role(argument)
 
-        if ratio < 85:
+        if not role:
             await ctx.send(f"The role was not understood")
             raise ConversionError
 
         else:
-            return full_roles_dict[matched_string]
+            return role
 
 
 class ChampionNameConverter(commands.Converter):
@@ -1,4 +1,4 @@
-from typing import Tuple, Optional
+from typing import Iterable, Optional, Set, Tuple
 
 from inhouse_bot.database_orm import Game, GameParticipant
 
@@ -17,3 +17,25 @@ def get_last_game(
         None,
         None,
     )  # To not have unpacking errors
+
+
+def get_last_games_query(player_ids: Iterable[int], server_id: int, session):
+    """
+    Query of the player_id and winner of the last game of each player on the server
+    """
+    return (
+        session.query(GameParticipant.player_id, Game.winner)
+        .select_from(Game)
+        .join(GameParticipant)
+        .filter(Game.server_id == server_id)
+        .filter(GameParticipant.player_id.in_(list(player_ids)))
+        .order_by(GameParticipant.player_id, Game.start.desc())
+        .distinct(GameParticipant.player_id)
+    )
+
+
+def get_players_in_game(player_ids: Iterable[int], server_id: int, session) -> Set[int]:
+    """
+    Returns the players whose last game on the server has no winner yet, with a single query
+    """
+    return {row.player_id for row in get_last_games_query(player_ids, server_id, session) if not row.winner}
@@ -1,19 +1,26 @@
-import os
-import sqlalchemy
+from sqlalchemy.engine import Engine
 
-from inhouse_bot.database_orm import bot_declarative_base
 
-
-def migrate():
+def migrate(engine: Engine):
     # TODO This should be removed in favor of a true database migration tool like Alembic
-
-    # We create the engine to connect to the database
-    engine = sqlalchemy.create_engine(os.environ["INHOUSE_BOT_CONNECTION_STRING"])
-
-    # We create all the tables and columns as required by the classes in the other parts of the program
-    bot_declarative_base.metadata.create_all(bind=engine)
+    #   It runs when the first session is created, so importing the bot does not need a database
 
     # Checking the duo_id column in QueuePlayer, added on December 10 2020
     duo_column_query = """ALTER TABLE queue_player ADD COLUMN IF NOT EXISTS duo_id BIGINT"""
 
     engine.execute(duo_column_query)
+
+    # Checking the role_rank column in QueuePlayer, added for flex queuing
+    role_rank_column_query = """ALTER TABLE queue_player ADD COLUMN IF NOT EXISTS role_rank INTEGER"""
+
+    engine.execute(role_rank_column_query)
+
+    # Checking the jump_ahead column in QueuePlayer, added for queue expiry
+    jump_ahead_column_query = """ALTER TABLE queue_player ADD COLUMN IF NOT EXISTS jump_ahead BOOLEAN"""
+
+    engine.execute(jump_ahead_column_query)
+
+    # Checking the queue_ttl column in ChannelInformation, added for queue expiry
+    queue_ttl_column_query = """ALTER TABLE channel_information ADD COLUMN IF NOT EXISTS queue_ttl INTEGER"""
+
+    engine.execute(queue_ttl_column_query)
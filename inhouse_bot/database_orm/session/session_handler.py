@@ -15,7 +15,6 @@ class GhostSessionMaker:
 
     _session_maker = None
 
-
     @property
     def session_maker(self):
         if not self._session_maker:
@@ -31,6 +30,11 @@ class GhostSessionMaker:
         # We create all the tables and columns as required by the classes in the other parts of the program
         bot_declarative_base.metadata.create_all(bind=engine)
 
+        # Columns added after the tables were first created are not handled by create_all
+        from inhouse_bot.database_orm import mini_migration_tool
+
+        mini_migration_tool.migrate(engine)
+
         # This is the SessionMaker we use to create session to interact with the database
         self._session_maker = sqlalchemy.orm.sessionmaker(bind=engine)
 
@@ -54,5 +58,5 @@ def session_scope():
     finally:
         session.close()
 
-##
 
+##
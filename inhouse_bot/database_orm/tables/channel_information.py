@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, BigInteger
+from sqlalchemy import Column, String, BigInteger, Integer
 
 from inhouse_bot.database_orm import bot_declarative_base
 
@@ -17,5 +17,8 @@ class ChannelInformation(bot_declarative_base):
     # Current accepted values are "QUEUE" and "RANKING", but leaving it as a string for ease of updating
     channel_type = Column(String)
 
+    # Minutes after which idle players are removed from the queue, None to use the bot’s default
+    queue_ttl = Column(Integer)
+
     def __repr__(self):
         return f"<ChannelInformation: {self.id=} | {self.server_id=}>"
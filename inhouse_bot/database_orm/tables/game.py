@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Tuple, Dict, List, Optional
+from typing import Tuple, Dict, List, Optional, TYPE_CHECKING
 import datetime
 
 from discord import Embed
@@ -10,11 +10,14 @@ from sqlalchemy.orm import relationship
 from sqlalchemy.orm.collections import mapped_collection
 
 from inhouse_bot.database_orm import bot_declarative_base
-from inhouse_bot.database_orm.tables.player import Player
 
 from inhouse_bot.common_utils.fields import roles_list, side_enum
 from inhouse_bot.common_utils.emoji_and_thumbnails import get_role_emoji, get_champion_emoji
 
+# The snapshot module imports the ORM, so we only import it for type hints
+if TYPE_CHECKING:
+    from inhouse_bot.game_queue import QueuePlayerSnapshot
+
 
 class Game(bot_declarative_base):
     """
@@ -120,16 +123,16 @@ class Game(bot_declarative_base):
 
         return embed
 
-    def __init__(self, players: Dict[Tuple[str, str], Player]):
+    def __init__(self, players: Dict[Tuple[str, str], "QueuePlayerSnapshot"]):
         """
         Creates a Game object and its GameParticipant children.
 
         Args:
-            players: [team, role] -> Player dictionary
+            players: [team, role] -> QueuePlayerSnapshot dictionary, with the rating of the player in the role
         """
         # We use local imports to not have circular imports
         from inhouse_bot.database_orm import GameParticipant
-        from inhouse_bot.matchmaking_logic import evaluate_game
+        from inhouse_bot.matchmaking_logic.evaluate_game import evaluate_teams
 
         self.start = datetime.datetime.now()
 
@@ -141,4 +144,8 @@ class Game(bot_declarative_base):
         self.server_id = list(self.participants.values())[0].player_server_id
 
         # Then, we compute the expected blue side winrate (which we use for matchmaking)
-        self.blue_expected_winrate = evaluate_game(self)
+        #   Participants are passed directly, as building self.teams would create a new dataclass
+        self.blue_expected_winrate = evaluate_teams(
+            [self.participants["BLUE", role] for role in roles_list],
+            [self.participants["RED", role] for role in roles_list],
+        )
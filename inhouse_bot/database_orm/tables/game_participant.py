@@ -1,3 +1,5 @@
+from typing import TYPE_CHECKING
+
 from sqlalchemy import Column, Integer, ForeignKey, Float, ForeignKeyConstraint, BigInteger, String
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship
@@ -7,6 +9,10 @@ from inhouse_bot.database_orm.tables.player_rating import PlayerRating
 from inhouse_bot.database_orm.tables.player import Player
 from inhouse_bot.common_utils.fields import side_enum, role_enum, foreignkey_cascade_options
 
+# The snapshot module imports the ORM, so we only import it for type hints
+if TYPE_CHECKING:
+    from inhouse_bot.game_queue import QueuePlayerSnapshot
+
 
 class GameParticipant(bot_declarative_base):
     """Represents a participant in an inhouse game"""
@@ -60,13 +66,13 @@ class GameParticipant(bot_declarative_base):
         return self.name[:15]
 
     # Called only from the Game constructor itself
-    def __init__(self, side: str, role: str, player: Player):
+    def __init__(self, side: str, role: str, queue_player: "QueuePlayerSnapshot"):
         self.side = side
         self.role = role
 
-        self.player_id = player.id
-        self.name = player.name
-        self.player_server_id = player.server_id
+        self.player_id = queue_player.player_id
+        self.name = queue_player.name
+        self.player_server_id = queue_player.server_id
 
-        self.trueskill_mu = player.ratings[role].trueskill_mu
-        self.trueskill_sigma = player.ratings[role].trueskill_sigma
+        self.trueskill_mu = queue_player.trueskill_mu
+        self.trueskill_sigma = queue_player.trueskill_sigma
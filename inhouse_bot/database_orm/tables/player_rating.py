@@ -11,6 +11,10 @@ class PlayerRating(bot_declarative_base):
 
     __tablename__ = "player_rating"
 
+    # TrueSkill default base values, for players who never played the role
+    default_trueskill_mu = 25
+    default_trueskill_sigma = 25 / 3
+
     # Just like Player
     player_id = Column(BigInteger, primary_key=True)
     player_server_id = Column(BigInteger, primary_key=True)
@@ -44,5 +48,5 @@ class PlayerRating(bot_declarative_base):
         self.role = role
 
         # Initializing TrueSkill to default base values
-        self.trueskill_mu = 25
-        self.trueskill_sigma = 25 / 3
+        self.trueskill_mu = self.default_trueskill_mu
+        self.trueskill_sigma = self.default_trueskill_sigma
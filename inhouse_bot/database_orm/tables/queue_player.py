@@ -1,7 +1,7 @@
 from sqlalchemy.orm import relationship, foreign
 
 from inhouse_bot.database_orm import bot_declarative_base
-from sqlalchemy import Column, BigInteger, ForeignKeyConstraint, DateTime, ForeignKey
+from sqlalchemy import Column, BigInteger, Boolean, ForeignKeyConstraint, DateTime, ForeignKey, Integer
 
 from inhouse_bot.database_orm import Player
 from inhouse_bot.common_utils.fields import role_enum, foreignkey_cascade_options
@@ -41,9 +41,16 @@ class QueuePlayer(bot_declarative_base):
         uselist=False,
     )
 
+    # Preference order of the player’s roles when queuing for several ones, 0 being the favorite
+    #   None when the player queued for roles one by one, which are all as good for him
+    role_rank = Column(Integer)
+
     # Queue start time to favor players who have been in queue longer
     queue_time = Column(DateTime)
 
+    # True when the player was put ahead in queue, which moves his queue_time back by a day
+    jump_ahead = Column(Boolean)
+
     # None if not in a ready_check, ID of the ready check message otherwise
     ready_check_id = Column(BigInteger)
 
@@ -1,8 +1,14 @@
 from inhouse_bot.game_queue.game_queue import GameQueue
+from inhouse_bot.game_queue.queue_snapshot import QueuePlayerSnapshot, QueueSnapshot
+from inhouse_bot.game_queue.queue_store import queue_store
 from inhouse_bot.game_queue.queue_handler import (
     PlayerInReadyCheck,
     PlayerInGame,
+    PlayerInDuo,
+    QueueRequest,
+    add_queue_players,
     add_player,
+    add_flex_player,
     remove_player,
     remove_players,
     start_ready_check,
@@ -12,5 +18,7 @@ from inhouse_bot.game_queue.queue_handler import (
     get_active_queues,
     reset_queue,
     add_duo,
+    add_duos,
     remove_duo,
+    expire_queue_players,
 )
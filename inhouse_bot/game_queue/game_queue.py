@@ -1,121 +1,137 @@
 from collections import defaultdict
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 
-from sqlalchemy import func
-from sqlalchemy.orm import joinedload
+from sqlalchemy import and_, exists
+from sqlalchemy.orm import aliased
 
-from inhouse_bot.database_orm import QueuePlayer, PlayerRating, session_scope
-from inhouse_bot.common_utils.fields import roles_list
+from inhouse_bot.database_orm import QueuePlayer, session_scope
+from inhouse_bot.game_queue.queue_snapshot import QueuePlayerSnapshot, QueueSnapshot
+from inhouse_bot.game_queue.queue_store import (
+    queue_store,
+    get_queue_rows_query,
+    insert_default_ratings,
+    get_missing_ratings_keys,
+    get_row_snapshot,
+)
+
+
+def get_in_ready_check_clause():
+    """
+    Flags queue players who are in a ready check in any queue of their server
+    """
+    ready_check_queue_player = aliased(QueuePlayer)
+
+    return exists().where(
+        and_(
+            ready_check_queue_player.player_id == QueuePlayer.player_id,
+            ready_check_queue_player.player_server_id == QueuePlayer.player_server_id,
+            ready_check_queue_player.ready_check_id.isnot(None),
+        )
+    )
 
 
 class GameQueue:
     """
     Represents the current queue state in a given channel
+
+    Queue players are immutable snapshots, so the queue can be used anywhere once loaded
     """
 
-    queue_players: List[QueuePlayer]
+    channel_id: int
+    snapshot: QueueSnapshot
 
-    def __init__(self, channel_id: int):
-        with session_scope() as session:
-            # This allows use to keep using our objects after the session is closed
-            session.expire_on_commit = False
-
-            # TODO LOW PRIO Optimize the query (ideally, is_in_queue subquery hybrid property)
-            # First, we get all players in queue, which loads Player and PlayerRating objects as well
-            potential_queue_players = (
-                session.query(QueuePlayer)
-                .options(joinedload(QueuePlayer.duo))
-                .filter(QueuePlayer.channel_id == channel_id)
-                .order_by(QueuePlayer.queue_time.asc())
-                .all()
-            )
+    def __init__(
+        self,
+        channel_id: int,
+        from_database: bool = False,
+        queue_players: Optional[List[QueuePlayerSnapshot]] = None,
+    ):
+        self.channel_id = channel_id
 
-            # If we have no player in queue, we stop there
-            if not potential_queue_players:
-                self.server_id = None
-                self.queue_players = []
-                return
-
-            # Else, we have our server_id from the players themselves
-            self.server_id = potential_queue_players[0].player_server_id
-
-            # We make sure all our queue players have the right ratings
-            for queue_player in potential_queue_players:
-                try:
-                    assert queue_player.player.ratings[queue_player.role]
-                except KeyError:
-                    # If not, we create a new rating object
-                    queue_player.player.ratings[queue_player.role] = PlayerRating(
-                        queue_player.player, queue_player.role
-                    )
-                    session.commit()
-
-            # Afterwards, we get players currently in a ready check in any other queue in the server
-            queue_query = (
-                session.query(
-                    QueuePlayer.player_id, func.max(QueuePlayer.ready_check_id).label("is_in_ready_check"),
-                )
-                .filter(
-                    QueuePlayer.player_id.in_([p.player_id for p in potential_queue_players])
-                )  # We could remove that and run the query in parallel
-                .filter(QueuePlayer.player_server_id == self.server_id)
-                .group_by(QueuePlayer.player_id)
-            )
+        # Queue players can be given in queue order, for example after applying the changes of the queue
+        if queue_players is not None:
+            self.server_id = next((qp.server_id for qp in queue_players), None)
+
+        # Queues are read from memory when the queue store is enabled, without any database round trip
+        elif queue_store.enabled and not from_database:
+            self.server_id, queue_players = queue_store.get_queue(channel_id)
+        else:
+            self.server_id, queue_players = self.load_queue_players(channel_id)
+
+        queue_snapshot = QueueSnapshot(queue_players)
+
+        # The starting queue is made of the 2 players per role who have been in queue the longest
+        #   We also add any duos *required* for the game to fire
+        starting_queue = defaultdict(list)
+
+        for role, role_queue in queue_snapshot.roles.items():
+            for qp in role_queue:
 
-            player_ids_in_ready_check = [r.player_id for r in queue_query if r.is_in_ready_check is not None]
+                # If we already have 2 players in that role, we continue
+                if len(starting_queue[role]) >= 2:
+                    continue
 
-            # Finally, we can cleanup the queue_players variable with only the players truly in queue here
-            self.queue_players = [
-                qp for qp in potential_queue_players if qp.player_id not in player_ids_in_ready_check
-            ]
+                # Else we add our current player if he’s not there yet (could have been added by his duo)
+                if qp not in starting_queue[role]:
+                    starting_queue[role].append(qp)
 
-            # The starting queue is made of the 2 players per role who have been in queue the longest
-            #   We also add any duos *required* for the game to fire
-            starting_queue = defaultdict(list)
+                # If he has a duo, we add it if he’s not in queue for his role already
+                duo = queue_snapshot.get_duo(qp) if qp.duo_id is not None else None
 
-            for role in self.queue_players_dict:
-                for qp in self.queue_players_dict[role]:
+                if duo is not None:
+                    # If the role queue of the duo is already filled, we pop the youngest player
+                    if len(starting_queue[duo.role]) >= 2:
+                        starting_queue[duo.role].pop()
 
-                    # If we already have 2 players in that role, we continue
-                    if len(starting_queue[role]) >= 2:
-                        continue
+                    # We add the duo as part of the queue for his role *if he’s not yet in it*
+                    if duo not in starting_queue[duo.role]:
+                        starting_queue[duo.role].append(duo)
 
-                    # Else we add our current player if he’s not there yet (could have been added by his duo)
-                    # TODO LOW PRIO cleanup that ugly code
-                    if qp.player_id not in [qp.player_id for qp in starting_queue[role]]:
-                        starting_queue[role].append(qp)
+        # Afterwards we fill the rest of the queue with players in chronological order
+        age_sorted_queue_players = [qp for role_queue in starting_queue.values() for qp in role_queue]
 
-                    # If he has a duo, we add it if he’s not in queue for his role already
-                    if qp.duo_id is not None:
-                        duo_role = qp.duo.role
+        # This should always be the first game we try
+        assert len(age_sorted_queue_players) <= 10
 
-                        # If the role queue of the duo is already filled, we pop the youngest player
-                        if len(starting_queue[duo_role]) >= 2:
-                            starting_queue[duo_role].pop()
+        # Snapshots are hashed on their (player_id, role) key, like rows of the queue_player table
+        starting_queue_keys = {qp.key for qp in age_sorted_queue_players}
 
-                        # We add the duo as part of the queue for his role *if he’s not yet in it*
-                        # TODO LOW PRIO find a more readable syntax, all those list comprehensions are really bad
-                        if qp.duo_id not in [qp.player_id for qp in starting_queue[duo_role]]:
-                            starting_queue[duo_role].append(qp.duo)
+        age_sorted_queue_players += [qp for qp in queue_snapshot if qp.key not in starting_queue_keys]
 
-            # Afterwards we fill the rest of the queue with players in chronological order
+        self.queue_players = age_sorted_queue_players
 
-            age_sorted_queue_players = sum(
-                list(starting_queue.values()), []
-            )  # Flattening the QueuePlayer objects to a single list
+    @staticmethod
+    def load_queue_players(channel_id: int) -> Tuple[Optional[int], List[QueuePlayerSnapshot]]:
+        """
+        Returns the server id of the queue and its players by queue time, read from the queue_player table
+        """
+        with session_scope() as session:
+            # A single statement returns the queue rows with the players’ names and ratings for their roles
+            #   It also flags players in a ready check in any channel of the server, who are not in queue
+            rows = (
+                get_queue_rows_query(session)
+                .add_columns(get_in_ready_check_clause().label("is_in_ready_check"))
+                .filter(QueuePlayer.channel_id == channel_id)
+                .order_by(QueuePlayer.queue_time.asc(), QueuePlayer.player_id, QueuePlayer.role)
+                .all()
+            )
 
-            # This should always be the first game we try
-            assert len(age_sorted_queue_players) <= 10
+            insert_default_ratings(session, get_missing_ratings_keys(rows))
 
-            # We create a (role, id) list to see who is already in queue more easily
-            #   Simple equality does not work because the qp.duo objects are != from the solo qp objects
-            age_sorted_queue_players_ids = [(qp.player_id, qp.role) for qp in age_sorted_queue_players]
+        # If we have no player in queue, we stop there, else we have our server_id from the players themselves
+        server_id = rows[0].player_server_id if rows else None
 
-            age_sorted_queue_players += [
-                qp for qp in self.queue_players if (qp.player_id, qp.role) not in age_sorted_queue_players_ids
-            ]
+        # We only keep the players truly in queue here
+        return server_id, [get_row_snapshot(row) for row in rows if not row.is_in_ready_check]
+
+    @property
+    def queue_players(self) -> Tuple[QueuePlayerSnapshot, ...]:
+        return self.snapshot.queue_players
 
-            self.queue_players = age_sorted_queue_players
+    @queue_players.setter
+    def queue_players(self, queue_players: Iterable[QueuePlayerSnapshot]):
+        # The indexes are computed once for every new list of queue players
+        self.snapshot = QueueSnapshot(queue_players)
 
     def __len__(self):
         return len(self.queue_players)
@@ -124,43 +140,35 @@ class GameQueue:
         if type(other) != GameQueue:
             return False
 
-        simple_queue = [(qp.player_id, qp.role) for qp in self.queue_players]
-        simple_other_queue = [(qp.player_id, qp.role) for qp in other.queue_players]
-
-        return simple_queue == simple_other_queue
+        return self.snapshot == other.snapshot
 
     def __str__(self):
         rows = []
 
-        for role in roles_list:
-            rows.append(
-                f"{role}\t" + " ".join(qp.player.name for qp in self.queue_players if qp.role == role)
-            )
+        for role, role_queue in self.queue_players_dict.items():
+            rows.append(f"{role}\t" + " ".join(qp.name for qp in role_queue))
 
         duos_strings = []
         for duo in self.duos:
-            duos_strings.append(" + ".join(f"{qp.player.name} {qp.role}" for qp in duo))
+            duos_strings.append(" + ".join(f"{qp.name} {qp.role}" for qp in duo))
 
         rows.append(f"DUO\t{', '.join(duos_strings)}")
 
         return "\n".join(rows)
 
+    def get_snapshot(self) -> List[QueuePlayerSnapshot]:
+        """
+        Returns the queue players as a list the matchmaking can extend, in the same order
+        """
+        return list(self.queue_players)
+
     @property
-    def queue_players_dict(self) -> Dict[str, List[QueuePlayer]]:
+    def queue_players_dict(self) -> Dict[str, Tuple[QueuePlayerSnapshot, ...]]:
         """
         This dictionary will always have all roles included
         """
-        return {role: [player for player in self.queue_players if player.role == role] for role in roles_list}
+        return self.snapshot.roles
 
     @property
-    def duos(self) -> List[Tuple[QueuePlayer, QueuePlayer]]:
-        duos = []
-
-        # TODO This should be an sqlalchemy hybrid property and a single list comprehension
-        for qp in self.queue_players:
-            if (qp.duo is not None) and (
-                qp.duo_id > qp.player_id
-            ):  # Using this inequality to make sure we only have each duo once
-                duos.append((qp, qp.duo))
-
-        return duos
+    def duos(self) -> Tuple[Tuple[QueuePlayerSnapshot, QueuePlayerSnapshot], ...]:
+        return self.snapshot.duos
@@ -0,0 +1,130 @@
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+from inhouse_bot.game_queue.queue_snapshot import QueuePlayerSnapshot
+
+# What happened to the player in the queue of the channel
+#   "role_change" is a re-queue with other roles, ranks or queue time, and "duo_link" also covers unlinks
+queue_change_kinds = ("added", "removed", "role_change", "duo_link", "ready_check_start", "ready_check_end")
+
+
+@dataclass(frozen=True)
+class QueueChange:
+    """
+    A change of the queue of a channel, with the rows of the player it removed and the ones it added
+
+    Rows only count when the player is in queue, so starting a ready check removes them
+    """
+
+    version: int
+    kind: str
+    player_id: int
+    added: Tuple[QueuePlayerSnapshot, ...] = ()
+    removed: Tuple[QueuePlayerSnapshot, ...] = ()
+
+
+def get_change_kind(
+    previous_rows: Tuple[QueuePlayerSnapshot, ...], rows: Tuple[QueuePlayerSnapshot, ...]
+) -> str:
+    if not previous_rows:
+        return "added"
+
+    if not rows:
+        return "removed"
+
+    if {qp.duo_id for qp in previous_rows} != {qp.duo_id for qp in rows}:
+        return "duo_link"
+
+    return "role_change"
+
+
+def apply_queue_changes(
+    queue_players: Iterable[QueuePlayerSnapshot], changes: Iterable[QueueChange]
+) -> List[QueuePlayerSnapshot]:
+    """
+    Returns the queue players after the changes, which must directly follow the version they come from
+    """
+    queue_players = {qp.key: qp for qp in queue_players}
+
+    for change in changes:
+        for qp in change.removed:
+            queue_players.pop(qp.key, None)
+
+        for qp in change.added:
+            queue_players[qp.key] = qp
+
+    return list(queue_players.values())
+
+
+class QueueFeed:
+    """
+    The version of the queue of each channel, moved by every change, with the last changes of each channel
+
+    Readers who know the changes since their version do not have to read the whole queue again
+    """
+
+    def __init__(self, history_size: int = 200):
+        self.history_size = history_size
+
+        self.versions: Dict[int, int] = {}
+        self._changes: Dict[int, Deque[QueueChange]] = {}
+
+    def get_version(self, channel_id: int) -> int:
+        return self.versions.get(channel_id, 0)
+
+    def publish(
+        self,
+        channel_id: int,
+        player_id: int,
+        previous_rows: Tuple[QueuePlayerSnapshot, ...],
+        rows: Tuple[QueuePlayerSnapshot, ...],
+        kind: Optional[str] = None,
+    ) -> Optional[QueueChange]:
+        """
+        Publishes the change of the rows of the player in queue, if there is one
+
+        The kind of the change is deduced from the rows if it is not given
+        """
+        added = tuple(qp for qp in rows if qp not in previous_rows)
+        removed = tuple(qp for qp in previous_rows if qp not in rows)
+
+        if not added and not removed:
+            return None
+
+        version = self.get_version(channel_id) + 1
+
+        change = QueueChange(
+            version=version,
+            kind=kind or get_change_kind(previous_rows, rows),
+            player_id=player_id,
+            added=added,
+            removed=removed,
+        )
+
+        self.versions[channel_id] = version
+        self._changes.setdefault(channel_id, deque(maxlen=self.history_size)).append(change)
+
+        return change
+
+    def get_changes(self, channel_id: int, since_version: int) -> Optional[List[QueueChange]]:
+        """
+        Returns the changes of the channel after the version, or None if some of them are not kept anymore
+        """
+        changes = [change for change in self._changes.get(channel_id, ()) if change.version > since_version]
+
+        if len(changes) != self.get_version(channel_id) - since_version:
+            return None
+
+        return changes
+
+    def invalidate(self, channel_ids: Iterable[int] = ()):
+        """
+        Moves the channels to a new version without any change, which makes readers read their queues again
+
+        All channels that already have a version are moved, on top of the given ones
+        """
+        for channel_id in set(self.versions) | set(channel_ids):
+            self.versions[channel_id] = self.get_version(channel_id) + 1
+
+        self._changes.clear()
@@ -1,13 +1,21 @@
+import dataclasses
 from datetime import datetime, timedelta
-from typing import List, Optional, Set
+from typing import Dict, List, Optional, Set, Tuple
 
 import sqlalchemy
 from discord.ext import commands
+from sqlalchemy.dialects.postgresql import insert
 
 from inhouse_bot.common_utils.fields import roles_list
 
-from inhouse_bot.database_orm import session_scope, QueuePlayer, Player
-from inhouse_bot.common_utils.get_last_game import get_last_game
+from inhouse_bot.database_orm import session_scope, QueuePlayer, Player, PlayerRating
+from inhouse_bot.common_utils.get_last_game import get_last_games_query, get_players_in_game
+from inhouse_bot.game_queue.queue_snapshot import QueuePlayerSnapshot
+from inhouse_bot.game_queue.queue_store import queue_store, insert_default_ratings
+
+
+# Players who jump ahead are queued as if they came a day earlier
+jump_ahead_delta = timedelta(hours=24)
 
 
 class PlayerInReadyCheck(Exception):
@@ -18,17 +26,81 @@ class SameRolesForDuo(commands.CheckFailure):
     ...
 
 
-def is_in_ready_check(player_id, session) -> bool:
-    return (
-        True
-        if (
-            session.query(QueuePlayer)
+class PlayerInDuo(Exception):
+    ...
+
+
+# Queue operations update the queue store first when it is enabled, then write the change to the database
+#   with queue_store.write(), which runs their _in_database function in the background or right away
+
+
+def is_in_ready_check(player_id: int, server_id: Optional[int] = None) -> bool:
+    """
+    Checks if the player is in a ready check on the server, or on any server if no server id is given
+
+    The ready check registry answers from memory, only the database fallback mode reads the queue_player table
+    """
+    if queue_store.enabled:
+        return queue_store.is_in_ready_check(player_id, server_id)
+
+    with session_scope() as session:
+        return bool(get_players_in_ready_check({player_id}, server_id, session))
+
+
+def is_in_duo(player_id: int, channel_id: int) -> bool:
+    """
+    Checks if the player is queued with a duo partner in the channel
+    """
+    if queue_store.enabled:
+        return any(qp.duo_id is not None for _, qp in queue_store.get_player_rows(player_id, channel_id))
+
+    with session_scope() as session:
+        return bool(
+            session.query(QueuePlayer.player_id)
+            .filter(QueuePlayer.channel_id == channel_id)
             .filter(QueuePlayer.player_id == player_id)
-            .filter(QueuePlayer.ready_check_id != None)
-        ).first()  # Can’t use one or none here as a player could have been queuing for multiple roles
-        else False
+            .filter(QueuePlayer.duo_id != None)
+            .first()
+        )
+
+
+def get_players_in_ready_check(player_ids: Set[int], server_id: Optional[int], session) -> Set[int]:
+    if queue_store.enabled:
+        return {player_id for player_id in player_ids if queue_store.is_in_ready_check(player_id, server_id)}
+
+    return {row.player_id for row in get_ready_check_rows_query(player_ids, server_id, session)}
+
+
+def get_ready_check_rows_query(player_ids: Set[int], server_id: Optional[int], session):
+    query = (
+        session.query(QueuePlayer.player_id)
+        .filter(QueuePlayer.player_id.in_(player_ids))
+        .filter(QueuePlayer.ready_check_id != None)
     )
 
+    if server_id is not None:
+        query = query.filter(QueuePlayer.player_server_id == server_id)
+
+    return query
+
+
+def check_players_can_queue(player_ids: Set[int], server_id: Optional[int], session):
+    """
+    Raises PlayerInGame or PlayerInReadyCheck if one of the players cannot queue, with a single query
+    """
+    last_games = get_last_games_query(player_ids, server_id, session).subquery()
+
+    in_game, in_ready_check = session.query(
+        session.query(last_games).filter(last_games.c.winner == None).exists(),
+        get_ready_check_rows_query(player_ids, server_id, session).exists(),
+    ).one()
+
+    if in_game:
+        raise PlayerInGame
+
+    if in_ready_check:
+        raise PlayerInReadyCheck
+
 
 def reset_queue(channel_id: Optional[int] = None):
     """
@@ -38,6 +110,13 @@ def reset_queue(channel_id: Optional[int] = None):
     Args:
         channel_id: channel id of the queue to cancel
     """
+    if queue_store.enabled:
+        queue_store.reset(channel_id)
+
+    queue_store.write(_reset_queue_in_database, channel_id)
+
+
+def _reset_queue_in_database(channel_id: Optional[int]):
     with session_scope() as session:
         query = session.query(QueuePlayer)
 
@@ -47,71 +126,156 @@ def reset_queue(channel_id: Optional[int] = None):
         query.delete(synchronize_session=False)
 
 
-def add_player(
-    player_id: int, role: str, channel_id: int, server_id: int = None, name: str = None, jump_ahead=False
+@dataclasses.dataclass(frozen=True)
+class QueueRequest:
+    """
+    A role a player queues for, with its rank for flex players and his duo partner if any
+    """
+
+    player_id: int
+    role: str
+    name: Optional[str] = None
+    role_rank: Optional[int] = None
+    duo_id: Optional[int] = None
+
+
+def add_queue_players(
+    queue_requests: List[QueueRequest],
+    channel_id: int,
+    server_id: int = None,
+    jump_ahead=False,
+    replace=False,
 ):
+    """
+    Adds the queue requests to the channel in a single transaction, after checking all players at once
+
+    When the queue store is enabled, the queue in memory is checked and updated, and the transaction runs in
+        the background
+
+    If replace is True, the roles and duos the players had in the channel are dropped first
+    """
     # Just in case
-    assert role in roles_list
+    assert all(request.role in roles_list for request in queue_requests)
+
+    player_ids = {request.player_id for request in queue_requests}
+    queue_time = datetime.now() if not jump_ahead else datetime.now() - jump_ahead_delta
+
+    queue_rows = [
+        {
+            "channel_id": channel_id,
+            "player_id": request.player_id,
+            "player_server_id": server_id,
+            "role": request.role,
+            "duo_id": request.duo_id,
+            "role_rank": request.role_rank,
+            "queue_time": queue_time,
+            "jump_ahead": jump_ahead,
+        }
+        for request in queue_requests
+    ]
+
+    # This is where we add new Players to the server
+    #   This is also useful to automatically update name changes
+    players_rows = [
+        {"id": request.player_id, "server_id": server_id, "name": request.name}
+        for request in {request.player_id: request for request in queue_requests}.values()
+    ]
+
+    if not queue_store.enabled:
+        with session_scope() as session:
+            # Games and ready checks are checked in the same transaction as the writes
+            check_players_can_queue(player_ids, server_id, session)
+
+            _write_players(players_rows, session)
+
+            # Finally, we actually add the players to the queue in the same transaction
+            _write_queue_rows(queue_rows, replace, session)
+
+        return
+
+    # Ready checks are checked in memory, but games are not kept there so they are read from the database
+    if any(queue_store.is_in_ready_check(player_id, server_id) for player_id in player_ids):
+        raise PlayerInReadyCheck
 
     with session_scope() as session:
+        if get_players_in_game(player_ids, server_id, session):
+            raise PlayerInGame
 
-        game, participant = get_last_game(player_id, server_id, session)
+        # The queue in memory needs the players’ ratings for their roles
+        ratings = get_ratings(player_ids, server_id, session)
 
-        if game and not game.winner:
-            raise PlayerInGame
+    queue_players = []
 
-        # Then check if the player is in a ready-check
-        if is_in_ready_check(player_id, session):
-            raise PlayerInReadyCheck
-
-        # This is where we add new Players to the server
-        #   This is also useful to automatically update name changes
-        session.merge(Player(id=player_id, server_id=server_id, name=name))
-
-        # Finally, we actually add the player to the queue
-        queue_player = QueuePlayer(
-            channel_id=channel_id,
-            player_id=player_id,
-            player_server_id=server_id,
-            role=role,
-            queue_time=datetime.now() if not jump_ahead else datetime.now() - timedelta(hours=24),
+    for request in queue_requests:
+        trueskill_mu, trueskill_sigma = ratings.get(
+            (request.player_id, request.role),
+            (PlayerRating.default_trueskill_mu, PlayerRating.default_trueskill_sigma),
         )
 
-        # We merge for simplicity (allows players to re-queue for the same role)
-        session.merge(queue_player)
+        queue_players.append(
+            QueuePlayerSnapshot(
+                player_id=request.player_id,
+                role=request.role,
+                duo_id=request.duo_id,
+                trueskill_mu=trueskill_mu,
+                trueskill_sigma=trueskill_sigma,
+                role_rank=request.role_rank,
+                name=request.name,
+                server_id=server_id,
+                queue_time=queue_time,
+                jump_ahead=jump_ahead,
+            )
+        )
 
+    missing_ratings_keys = {
+        (request.player_id, server_id, request.role)
+        for request in queue_requests
+        if (request.player_id, request.role) not in ratings
+    }
 
-def remove_player(player_id: int, channel_id: int = None):
-    """
-    Removes the player from the queue in all roles in the channel
+    queue_store.add(channel_id, queue_players, replace=replace)
 
-    If no channel id is given, drop him from *all* queues, cross-server
+    queue_store.write(_add_queue_players_in_database, players_rows, missing_ratings_keys, queue_rows, replace)
+
+
+def get_ratings(player_ids: Set[int], server_id: int, session) -> Dict[Tuple[int, str], Tuple[float, float]]:
+    """
+    Returns (player_id, role) -> (trueskill_mu, trueskill_sigma) for the roles the players already played
     """
+    return {
+        (row.player_id, row.role): (row.trueskill_mu, row.trueskill_sigma)
+        for row in session.query(
+            PlayerRating.player_id, PlayerRating.role, PlayerRating.trueskill_mu, PlayerRating.trueskill_sigma
+        )
+        .filter(PlayerRating.player_server_id == server_id)
+        .filter(PlayerRating.player_id.in_(player_ids))
+    }
+
+
+def _add_queue_players_in_database(
+    players_rows: List[dict], ratings_keys: Set[Tuple[int, int, str]], queue_rows: List[dict], replace: bool
+):
     with session_scope() as session:
-        # First, check if he’s in a ready-check.
-        if (
-            is_in_ready_check(player_id, session) and channel_id
-        ):  # If we have no channel ID, it’s an !admin reset and we bypass the issue here
-            raise PlayerInReadyCheck
+        _write_players(players_rows, session)
+        insert_default_ratings(session, ratings_keys)
+        _write_queue_rows(queue_rows, replace, session)
 
-        # We select the player’s rows
-        query_player = session.query(QueuePlayer).filter(QueuePlayer.player_id == player_id)
-        query_duos = session.query(QueuePlayer).filter(QueuePlayer.duo_id == player_id)
 
-        # If given a channel ID (when the user calls !leave), we filter
-        if channel_id:
-            query_player = query_player.filter(QueuePlayer.channel_id == channel_id)
-            query_duos = query_duos.filter(QueuePlayer.channel_id == channel_id)
+def _write_players(players_rows: List[dict], session):
+    players_statement = insert(Player.__table__).values(players_rows)
 
-        query_player.delete(synchronize_session=False)
-        query_duos.update({"duo_id": None}, synchronize_session=False)
+    session.execute(
+        players_statement.on_conflict_do_update(
+            index_elements=["id", "server_id"], set_={"name": players_statement.excluded.name}
+        )
+    )
 
 
-def remove_players(player_ids: Set[int], channel_id: int):
-    """
-    Removes all players from the queue in all roles in the channel, without any checks
-    """
-    with session_scope() as session:
+def _write_queue_rows(queue_rows: List[dict], replace: bool, session):
+    channel_id = queue_rows[0]["channel_id"]
+    player_ids = {row["player_id"] for row in queue_rows}
+
+    if replace:
         (
             session.query(QueuePlayer)
             .filter(QueuePlayer.channel_id == channel_id)
@@ -119,11 +283,125 @@ def remove_players(player_ids: Set[int], channel_id: int):
             .delete(synchronize_session=False)
         )
 
+        (
+            session.query(QueuePlayer)
+            .filter(QueuePlayer.channel_id == channel_id)
+            .filter(QueuePlayer.duo_id.in_(player_ids))
+            .update({"duo_id": None}, synchronize_session=False)
+        )
+
+    queue_statement = insert(QueuePlayer.__table__).values(queue_rows)
+
+    # Re-queuing for the same role updates the row, which keeps its duo and ready check
+    session.execute(
+        queue_statement.on_conflict_do_update(
+            index_elements=["channel_id", "role", "player_id"],
+            set_={
+                column: queue_statement.excluded[column]
+                for column in ("player_server_id", "role_rank", "queue_time", "jump_ahead")
+            },
+        )
+    )
+
+
+def add_player(
+    player_id: int,
+    role: str,
+    channel_id: int,
+    server_id: int = None,
+    name: str = None,
+    jump_ahead=False,
+    role_rank: int = None,
+):
+    add_queue_players(
+        [QueueRequest(player_id, role, name, role_rank)],
+        channel_id,
+        server_id=server_id,
+        jump_ahead=jump_ahead,
+    )
+
+
+def add_flex_player(
+    player_id: int,
+    roles: List[str],
+    channel_id: int,
+    server_id: int = None,
+    name: str = None,
+    jump_ahead=False,
+):
+    """
+    Queues the player for all the given roles, ordered from his favorite to his least favorite one
+
+    This replaces the roles he was queued for in the channel, and matchmaking gives him only one of them
+        Duo partners cannot flex queue, as it would drop their duo
+    """
+    # Just in case, as ranks are given by the order of the roles
+    assert len(set(roles)) == len(roles)
+
+    if is_in_duo(player_id, channel_id):
+        raise PlayerInDuo
+
+    add_queue_players(
+        [QueueRequest(player_id, role, name, role_rank) for role_rank, role in enumerate(roles)],
+        channel_id,
+        server_id=server_id,
+        jump_ahead=jump_ahead,
+        replace=True,
+    )
+
+
+def remove_player(player_id: int, channel_id: int = None):
+    """
+    Removes the player from the queue in all roles in the channel
+
+    If no channel id is given, drop him from *all* queues, cross-server
+    """
+    # First, check if he’s in a ready-check
+    #   If we have no channel ID, it’s an !admin reset and we bypass the issue here
+    if channel_id and is_in_ready_check(player_id):
+        raise PlayerInReadyCheck
+
+    remove_players({player_id}, channel_id=channel_id or None)
+
+
+def remove_players(player_ids: Set[int], channel_id: int = None):
+    """
+    Removes the players from the queue in all roles in the channel, without any checks
+
+    If no channel id is given, drops them from *all* queues, cross-server
+    """
+    if queue_store.enabled:
+        queue_store.remove(set(player_ids), channel_id=channel_id)
+
+    queue_store.write(_remove_players_in_database, set(player_ids), channel_id)
+
+
+def _remove_players_in_database(player_ids: Set[int], channel_id: Optional[int]):
+    with session_scope() as session:
+        # We select the players’ rows
+        query_players = session.query(QueuePlayer).filter(QueuePlayer.player_id.in_(player_ids))
+        query_duos = session.query(QueuePlayer).filter(QueuePlayer.duo_id.in_(player_ids))
+
+        # If given a channel ID (when the user calls !leave), we filter
+        if channel_id is not None:
+            query_players = query_players.filter(QueuePlayer.channel_id == channel_id)
+            query_duos = query_duos.filter(QueuePlayer.channel_id == channel_id)
+
+        query_players.delete(synchronize_session=False)
+        query_duos.update({"duo_id": None}, synchronize_session=False)
+
 
 def start_ready_check(player_ids: List[int], channel_id: int, ready_check_message_id: int):
     # Checking to make sure everything is fine
     assert len(player_ids) == 10
 
+    if queue_store.enabled:
+        queue_store.start_ready_check(player_ids, channel_id, ready_check_message_id)
+
+    queue_store.write(_start_ready_check_in_database, list(player_ids), channel_id, ready_check_message_id)
+
+
+def _start_ready_check_in_database(player_ids: List[int], channel_id: int, ready_check_message_id: int):
     with session_scope() as session:
 
         (
@@ -138,7 +416,13 @@ def validate_ready_check(ready_check_id: int):
     """
     When a ready check is validated, we drop all players from all queues
     """
+    if queue_store.enabled:
+        queue_store.remove(queue_store.get_ready_check_player_ids(ready_check_id), unlink_duos=False)
 
+    queue_store.write(_validate_ready_check_in_database, ready_check_id)
+
+
+def _validate_ready_check_in_database(ready_check_id: int):
     with session_scope() as session:
         player_ids = [
             r.player_id
@@ -162,6 +446,21 @@ def cancel_ready_check(
 
     If server_id is not None, drops the player from all queues in the server
     """
+    if ids_to_drop and server_id and channel_id:
+        raise Exception("channel_id and server_id should not be used together here")
+
+    if queue_store.enabled:
+        queue_store.cancel_ready_check(ready_check_id)
+
+        if ids_to_drop:
+            queue_store.remove(set(ids_to_drop), channel_id=channel_id or None, server_id=server_id or None)
+
+    queue_store.write(_cancel_ready_check_in_database, ready_check_id, ids_to_drop, channel_id, server_id)
+
+
+def _cancel_ready_check_in_database(
+    ready_check_id: int, ids_to_drop: Optional[List[int]], channel_id: Optional[int], server_id: Optional[int]
+):
     with session_scope() as session:
         # First, we cancel the ready check for *all* players, even the ones we don’t drop
         (
@@ -175,9 +474,6 @@ def cancel_ready_check(
             players_query = session.query(QueuePlayer).filter(QueuePlayer.player_id.in_(ids_to_drop))
             duos_query = session.query(QueuePlayer).filter(QueuePlayer.duo_id.in_(ids_to_drop))
 
-            if server_id and channel_id:
-                raise Exception("channel_id and server_id should not be used together here")
-
             # This removes the player from *all* queues in the server (timeout)
             if server_id:
                 players_query = players_query.filter(QueuePlayer.player_server_id == server_id)
@@ -197,6 +493,13 @@ def cancel_all_ready_checks():
     """
     Cancels all ready checks, used when restarting the bot
     """
+    if queue_store.enabled:
+        queue_store.cancel_ready_check()
+
+    queue_store.write(_cancel_all_ready_checks_in_database)
+
+
+def _cancel_all_ready_checks_in_database():
     with session_scope() as session:
         # We put all ready_check_id to None
         session.query(QueuePlayer).update({"ready_check_id": None}, synchronize_session=False)
@@ -206,6 +509,9 @@ def get_active_queues() -> List[int]:
     """
     Returns a list of channel IDs where there is a queue ongoing
     """
+    if queue_store.enabled:
+        return queue_store.get_active_queues()
+
     with session_scope() as session:
         output = [
             r.channel_id for r in session.query(QueuePlayer.channel_id).group_by(QueuePlayer.channel_id)
@@ -214,6 +520,125 @@ def get_active_queues() -> List[int]:
     return output
 
 
+# A single statement removes players whose last queue in a channel is older than its TTL
+#   It also unlinks their duos
+#   Players in a ready check on their server are kept, as they could be in a game soon
+expire_queue_players_statement = sqlalchemy.text(
+    """
+    WITH queue_ttl AS (
+        SELECT *
+        FROM unnest(CAST(:channel_ids AS BIGINT[]), CAST(:ttls AS INTEGER[])) AS queue_ttl (channel_id, ttl)
+    ),
+    expired_player AS (
+        SELECT queue_player.channel_id, queue_player.player_id
+        FROM queue_player
+        JOIN queue_ttl ON queue_ttl.channel_id = queue_player.channel_id
+        WHERE NOT EXISTS (
+            SELECT 1 FROM queue_player AS ready_check_player
+            WHERE ready_check_player.player_id = queue_player.player_id
+            AND ready_check_player.player_server_id = queue_player.player_server_id
+            AND ready_check_player.ready_check_id IS NOT NULL
+        )
+        GROUP BY queue_player.channel_id, queue_player.player_id, queue_ttl.ttl
+        HAVING max(
+            CASE WHEN queue_player.jump_ahead
+            THEN queue_player.queue_time + :jump_ahead_delta
+            ELSE queue_player.queue_time END
+        ) < :now - make_interval(mins => queue_ttl.ttl)
+    ),
+    expired AS (
+        DELETE FROM queue_player
+        USING expired_player
+        WHERE queue_player.channel_id = expired_player.channel_id
+        AND queue_player.player_id = expired_player.player_id
+        RETURNING queue_player.channel_id
+    ),
+    unlinked AS (
+        UPDATE queue_player SET duo_id = NULL
+        FROM expired_player
+        WHERE queue_player.channel_id = expired_player.channel_id
+        AND queue_player.duo_id = expired_player.player_id
+        AND (queue_player.channel_id, queue_player.player_id) NOT IN (
+            SELECT channel_id, player_id FROM expired_player
+        )
+    )
+    SELECT DISTINCT channel_id FROM expired
+    """
+)
+
+
+def expire_queue_players(queue_ttls: Dict[int, int], now: datetime = None) -> Set[int]:
+    """
+    Removes the players who did not queue in a channel for longer than its TTL, and returns affected channels
+
+    Args:
+        queue_ttls: channel_id -> minutes after which idle players are removed, 0 never removing them
+        now: the time of the sweep, used in tests
+    """
+    now = now or datetime.now()
+    queue_ttls = {channel_id: ttl for channel_id, ttl in queue_ttls.items() if ttl}
+
+    if not queue_ttls:
+        return set()
+
+    if not queue_store.enabled:
+        return _expire_queue_players_in_database(queue_ttls, now)
+
+    expired_players = get_expired_players(queue_ttls, now)
+
+    for channel_id, player_ids in expired_players.items():
+        queue_store.remove(player_ids, channel_id=channel_id)
+
+    # The same statement removes the same rows, as the database gets all changes in order
+    if expired_players:
+        queue_store.write(_expire_queue_players_in_database, queue_ttls, now)
+
+    return set(expired_players)
+
+
+def get_expired_players(queue_ttls: Dict[int, int], now: datetime) -> Dict[int, Set[int]]:
+    """
+    Returns channel_id -> expired player ids from the queue store, like expire_queue_players_statement
+    """
+    expired_players = {}
+
+    for channel_id, ttl in queue_ttls.items():
+        last_queue_times = {}
+
+        for qp in queue_store.channels.get(channel_id, {}).values():
+            if queue_store.is_in_ready_check(qp.player_id, qp.server_id):
+                continue
+
+            queue_time = qp.queue_time + jump_ahead_delta if qp.jump_ahead else qp.queue_time
+            last_queue_times[qp.player_id] = max(queue_time, last_queue_times.get(qp.player_id, queue_time))
+
+        player_ids = {
+            player_id
+            for player_id, queue_time in last_queue_times.items()
+            if queue_time < now - timedelta(minutes=ttl)
+        }
+
+        if player_ids:
+            expired_players[channel_id] = player_ids
+
+    return expired_players
+
+
+def _expire_queue_players_in_database(queue_ttls: Dict[int, int], now: datetime) -> Set[int]:
+    with session_scope() as session:
+        rows = session.execute(
+            expire_queue_players_statement,
+            {
+                "channel_ids": list(queue_ttls),
+                "ttls": list(queue_ttls.values()),
+                "jump_ahead_delta": jump_ahead_delta,
+                "now": now,
+            },
+        )
+
+        return {row.channel_id for row in rows}
+
+
 class PlayerInGame(Exception):
     ...
 
@@ -230,51 +655,61 @@ def add_duo(
     jump_ahead=False,
 ):
     # Marks this group of players and roles as a duo
-
-    if first_player_role == second_player_role:
-        raise SameRolesForDuo
-
-    # Just in case, we drop the players from the queue first
-    remove_player(first_player_id, channel_id)
-    remove_player(second_player_id, channel_id)
-
-    add_player(
-        player_id=first_player_id,
-        role=first_player_role,
-        channel_id=channel_id,
+    add_duos(
+        [
+            (
+                QueueRequest(first_player_id, first_player_role, first_player_name),
+                QueueRequest(second_player_id, second_player_role, second_player_name),
+            )
+        ],
+        channel_id,
         server_id=server_id,
-        name=first_player_name,
         jump_ahead=jump_ahead,
     )
 
-    add_player(
-        player_id=second_player_id,
-        role=second_player_role,
-        channel_id=channel_id,
-        server_id=server_id,
-        name=second_player_name,
-        jump_ahead=jump_ahead,
-    )
 
-    with session_scope() as session:
-        # Finally, we add the duos by merging only the newer data (empty fields shouldn’t get merged)
-        first_queue_player = QueuePlayer(
-            player_id=first_player_id, role=first_player_role, channel_id=channel_id, duo_id=second_player_id
-        )
+def add_duos(
+    duos: List[Tuple[QueueRequest, QueueRequest]], channel_id: int, server_id: int = None, jump_ahead=False,
+):
+    """
+    Queues all the duos in the channel in a single transaction
 
-        second_queue_player = QueuePlayer(
-            player_id=second_player_id, role=second_player_role, channel_id=channel_id, duo_id=first_player_id
-        )
+    The roles the players were queued for in the channel are dropped, and each player can only be in one duo
+    """
+    if any(first.role == second.role for first, second in duos):
+        raise SameRolesForDuo
 
-        # We merge the new information
-        session.merge(first_queue_player)
-        session.merge(second_queue_player)
+    # Just in case
+    player_ids = [request.player_id for duo in duos for request in duo]
+    assert len(set(player_ids)) == len(player_ids)
+
+    # The players are dropped from the queue and queued as duos in the same transaction
+    add_queue_players(
+        [
+            request
+            for first, second in duos
+            for request in (
+                dataclasses.replace(first, duo_id=second.player_id),
+                dataclasses.replace(second, duo_id=first.player_id),
+            )
+        ],
+        channel_id,
+        server_id=server_id,
+        jump_ahead=jump_ahead,
+        replace=True,
+    )
 
 
 def remove_duo(player_id: int, channel_id: int):
     # Removes duos for all roles for this player in this channel
     # This could be called during a ready-check but it shouldn’t be too much of an issue
+    if queue_store.enabled:
+        queue_store.remove_duo(player_id, channel_id)
+
+    queue_store.write(_remove_duo_in_database, player_id, channel_id)
+
 
+def _remove_duo_in_database(player_id: int, channel_id: int):
     with session_scope() as session:
         (
             session.query(QueuePlayer)
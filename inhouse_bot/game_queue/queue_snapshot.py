@@ -0,0 +1,180 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from inhouse_bot.database_orm import QueuePlayer
+from inhouse_bot.common_utils.fields import roles_list
+
+
+class QueuePlayerSnapshot:
+    """
+    A lightweight immutable copy of a QueuePlayer with its name and its rating for the role
+
+    It is detached from the ORM and picklable, which allows matchmaking to run in another thread or process
+    """
+
+    __slots__ = (
+        "player_id",
+        "role",
+        "duo_id",
+        "trueskill_mu",
+        "trueskill_sigma",
+        "role_rank",
+        "name",
+        "server_id",
+        "queue_time",
+        "jump_ahead",
+    )
+
+    def __init__(
+        self,
+        player_id: int,
+        role: str,
+        duo_id: Optional[int],
+        trueskill_mu: float,
+        trueskill_sigma: float,
+        role_rank: Optional[int] = None,
+        name: Optional[str] = None,
+        server_id: Optional[int] = None,
+        queue_time: Optional[datetime] = None,
+        jump_ahead: bool = False,
+    ):
+        # role_rank is 0 for the favorite role of flex players and None for other players, used to give
+        #   a single role to flex players
+        for attribute, value in zip(
+            self.__slots__,
+            (
+                player_id,
+                role,
+                duo_id,
+                trueskill_mu,
+                trueskill_sigma,
+                role_rank,
+                name,
+                server_id,
+                queue_time,
+                jump_ahead,
+            ),
+        ):
+            object.__setattr__(self, attribute, value)
+
+    @classmethod
+    def from_queue_player(cls, queue_player: QueuePlayer) -> "QueuePlayerSnapshot":
+        rating = queue_player.player.ratings[queue_player.role]
+
+        return cls(
+            player_id=queue_player.player_id,
+            role=queue_player.role,
+            duo_id=queue_player.duo_id,
+            trueskill_mu=rating.trueskill_mu,
+            trueskill_sigma=rating.trueskill_sigma,
+            role_rank=queue_player.role_rank,
+            name=queue_player.player.name,
+            server_id=queue_player.player_server_id,
+            queue_time=queue_player.queue_time,
+            jump_ahead=bool(queue_player.jump_ahead),
+        )
+
+    def replace(self, **changes) -> "QueuePlayerSnapshot":
+        """
+        Returns a copy of the snapshot with the given attributes changed
+        """
+        return QueuePlayerSnapshot(
+            **{attribute: changes.get(attribute, getattr(self, attribute)) for attribute in self.__slots__}
+        )
+
+    @property
+    def key(self):
+        return self.player_id, self.role
+
+    @property
+    def short_name(self) -> str:
+        return (self.name or str(self.player_id))[:15]
+
+    def __setattr__(self, attribute, value):
+        raise AttributeError("QueuePlayerSnapshot objects are immutable, use replace() instead")
+
+    def __reduce__(self):
+        return QueuePlayerSnapshot, tuple(getattr(self, attribute) for attribute in self.__slots__)
+
+    def __eq__(self, other):
+        return type(other) == QueuePlayerSnapshot and all(
+            getattr(self, attribute) == getattr(other, attribute) for attribute in self.__slots__
+        )
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __str__(self):
+        return f"{self.player_id} - {self.role}"
+
+
+def get_queue_order(queue_player: QueuePlayerSnapshot) -> tuple:
+    """
+    Queue players are ordered by queue time, then by id and role for players who queued at the same time
+    """
+    return queue_player.queue_time, queue_player.player_id, roles_list.index(queue_player.role)
+
+
+class QueueSnapshot:
+    """
+    The queue players of a channel in matchmaking order, with their role and duo indexes computed once
+    """
+
+    __slots__ = ("queue_players", "roles", "players", "duos")
+
+    def __init__(self, queue_players: Iterable[QueuePlayerSnapshot] = ()):
+        queue_players = tuple(queue_players)
+
+        # This dictionary will always have all roles included
+        roles = {role: tuple(qp for qp in queue_players if qp.role == role) for role in roles_list}
+
+        # player_id -> queue players of this player, one per role
+        players: Dict[int, List[QueuePlayerSnapshot]] = {}
+
+        for qp in queue_players:
+            players.setdefault(qp.player_id, []).append(qp)
+
+        object.__setattr__(self, "queue_players", queue_players)
+        object.__setattr__(self, "roles", roles)
+        object.__setattr__(self, "players", {player_id: tuple(rows) for player_id, rows in players.items()})
+
+        # Each duo only appears once, with the player with the lowest id first
+        object.__setattr__(
+            self,
+            "duos",
+            tuple(
+                (qp, duo)
+                for qp in queue_players
+                if qp.duo_id is not None
+                and qp.duo_id > qp.player_id
+                and (duo := self.get_duo(qp)) is not None
+            ),
+        )
+
+    def get_duo(self, queue_player: QueuePlayerSnapshot) -> Optional[QueuePlayerSnapshot]:
+        """
+        Returns the queue player of the duo partner, which is linked back to this player
+        """
+        return next(
+            (qp for qp in self.players.get(queue_player.duo_id, ()) if qp.duo_id == queue_player.player_id),
+            None,
+        )
+
+    def __setattr__(self, attribute, value):
+        raise AttributeError("QueueSnapshot objects are immutable")
+
+    def __reduce__(self):
+        return QueueSnapshot, (self.queue_players,)
+
+    def __len__(self):
+        return len(self.queue_players)
+
+    def __iter__(self):
+        return iter(self.queue_players)
+
+    def __eq__(self, other):
+        return type(other) == QueueSnapshot and self.queue_players == other.queue_players
+
+    def __hash__(self):
+        return hash(tuple(qp.key for qp in self.queue_players))
+
@@ -0,0 +1,484 @@
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import and_
+from sqlalchemy.dialects.postgresql import insert
+
+from inhouse_bot.database_orm import QueuePlayer, Player, PlayerRating, session_scope
+from inhouse_bot.game_queue.queue_feed import QueueFeed
+from inhouse_bot.game_queue.queue_snapshot import QueuePlayerSnapshot, get_queue_order
+from inhouse_bot.game_queue.ready_check_registry import ReadyCheckRegistry
+from inhouse_bot.inhouse_logger import inhouse_logger
+
+# "memory" keeps the queues in the bot’s process and writes their changes to the database in the background
+#   "database" reads and writes the queue_player table for every queue operation, as a fallback
+queue_store_mode = os.environ.get("INHOUSE_BOT_QUEUE_STORE") or "memory"
+
+
+def get_queue_rows_query(session):
+    """
+    Queue rows with the name of the player and his rating for the role, which can be missing
+    """
+    return (
+        session.query(
+            QueuePlayer.channel_id,
+            QueuePlayer.player_id,
+            QueuePlayer.player_server_id,
+            QueuePlayer.role,
+            QueuePlayer.duo_id,
+            QueuePlayer.role_rank,
+            QueuePlayer.queue_time,
+            QueuePlayer.jump_ahead,
+            QueuePlayer.ready_check_id,
+            Player.name,
+            PlayerRating.trueskill_mu,
+            PlayerRating.trueskill_sigma,
+        )
+        .join(
+            Player, and_(Player.id == QueuePlayer.player_id, Player.server_id == QueuePlayer.player_server_id)
+        )
+        .outerjoin(
+            PlayerRating,
+            and_(
+                PlayerRating.player_id == QueuePlayer.player_id,
+                PlayerRating.player_server_id == QueuePlayer.player_server_id,
+                PlayerRating.role == QueuePlayer.role,
+            ),
+        )
+    )
+
+
+def insert_default_ratings(session, ratings_keys: Iterable[Tuple[int, int, str]]):
+    """
+    Players who never played their role get a default rating, all of them in a single insert
+
+    Args:
+        ratings_keys: (player_id, player_server_id, role) of the missing ratings
+    """
+    ratings_keys = list(ratings_keys)
+
+    if ratings_keys:
+        session.execute(
+            insert(PlayerRating.__table__)
+            .values(
+                [
+                    {
+                        "player_id": player_id,
+                        "player_server_id": player_server_id,
+                        "role": role,
+                        "trueskill_mu": PlayerRating.default_trueskill_mu,
+                        "trueskill_sigma": PlayerRating.default_trueskill_sigma,
+                    }
+                    for player_id, player_server_id, role in ratings_keys
+                ]
+            )
+            .on_conflict_do_nothing()  # Another queue can be loaded at the same time
+        )
+
+
+def get_missing_ratings_keys(rows: Iterable) -> List[Tuple[int, int, str]]:
+    return [(row.player_id, row.player_server_id, row.role) for row in rows if row.trueskill_mu is None]
+
+
+def get_row_snapshot(row) -> QueuePlayerSnapshot:
+    return QueuePlayerSnapshot(
+        player_id=row.player_id,
+        role=row.role,
+        duo_id=row.duo_id,
+        trueskill_mu=row.trueskill_mu if row.trueskill_mu is not None else PlayerRating.default_trueskill_mu,
+        trueskill_sigma=(
+            row.trueskill_sigma if row.trueskill_sigma is not None else PlayerRating.default_trueskill_sigma
+        ),
+        role_rank=row.role_rank,
+        name=row.name,
+        server_id=row.player_server_id,
+        queue_time=row.queue_time,
+        jump_ahead=bool(row.jump_ahead),
+    )
+
+
+class QueueStore:
+    """
+    The queues of all channels, which are the source of truth at runtime when the store is enabled
+
+    It is loaded from the queue_player table on first use, and every change is written back to the table
+        in order by a background thread, which allows recovering the queues after a restart
+
+    Every change is also published to the feed, which tells readers what changed in each channel
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+
+        # channel_id -> (player_id, role) -> queue player
+        self._channels: Optional[Dict[int, Dict[Tuple[int, str], QueuePlayerSnapshot]]] = None
+
+        # player_id -> (channel_id, role) of his rows, and duo_id -> (channel_id, player_id, role) of the rows
+        #   linked to him, so changes only look at the rows of the players they affect
+        self._player_keys: Dict[int, Set[Tuple[int, str]]] = {}
+        self._duo_keys: Dict[int, Set[Tuple[int, int, str]]] = {}
+
+        self._ready_checks = ReadyCheckRegistry()
+
+        self.feed = QueueFeed()
+
+        self._writes = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+
+    @property
+    def channels(self) -> Dict[int, Dict[Tuple[int, str], QueuePlayerSnapshot]]:
+        if self._channels is None:
+            self.load()
+
+        return self._channels
+
+    @property
+    def ready_checks(self) -> ReadyCheckRegistry:
+        if self._channels is None:
+            self.load()
+
+        return self._ready_checks
+
+    @property
+    def loaded(self) -> bool:
+        return self._channels is not None
+
+    def load(self):
+        """
+        Reads all queues from the database, after writing the pending changes
+
+        This blocks until the background writes are done and the queues are read, so the bot loads them in an
+            executor on startup instead of on first use in the event loop
+        """
+        self.flush()
+
+        channels = {}
+        ready_checks = ReadyCheckRegistry()
+
+        with session_scope() as session:
+            rows = get_queue_rows_query(session).order_by(QueuePlayer.queue_time.asc()).all()
+            insert_default_ratings(session, get_missing_ratings_keys(rows))
+
+        self._player_keys, self._duo_keys = {}, {}
+
+        for row in rows:
+            queue_player = get_row_snapshot(row)
+
+            channels.setdefault(row.channel_id, {})[queue_player.key] = queue_player
+            self._index_row(row.channel_id, queue_player)
+
+            if row.ready_check_id is not None:
+                ready_checks.start(row.ready_check_id, row.player_server_id, row.channel_id, [row.player_id])
+
+        self._channels = channels
+        self._ready_checks = ready_checks
+
+        # The queues can have changed in the database, so readers need to read them again
+        self.feed.invalidate(channels)
+
+    def write(self, function: Callable, *args):
+        """
+        Runs the database write of a queue change, in the background if the store is enabled
+        """
+        if not self.enabled:
+            return function(*args)
+
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._run_writes, name="queue_store_writer", daemon=True)
+            self._writer.start()
+
+        self._writes.put((function, args))
+
+    def _run_writes(self):
+        while True:
+            function, args = self._writes.get()
+
+            try:
+                function(*args)
+            except Exception:
+                # The queue in memory is still right, only its recovery after a restart is affected
+                inhouse_logger.exception(f"Could not write queue change {function.__name__}{args}")
+            finally:
+                self._writes.task_done()
+
+    def flush(self):
+        """
+        Waits until all queue changes are written to the database
+        """
+        self._writes.join()
+
+    def get_queue(self, channel_id: int) -> Tuple[Optional[int], List[QueuePlayerSnapshot]]:
+        """
+        Returns the server id of the queue and its players by queue time
+
+        Players in a ready check in any queue of the server are not in queue
+        """
+        queue_players = self.channels.get(channel_id, {}).values()
+
+        server_id = next((qp.server_id for qp in queue_players), None)
+
+        return (
+            server_id,
+            sorted(
+                (
+                    qp
+                    for qp in queue_players
+                    if not self.ready_checks.is_in_ready_check(qp.player_id, qp.server_id)
+                ),
+                key=get_queue_order,
+            ),
+        )
+
+    def get_player_rows(
+        self, player_id: int, channel_id: Optional[int] = None
+    ) -> List[Tuple[int, QueuePlayerSnapshot]]:
+        """
+        Returns the (channel_id, queue player) rows of the player, in the channel or in all channels
+        """
+        channels = self.channels
+
+        return [
+            (queue_channel_id, channels[queue_channel_id][(player_id, role)])
+            for queue_channel_id, role in self._player_keys.get(player_id, ())
+            if channel_id in (None, queue_channel_id)
+        ]
+
+    def get_duo_rows(
+        self, duo_id: int, channel_id: Optional[int] = None
+    ) -> List[Tuple[int, QueuePlayerSnapshot]]:
+        """
+        Returns the (channel_id, queue player) rows whose duo is the player, in the channel or in all channels
+        """
+        channels = self.channels
+
+        return [
+            (queue_channel_id, channels[queue_channel_id][(player_id, role)])
+            for queue_channel_id, player_id, role in self._duo_keys.get(duo_id, ())
+            if channel_id in (None, queue_channel_id)
+        ]
+
+    def get_active_queues(self) -> List[int]:
+        return [channel_id for channel_id, queue_players in self.channels.items() if queue_players]
+
+    def is_in_ready_check(self, player_id: int, server_id: Optional[int] = None) -> bool:
+        return self.ready_checks.is_in_ready_check(player_id, server_id)
+
+    def get_ready_check_player_ids(self, ready_check_id: int) -> Set[int]:
+        ready_check = self.ready_checks.get(ready_check_id)
+
+        return set(ready_check.player_ids) if ready_check else set()
+
+    def reset(self, channel_id: Optional[int] = None):
+        channel_ids = [
+            queue_channel_id for queue_channel_id in self.channels if channel_id in (None, queue_channel_id)
+        ]
+
+        player_ids = {
+            qp.player_id
+            for queue_channel_id in channel_ids
+            for qp in self.channels[queue_channel_id].values()
+        }
+
+        # Players of the ready checks of these channels are back in the queues of the other channels
+        player_ids.update(
+            player_id
+            for ready_check in self.ready_checks.ready_checks.values()
+            if ready_check.channel_id in channel_ids
+            for player_id in ready_check.player_ids
+        )
+
+        with self._publish_changes(player_ids):
+            for queue_channel_id in channel_ids:
+                for queue_player in self.channels.pop(queue_channel_id).values():
+                    self._unindex_row(queue_channel_id, queue_player)
+
+                self.ready_checks.cancel_channel(queue_channel_id)
+
+    def add(self, channel_id: int, queue_players: Iterable[QueuePlayerSnapshot], replace: bool = False):
+        """
+        Adds the queue players to the channel, or updates their rows if they were already queued for the role
+
+        If replace is True, the roles and duos the players had in the channel are dropped first
+        """
+        queue_players = list(queue_players)
+        player_ids = {qp.player_id for qp in queue_players}
+
+        with self._publish_changes(player_ids, channel_id=channel_id):
+            if replace:
+                self._remove(player_ids, channel_id=channel_id)
+
+            channel_queue = self.channels.setdefault(channel_id, {})
+
+            for queue_player in queue_players:
+                current_queue_player = channel_queue.get(queue_player.key)
+
+                # Like a merge of the row, re-queuing keeps the duo
+                if current_queue_player is not None:
+                    queue_player = queue_player.replace(duo_id=current_queue_player.duo_id)
+
+                self._set_row(channel_id, queue_player)
+
+    def remove(
+        self,
+        player_ids: Set[int],
+        channel_id: Optional[int] = None,
+        server_id: Optional[int] = None,
+        unlink_duos: bool = True,
+    ):
+        """
+        Removes the players from the queues of the channel or of the server, or from all queues by default
+
+        Players who were in a duo with them become solo players if unlink_duos is True
+        """
+        with self._publish_changes(player_ids):
+            self._remove(player_ids, channel_id, server_id, unlink_duos)
+
+    def _remove(
+        self,
+        player_ids: Set[int],
+        channel_id: Optional[int] = None,
+        server_id: Optional[int] = None,
+        unlink_duos: bool = True,
+    ):
+        for player_id in player_ids:
+            for queue_channel_id, qp in self.get_player_rows(player_id, channel_id):
+                if server_id is None or qp.server_id == server_id:
+                    self._delete_row(queue_channel_id, qp)
+                    self.ready_checks.remove_player(player_id, queue_channel_id)
+
+        # Rows of the removed players are already gone, so only their duo partners are left
+        if unlink_duos:
+            for player_id in player_ids:
+                for queue_channel_id, qp in self.get_duo_rows(player_id, channel_id):
+                    if server_id is None or qp.server_id == server_id:
+                        self._set_row(queue_channel_id, qp.replace(duo_id=None))
+
+    def set_duo(self, channel_id: int, player_id: int, role: str, duo_id: Optional[int]):
+        channel_queue = self.channels.get(channel_id, {})
+
+        with self._publish_changes({player_id}):
+            if (player_id, role) in channel_queue:
+                self._set_row(channel_id, channel_queue[(player_id, role)].replace(duo_id=duo_id))
+
+    def remove_duo(self, player_id: int, channel_id: int):
+        with self._publish_changes({player_id}):
+            for queue_channel_id, qp in self.get_player_rows(player_id, channel_id) + self.get_duo_rows(
+                player_id, channel_id
+            ):
+                self._set_row(queue_channel_id, qp.replace(duo_id=None))
+
+    def start_ready_check(self, player_ids: Iterable[int], channel_id: int, ready_check_id: int):
+        # Only players queued in the channel are part of the ready check, like in the queue_player table
+        queue_players = {qp.player_id: qp for qp in self.channels.get(channel_id, {}).values()}
+        player_ids = set(player_ids) & set(queue_players)
+
+        with self._publish_changes(player_ids, kind="ready_check_start"):
+            for player_id in player_ids:
+                server_id = queue_players[player_id].server_id
+                self.ready_checks.start(ready_check_id, server_id, channel_id, [player_id])
+
+    def cancel_ready_check(self, ready_check_id: Optional[int] = None):
+        """
+        Cancels the ready check for all its players, or all ready checks if no id is given
+        """
+        player_ids = {
+            player_id
+            for ready_check in self.ready_checks.ready_checks.values()
+            if ready_check_id in (None, ready_check.ready_check_id)
+            for player_id in ready_check.player_ids
+        }
+
+        with self._publish_changes(player_ids, kind="ready_check_end"):
+            if ready_check_id is None:
+                self.ready_checks.clear()
+            else:
+                self.ready_checks.cancel(ready_check_id)
+
+    def _set_row(self, channel_id: int, queue_player: QueuePlayerSnapshot):
+        channel_queue = self.channels.setdefault(channel_id, {})
+
+        if queue_player.key in channel_queue:
+            self._unindex_row(channel_id, channel_queue[queue_player.key])
+
+        channel_queue[queue_player.key] = queue_player
+        self._index_row(channel_id, queue_player)
+
+    def _delete_row(self, channel_id: int, queue_player: QueuePlayerSnapshot):
+        del self.channels[channel_id][queue_player.key]
+        self._unindex_row(channel_id, queue_player)
+
+    def _index_row(self, channel_id: int, queue_player: QueuePlayerSnapshot):
+        self._player_keys.setdefault(queue_player.player_id, set()).add((channel_id, queue_player.role))
+
+        if queue_player.duo_id is not None:
+            self._duo_keys.setdefault(queue_player.duo_id, set()).add(
+                (channel_id, queue_player.player_id, queue_player.role)
+            )
+
+    def _unindex_row(self, channel_id: int, queue_player: QueuePlayerSnapshot):
+        for index, index_key, key in (
+            (self._player_keys, queue_player.player_id, (channel_id, queue_player.role)),
+            (self._duo_keys, queue_player.duo_id, (channel_id, queue_player.player_id, queue_player.role)),
+        ):
+            keys = index.get(index_key)
+
+            if keys is not None:
+                keys.discard(key)
+
+                if not keys:
+                    del index[index_key]
+
+    def _get_queue_rows(
+        self, players: Set[Tuple[int, int]]
+    ) -> Dict[Tuple[int, int], Tuple[QueuePlayerSnapshot, ...]]:
+        """
+        Returns (channel_id, player_id) -> rows of the player in queue, empty if he is in a ready check
+        """
+        queue_rows = {}
+
+        for channel_id, player_id in players:
+            rows = tuple(
+                sorted((qp for _, qp in self.get_player_rows(player_id, channel_id)), key=get_queue_order)
+            )
+
+            if rows and self.is_in_ready_check(player_id, rows[0].server_id):
+                rows = ()
+
+            queue_rows[(channel_id, player_id)] = rows
+
+        return queue_rows
+
+    @contextmanager
+    def _publish_changes(
+        self, player_ids: Set[int], kind: Optional[str] = None, channel_id: Optional[int] = None
+    ):
+        """
+        Publishes the changes made in the block to the rows of the players and of their duos, in all channels
+
+        Players are also looked for in the given channel, where they might not be queued yet
+        """
+        players = {
+            (queue_channel_id, qp.player_id)
+            for player_id in player_ids
+            for queue_channel_id, qp in self.get_player_rows(player_id) + self.get_duo_rows(player_id)
+        }
+
+        if channel_id is not None:
+            players.update((channel_id, player_id) for player_id in player_ids)
+
+        previous_queue_rows = self._get_queue_rows(players)
+
+        yield
+
+        queue_rows = self._get_queue_rows(players)
+
+        for (queue_channel_id, player_id), previous_rows in sorted(previous_queue_rows.items()):
+            self.feed.publish(
+                queue_channel_id, player_id, previous_rows, queue_rows[(queue_channel_id, player_id)], kind
+            )
+
+
+queue_store = QueueStore(enabled=queue_store_mode == "memory")
@@ -0,0 +1,92 @@
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Optional, Set
+
+
+@dataclass
+class ReadyCheck:
+    ready_check_id: int
+    server_id: int
+    channel_id: int
+    player_ids: Set[int] = field(default_factory=set)
+
+
+class ReadyCheckRegistry:
+    """
+    The ongoing ready checks by message id, with an index of their players on each server
+
+    The queue_player.ready_check_id column is only written for crash recovery, the registry answering reads
+    """
+
+    def __init__(self):
+        self.ready_checks: Dict[int, ReadyCheck] = {}
+
+        # player_id -> server_id -> ready check id
+        self._players: Dict[int, Dict[int, int]] = {}
+
+    def __contains__(self, ready_check_id: int) -> bool:
+        return ready_check_id in self.ready_checks
+
+    def __len__(self):
+        return len(self.ready_checks)
+
+    def get(self, ready_check_id: int) -> Optional[ReadyCheck]:
+        return self.ready_checks.get(ready_check_id)
+
+    def is_in_ready_check(self, player_id: int, server_id: Optional[int] = None) -> bool:
+        """
+        Checks if the player is in a ready check on the server, or on any server if no server id is given
+        """
+        player_ready_checks = self._players.get(player_id)
+
+        if not player_ready_checks:
+            return False
+
+        return server_id is None or server_id in player_ready_checks
+
+    def start(self, ready_check_id: int, server_id: int, channel_id: int, player_ids: Iterable[int]):
+        ready_check = self.ready_checks.setdefault(
+            ready_check_id, ReadyCheck(ready_check_id, server_id, channel_id)
+        )
+
+        for player_id in player_ids:
+            ready_check.player_ids.add(player_id)
+            self._players.setdefault(player_id, {})[server_id] = ready_check_id
+
+    def cancel(self, ready_check_id: int) -> Optional[ReadyCheck]:
+        """
+        Removes the ready check and returns it, if it exists
+        """
+        ready_check = self.ready_checks.pop(ready_check_id, None)
+
+        if ready_check is not None:
+            for player_id in ready_check.player_ids:
+                self._unindex_player(player_id, ready_check)
+
+        return ready_check
+
+    def cancel_channel(self, channel_id: int):
+        for ready_check in list(self.ready_checks.values()):
+            if ready_check.channel_id == channel_id:
+                self.cancel(ready_check.ready_check_id)
+
+    def clear(self):
+        self.ready_checks.clear()
+        self._players.clear()
+
+    def remove_player(self, player_id: int, channel_id: int):
+        """
+        Removes the player from the ready check of the channel he was dropped from
+        """
+        for ready_check in self.ready_checks.values():
+            if ready_check.channel_id == channel_id and player_id in ready_check.player_ids:
+                ready_check.player_ids.discard(player_id)
+                self._unindex_player(player_id, ready_check)
+
+    def _unindex_player(self, player_id: int, ready_check: ReadyCheck):
+        player_ready_checks = self._players.get(player_id, {})
+
+        if player_ready_checks.get(ready_check.server_id) == ready_check.ready_check_id:
+            del player_ready_checks[ready_check.server_id]
+
+        if not player_ready_checks:
+            self._players.pop(player_id, None)
@@ -64,6 +64,10 @@ class InhouseBot(commands.Bot):
     async def on_ready(self):
         self.logger.info(f"{self.user.name} has connected to Discord")
 
+        # Queues in memory are read from the database outside of the event loop
+        if game_queue.queue_store.enabled and not game_queue.queue_store.loaded:
+            await self.loop.run_in_executor(None, game_queue.queue_store.load)
+
         # We cancel all ready-checks, and queue_channel_handler will handle rewriting the queues
         game_queue.cancel_all_ready_checks()
 
@@ -112,6 +116,13 @@ class InhouseBot(commands.Bot):
                     delete_after=20,
                 )
 
+            elif isinstance(og_error, game_queue.PlayerInDuo):
+                await ctx.send(
+                    f"You are duo queued and cannot queue for several roles\n"
+                    f"Use `!leave` first if you want to queue without your duo partner",
+                    delete_after=20,
+                )
+
             else:
                 # User-facing error
                 await ctx.send(
@@ -1,5 +1,12 @@
-from inhouse_bot.matchmaking_logic.find_best_game import find_best_game
-from inhouse_bot.matchmaking_logic.evaluate_game import evaluate_game
+from inhouse_bot.matchmaking_logic.find_best_game import find_best_game, find_best_games, find_candidate_game
+from inhouse_bot.matchmaking_logic.matchmaking_executor import (
+    find_best_game_in_executor,
+    find_best_games_in_executor,
+    find_server_games_in_executor,
+    server_wide_matchmaking,
+)
+from inhouse_bot.matchmaking_logic.search_stats import SearchStats
+from inhouse_bot.matchmaking_logic.evaluate_game import evaluate_game, evaluate_games
 from inhouse_bot.matchmaking_logic.score_game import score_game_from_winning_player
 import trueskill
 
@@ -1,127 +1,361 @@
-import itertools
 import random
-from typing import Optional, List
+import time
+from typing import Optional, List, Dict, Sequence, Set, Tuple
 
 from inhouse_bot.database_orm import Game, QueuePlayer
 from inhouse_bot.common_utils.fields import roles_list
-from inhouse_bot.game_queue import GameQueue
+from inhouse_bot.game_queue import GameQueue, QueuePlayerSnapshot
 from inhouse_bot.inhouse_logger import inhouse_logger
+from inhouse_bot.matchmaking_logic import vectorized_search, meet_in_the_middle, local_search
+from inhouse_bot.matchmaking_logic.evaluate_game import evaluate_teams
+from inhouse_bot.matchmaking_logic.role_assignment import assign_roles
+from inhouse_bot.matchmaking_logic.search_stats import SearchStats
 
+# All solvers return the best {(team, role)} = QueuePlayerSnapshot composition, or None if there is no valid one
+#   vectorized scores every composition and gives the same game as the historical brute-force search
+#   meet_in_the_middle only walks the most balanced half-compositions and stays fast with 6+ players per role
+#   local_search is an iterated local search which is not exact, but stays fast for any queue size
+solvers = {
+    "vectorized": vectorized_search.find_best_composition,
+    "meet_in_the_middle": meet_in_the_middle.find_best_composition,
+    "local_search": local_search.find_best_composition,
+}
 
-def find_best_game(queue: GameQueue, game_quality_threshold=0.1) -> Optional[Game]:
-    # Do not do anything if there’s not at least 2 players in queue per role
+# The "auto" solver picks the exact solvers up to those numbers of queue players, and local_search above
+vectorized_cutoff = 20
+meet_in_the_middle_cutoff = 40
+
+# Games to pop right away after a cancelled ready check, computed while players answer it
+#   channel_id -> list of {(team, role)} = QueuePlayerSnapshot compositions
+candidate_compositions_cache: Dict[int, List[Dict[Tuple[str, str], QueuePlayerSnapshot]]] = {}
+
+
+def get_solver(solver: str, queue_players_count: int) -> str:
+    """
+    Returns the name of the solver to use for this number of queue players
+    """
+    if solver != "auto":
+        return solver
+
+    if queue_players_count <= vectorized_cutoff:
+        return "vectorized"
+
+    elif queue_players_count <= meet_in_the_middle_cutoff:
+        return "meet_in_the_middle"
+
+    return "local_search"
+
+
+def find_best_game(
+    queue: GameQueue,
+    game_quality_threshold=0.1,
+    solver="auto",
+    incremental=True,
+    time_budget: Optional[float] = None,
+    stats: Optional[SearchStats] = None,
+) -> Optional[Game]:
+    inhouse_logger.info(f"Matchmaking process started with the following queue:\n{queue}")
+
+    composition = find_best_composition(
+        queue.get_snapshot(),
+        game_quality_threshold=game_quality_threshold,
+        solver=solver,
+        incremental=incremental,
+        time_budget=time_budget,
+        stats=stats,
+    )
+
+    return get_game(queue.queue_players, composition)
+
+
+def find_best_games(
+    queue: GameQueue,
+    max_games: int,
+    game_quality_threshold=0.1,
+    solver="auto",
+    time_budget: Optional[float] = None,
+    stats: Optional[SearchStats] = None,
+) -> List[Game]:
+    """
+    Returns up to max_games disjoint games from the same queue, which can start their ready checks together
+    """
+    inhouse_logger.info(f"Multiple games matchmaking started with the following queue:\n{queue}")
+
+    compositions = find_best_compositions(
+        queue.get_snapshot(),
+        max_games,
+        game_quality_threshold=game_quality_threshold,
+        solver=solver,
+        time_budget=time_budget,
+        stats=stats,
+    )
+
+    return [get_game(queue.queue_players, composition) for composition in compositions]
+
+
+def get_remaining_queue_players(
+    queue_snapshot: List[QueuePlayerSnapshot], player_ids: Set[int]
+) -> List[QueuePlayerSnapshot]:
+    """
+    Drops the players from the queue in all their roles, unlinking the duos they were part of
+    """
+    return [
+        qp if qp.duo_id not in player_ids else qp.replace(duo_id=None)
+        for qp in queue_snapshot
+        if qp.player_id not in player_ids
+    ]
+
+
+def find_best_compositions(
+    queue_snapshot: List[QueuePlayerSnapshot],
+    max_games: int,
+    game_quality_threshold=0.1,
+    solver="auto",
+    incremental=True,
+    time_budget: Optional[float] = None,
+    stats: Optional[SearchStats] = None,
+) -> List[Dict[Tuple[str, str], QueuePlayerSnapshot]]:
+    """
+    Disjoint compositions from the same queue, each one being the best one with the players left in queue
+
+    As every search starts from the oldest players, the first games go to the players who waited the longest
+    Only the first game can be above game_quality_threshold, like with find_best_game, as the next ones would
+        otherwise pop unbalanced games instead of waiting for more players
+    """
+    start_time = time.monotonic()
+
+    compositions = []
+
+    while len(compositions) < max_games:
+        remaining_budget = (
+            max(time_budget - (time.monotonic() - start_time), 0) if time_budget is not None else None
+        )
+
+        composition = find_best_composition(
+            queue_snapshot,
+            game_quality_threshold=game_quality_threshold,
+            solver=solver,
+            incremental=incremental,
+            time_budget=remaining_budget,
+            stats=stats,
+        )
+
+        if not composition or (compositions and get_matchmaking_score(composition) >= game_quality_threshold):
+            break
+
+        compositions.append(composition)
+
+        queue_snapshot = get_remaining_queue_players(
+            queue_snapshot, {qp.player_id for qp in composition.values()}
+        )
+
+    if stats is not None:
+        stats.elapsed = time.monotonic() - start_time
+
+    return compositions
+
+
+def get_candidate_compositions(
+    queue_snapshot: List[QueuePlayerSnapshot],
+    composition: Dict[Tuple[str, str], QueuePlayerSnapshot],
+    **kwargs,
+) -> List[Dict[Tuple[str, str], QueuePlayerSnapshot]]:
+    """
+    Returns the best composition of the queue without each player of the composition
+
+    This is the queue we get when this player cancels the ready check, as he is dropped and his duo is unlinked
+    """
+    candidates = []
+
+    for dropped_queue_player in composition.values():
+        remaining_queue_players = get_remaining_queue_players(
+            queue_snapshot, {dropped_queue_player.player_id}
+        )
+
+        candidate = find_best_composition(remaining_queue_players, **kwargs)
 
-    for role_queue in queue.queue_players_dict.values():
-        if len(role_queue) < 2:
+        if candidate:
+            candidates.append(candidate)
+
+    return candidates
+
+
+def find_candidate_game(queue: GameQueue) -> Optional[Game]:
+    """
+    Returns the most balanced candidate game of this channel whose players are all still in queue
+
+    Players dropped after a cancelled ready check are not in queue anymore, so their games are skipped
+    """
+    queue_snapshot = {qp.key: qp for qp in queue.get_snapshot()}
+
+    # Ratings and duos also have to be the same as when the candidate was computed
+    valid_candidates = [
+        composition
+        for composition in candidate_compositions_cache.get(queue.channel_id, [])
+        if all(queue_snapshot.get(qp.key) == qp for qp in composition.values())
+    ]
+
+    if not valid_candidates:
+        return None
+
+    inhouse_logger.info("Using a candidate game computed during the last ready check")
+
+    return get_game(queue.queue_players, min(valid_candidates, key=get_matchmaking_score))
+
+
+def find_best_composition(
+    queue_snapshot: List[QueuePlayerSnapshot],
+    game_quality_threshold=0.1,
+    solver="auto",
+    incremental=True,
+    time_budget: Optional[float] = None,
+    stats: Optional[SearchStats] = None,
+) -> Optional[Dict[Tuple[str, str], QueuePlayerSnapshot]]:
+    """
+    The matchmaking logic itself, which does not touch the database and can run in another process
+
+    If time_budget is given in seconds, we return the best composition found so far once it is spent
+    If a SearchStats object is given, it is filled with what the search went through
+    """
+    stats = stats if stats is not None else SearchStats()
+
+    start_time = time.monotonic()
+    deadline = start_time + time_budget if time_budget is not None else None
+
+    best_composition = _find_best_composition(
+        queue_snapshot, game_quality_threshold, solver, incremental, deadline, stats
+    )
+
+    stats.elapsed = time.monotonic() - start_time
+
+    inhouse_logger.info(f"Matchmaking search done: {stats}")
+
+    return best_composition
+
+
+def _find_best_composition(
+    queue_snapshot: List[QueuePlayerSnapshot],
+    game_quality_threshold: float,
+    solver: str,
+    incremental: bool,
+    deadline: Optional[float],
+    stats: SearchStats,
+) -> Optional[Dict[Tuple[str, str], QueuePlayerSnapshot]]:
+    # Flex players get a single role first, so they do not multiply the compositions
+    queue_snapshot = assign_roles(queue_snapshot)
+
+    # Do not do anything if there’s not at least 2 players in queue per role
+    for role in roles_list:
+        if len([qp for qp in queue_snapshot if qp.role == role]) < 2:
             return None
 
     # If we get there, we know there are at least 10 players in the queue
     # We start with the 10 players who have been in queue for the longest time
 
-    inhouse_logger.info(f"Matchmaking process started with the following queue:\n{queue}")
-
-    best_game = None
-    for players_threshold in range(10, len(queue) + 1):
-        # The queue_players are already ordered the right way to take age into account in matchmaking
+    best_composition = None
+    best_score = None
+    for players_threshold in range(10, len(queue_snapshot) + 1):
+        # The queue_snapshot is already ordered the right way to take age into account in matchmaking
         #   We first try with the 10 first players, then 11, ...
-        best_game = find_best_game_for_queue_players(queue.queue_players[:players_threshold])
+        inhouse_logger.info(
+            f"Trying to find the best game for: {' | '.join(f'{qp}' for qp in queue_snapshot[:players_threshold])}"
+        )
+
+        # In incremental mode, we only score compositions including the player we just added
+        #   All the other ones were already scored at the previous threshold, so we keep the best game so far
+        required_queue_player = (
+            queue_snapshot[players_threshold - 1] if incremental and players_threshold > 10 else None
+        )
+
+        # Solvers only look at one of the two mirrored compositions (full blue/red -> red/blue)
+        #   They return the best composition they found so far once the deadline is passed
+        composition = solvers[get_solver(solver, players_threshold)](
+            queue_snapshot[:players_threshold], required_queue_player, deadline=deadline, stats=stats
+        )
+        score = get_matchmaking_score(composition) if composition else None
+
+        if required_queue_player is None or (composition and (not best_composition or score < best_score)):
+            best_composition, best_score = composition, score
 
         # We stop when we beat the game quality threshold (below 60% winrate for one side)
-        if best_game and best_game.matchmaking_score < game_quality_threshold:
-            return best_game
+        if best_composition and best_score < game_quality_threshold:
+            return best_composition
 
-    return best_game
+        # Newer players are only looked at if there is time left
+        if deadline is not None and time.monotonic() > deadline and players_threshold < len(queue_snapshot):
+            stats.timed_out, stats.proven_optimal = True, False
+            return best_composition
 
+    return best_composition
 
-def find_best_game_for_queue_players(queue_players: List[QueuePlayer]) -> Game:
+
+def find_best_game_for_queue_players(
+    queue_players: List[QueuePlayer],
+    solver="auto",
+    required_queue_player: Optional[QueuePlayer] = None,
+    stats: Optional[SearchStats] = None,
+) -> Optional[Game]:
     """
     A sub function to allow us to iterate on QueuePlayers from oldest to newest
+
+    If required_queue_player is given, only games including this QueuePlayer are considered
     """
-    inhouse_logger.info(f"Trying to find the best game for: {' | '.join(f'{qp}' for qp in queue_players)}")
+    queue_snapshot = [QueuePlayerSnapshot.from_queue_player(qp) for qp in queue_players]
 
-    # Currently simply testing all permutations because it should be pretty lightweight
-    # TODO LOW PRIO Spot mirrored team compositions (full blue/red -> red/blue) to not calculate them twice
+    required_snapshot = (
+        queue_snapshot[next(i for i, qp in enumerate(queue_players) if qp is required_queue_player)]
+        if required_queue_player is not None
+        else None
+    )
 
-    # This creates a list of possible 2-players permutations per role
-    # We keep it as a list to make it easier to make a product on the values afterwards
-    role_permutations = []  # list of tuples of 2-players permutations in the role
+    return get_game(
+        queue_snapshot,
+        solvers[get_solver(solver, len(queue_snapshot))](queue_snapshot, required_snapshot, stats=stats),
+    )
 
-    # We iterate on each role (which will have 2 players or more) and create one list of permutations per role
-    for role in roles_list:
-        role_permutations.append(
-            [
-                queue_player
-                for queue_player in itertools.permutations([qp for qp in queue_players if qp.role == role], 2)
-            ]
+
+def get_matchmaking_score(composition: Dict[Tuple[str, str], QueuePlayerSnapshot]) -> float:
+    """
+    Same value as Game.matchmaking_score, without creating the Game
+    """
+    return abs(
+        0.5
+        - evaluate_teams(
+            [composition["BLUE", role] for role in roles_list],
+            [composition["RED", role] for role in roles_list],
         )
+    )
+
+
+def get_game(
+    queue_players: Sequence[QueuePlayerSnapshot],
+    composition: Optional[Dict[Tuple[str, str], QueuePlayerSnapshot]],
+) -> Optional[Game]:
+    """
+    Creates the Game object of a composition found on a snapshot of the queue players
 
-    # We do a very simple maximum search
-    best_score = 1
-    best_game = None
-
-    # This generates all possible team compositions
-    # The format is a list of 5 tuples with the blue and red player objects in the tuple
-    for team_composition in itertools.product(*role_permutations):
-        # We already shuffle blue/red as otherwise the first best composition is always chosen
-        shuffle = bool(random.getrandbits(1))
-
-        # bool(tuple_idx) == shuffle explanation:
-        #   tuple_idx = 0 (BLUE) &  shuffle = False -> False == False   -> True     -> BLUE
-        #   tuple_idx = 1 (RED)  &  shuffle = False -> False == True    -> False    -> RED
-        #   tuple_idx = 0 (BLUE) &  shuffle = True  -> False == True    -> False    -> RED
-        #   tuple_idx = 1 (RED)  &  shuffle = True  -> True == True     -> True     -> BLUE
-
-        # We transform it to a more manageable dictionary of QueuePlayers
-        # {(team, role)} = QueuePlayer
-        queue_players_dict = {
-            ("BLUE" if bool(tuple_idx) == shuffle else "RED", roles_list[role_idx]): queue_players_tuple[
-                tuple_idx
-            ]
-            for role_idx, queue_players_tuple in enumerate(team_composition)
-            for tuple_idx in (0, 1)
+    Players are taken from the current queue, as the composition can come from a previous search
+    """
+    if not composition:
+        return None
+
+    # We shuffle blue/red on the chosen game only, as otherwise the best composition always has the same sides
+    if random.getrandbits(1):
+        composition = {
+            ("RED" if team == "BLUE" else "BLUE", role): qp for (team, role), qp in composition.items()
         }
 
-        # We check that all 10 QueuePlayers are in the same team as their duos
-
-        # TODO LOW PRIO This is super stupid *but* works well enough for easy situations
-        #   This is very much in need of a rewrite
-        duos_not_in_same_team = False
-        for team_tuple, qp in queue_players_dict.items():
-            if qp.duo_id is not None:
-                try:
-                    next(
-                        duo_qp
-                        for duo_team_tuple, duo_qp in queue_players_dict.items()
-                        if duo_team_tuple[0] == team_tuple[0] and duo_qp.player_id == qp.duo_id
-                    )
-                except StopIteration:
-                    duos_not_in_same_team = True
-                    continue
-
-        if duos_not_in_same_team:
-            continue
-
-        # We take the players from the queue players and make it a new dict to create our games objects
-        players = {k: qp.player for k, qp in queue_players_dict.items()}
-
-        # We check to make sure all 10 players are different
-        if set(players.values()).__len__() != 10:
-            continue
-
-        # We create a Game object for easier handling, and it will compute the matchmaking score
-        game = Game(players)
-
-        # Importantly, we do *not* add the game to the session, as that will be handled by the bot logic itself
-
-        if game.matchmaking_score < best_score:
-            inhouse_logger.info(
-                f"New best game found with {game.blue_expected_winrate*100:.2f} blue side expected winrate"
-            )
-
-            best_game = game
-            best_score = game.matchmaking_score
-            # If the game is seen as being below 51% winrate for one side, we simply stop there (helps with big lists)
-            if best_score < 0.01:
-                break
-
-    return best_game
+    # We take the players from the queue players and make it a new dict to create our games objects
+    queue_players_dict = {qp.key: qp for qp in queue_players}
+    players = {k: queue_players_dict[snapshot.key] for k, snapshot in composition.items()}
+
+    # We create a Game object for easier handling, and it will compute the matchmaking score
+    game = Game(players)
+
+    # Importantly, we do *not* add the game to the session, as that will be handled by the bot logic itself
+
+    inhouse_logger.info(
+        f"Best game found with {game.blue_expected_winrate*100:.2f} blue side expected winrate"
+    )
+
+    return game
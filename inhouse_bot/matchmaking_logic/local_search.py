@@ -0,0 +1,320 @@
+import math
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+from inhouse_bot.game_queue import QueuePlayerSnapshot
+from inhouse_bot.common_utils.fields import roles_list
+from inhouse_bot.matchmaking_logic.evaluate_game import beta_squared, cdf
+from inhouse_bot.matchmaking_logic.search_stats import SearchStats
+from inhouse_bot.matchmaking_logic.vectorized_search import PackedQueue, good_enough_score
+
+# Number of times we kick the best composition found so far to a new starting point, which bounds the search
+max_kicks = 100
+
+# Number of random player changes in a kick
+kick_size = 3
+
+# Ratios of pairs computed from the other roles’ sums can be a few ULPs away from the state’s ones
+ratio_tolerance = 1e-12
+
+# Cost of a broken constraint (player twice in the game, split duo), higher than any balance ratio
+constraint_penalty = 10.0
+
+
+class LocalSearchQueue(PackedQueue):
+    """
+    The packed queue with the Python lists used by the local search, which are faster for scalar access
+    """
+
+    def __init__(
+        self,
+        queue_players: List[QueuePlayerSnapshot],
+        required_queue_player: Optional[QueuePlayerSnapshot] = None,
+    ):
+        super().__init__(queue_players, required_queue_player)
+
+        self.player_ids_list = self.player_ids.tolist()
+        self.duo_ids_list = self.duo_ids.tolist()
+        self.role_indices_list = self.role_indices.tolist()
+
+        self.role_pairs_lists = [role_pairs.tolist() for role_pairs in self.role_pairs]
+
+        self.role_queue_players = [
+            [i for i, role_idx in enumerate(self.role_indices_list) if role_idx == r]
+            for r in range(len(roles_list))
+        ]
+
+        self.queue_player_indices_by_id = {}
+        for queue_player_idx, player_id in enumerate(self.player_ids_list):
+            self.queue_player_indices_by_id.setdefault(player_id, []).append(queue_player_idx)
+
+        self.required_idx = (
+            next(i for i, qp in enumerate(queue_players) if qp is required_queue_player)
+            if required_queue_player is not None
+            else None
+        )
+
+
+class LocalSearchState:
+    """
+    A composition as 10 queue player indices, blue side roles first, and its cost
+
+    Compositions breaking constraints are allowed during the search, but with a cost penalty
+    """
+
+    def __init__(self, packed: LocalSearchQueue, slots: List[int]):
+        self.packed = packed
+        self.slots = slots
+
+        size = 2 * len(roles_list)
+        self.base_variance = size * beta_squared
+
+        self.ratio, self.violations = self.get_ratio(slots), self.get_violations(slots)
+
+    @property
+    def cost(self) -> float:
+        return self.ratio + constraint_penalty * self.violations
+
+    def get_ratio(self, slots: List[int]) -> float:
+        """
+        Blue winrate only depends on this ratio, 0 being a perfectly balanced game
+        """
+        mu, sigma2 = self.packed.mu_list, self.packed.sigma2_list
+
+        delta = sum(mu[i] for i in slots[: len(roles_list)]) - sum(mu[i] for i in slots[len(roles_list) :])
+
+        return abs(delta) / math.sqrt(self.base_variance + sum(sigma2[i] for i in slots))
+
+    def get_violations(self, slots: List[int]) -> int:
+        """
+        Number of players appearing twice and of duo partners on different sides or not in the game
+        """
+        player_ids = [self.packed.player_ids_list[i] for i in slots]
+
+        violations = len(slots) - len(set(player_ids))
+
+        for side_slots in (slots[: len(roles_list)], slots[len(roles_list) :]):
+            side_ids = {self.packed.player_ids_list[i] for i in side_slots}
+
+            violations += sum(
+                1
+                for i in side_slots
+                if self.packed.duo_ids_list[i] >= 0 and self.packed.duo_ids_list[i] not in side_ids
+            )
+
+        return violations
+
+    def move_to(self, slots: List[int]):
+        self.slots = slots
+        self.ratio, self.violations = self.get_ratio(slots), self.get_violations(slots)
+
+
+def get_initial_slots(packed: LocalSearchQueue) -> List[int]:
+    """
+    Fills blue then red slots of each role with the oldest players not already in the game
+    """
+    slots = [None] * (2 * len(roles_list))
+    used_player_ids = set()
+
+    queue_order = list(range(len(packed.queue_players)))
+
+    # The required player always gets its role’s blue slot
+    if packed.required_idx is not None:
+        queue_order.remove(packed.required_idx)
+        queue_order.insert(0, packed.required_idx)
+
+    for queue_player_idx in queue_order:
+        player_id = packed.player_ids_list[queue_player_idx]
+        role_idx = packed.role_indices_list[queue_player_idx]
+
+        if player_id in used_player_ids:
+            continue
+
+        for slot_idx in (role_idx, role_idx + len(roles_list)):
+            if slots[slot_idx] is None:
+                slots[slot_idx] = queue_player_idx
+                used_player_ids.add(player_id)
+                break
+
+    # With players queued in multiple roles, a role can be left empty and is filled with a broken composition
+    for slot_idx, queue_player_idx in enumerate(slots):
+        if queue_player_idx is None:
+            slots[slot_idx] = packed.role_queue_players[slot_idx % len(roles_list)][-1]
+
+    return slots
+
+
+def get_move(packed: LocalSearchQueue, slots: List[int], rng: random.Random) -> Optional[List[int]]:
+    """
+    Returns new slots with one queue player changed, or None if the move is not allowed
+
+    A player already on the other side in the same role swaps sides, and a player with a duo brings their partner
+    """
+    slot_idx = rng.randrange(len(slots))
+    role_idx = slot_idx % len(roles_list)
+
+    candidate_idx = rng.choice(packed.role_queue_players[role_idx])
+
+    if candidate_idx == slots[slot_idx]:
+        return None
+
+    new_slots = slots.copy()
+
+    mirror_slot_idx = (slot_idx + len(roles_list)) % len(slots)
+
+    if new_slots[mirror_slot_idx] == candidate_idx:
+        new_slots[mirror_slot_idx] = new_slots[slot_idx]
+
+    elif new_slots[slot_idx] == packed.required_idx:
+        return None
+
+    new_slots[slot_idx] = candidate_idx
+
+    duo_id = packed.duo_ids_list[candidate_idx]
+
+    if duo_id >= 0:
+        side_start = slot_idx - role_idx
+        side_ids = {packed.player_ids_list[i] for i in new_slots[side_start : side_start + len(roles_list)]}
+
+        partner_indices = [
+            i
+            for i in packed.queue_player_indices_by_id.get(duo_id, [])
+            if new_slots[side_start + packed.role_indices_list[i]] != packed.required_idx
+        ]
+
+        if duo_id not in side_ids and partner_indices:
+            partner_idx = rng.choice(partner_indices)
+
+            partner_slot_idx = side_start + packed.role_indices_list[partner_idx]
+            partner_mirror_slot_idx = (partner_slot_idx + len(roles_list)) % len(slots)
+
+            # The partner can come from the other side, in which case the two players swap sides
+            if new_slots[partner_mirror_slot_idx] == partner_idx:
+                new_slots[partner_mirror_slot_idx] = new_slots[partner_slot_idx]
+
+            new_slots[partner_slot_idx] = partner_idx
+
+    return new_slots
+
+
+def get_best_role_slots(state: LocalSearchState, role_idx: int, stats: SearchStats) -> Optional[List[int]]:
+    """
+    Returns the slots with the best blue/red pair of players for this role, or None if none lowers the cost
+    """
+    packed = state.packed
+    mu, sigma2 = packed.mu_list, packed.sigma2_list
+
+    blue_slot_idx, red_slot_idx = role_idx, role_idx + len(roles_list)
+    blue_idx, red_idx = state.slots[blue_slot_idx], state.slots[red_slot_idx]
+
+    # Mu delta and sigma sum of the 4 other roles
+    other_delta = sum(mu[i] for i in state.slots[: len(roles_list)]) - sum(
+        mu[i] for i in state.slots[len(roles_list) :]
+    )
+    other_delta -= mu[blue_idx] - mu[red_idx]
+    other_variance = (
+        state.base_variance + sum(sigma2[i] for i in state.slots) - sigma2[blue_idx] - sigma2[red_idx]
+    )
+
+    best_cost = state.cost
+    best_slots = None
+
+    for blue_idx, red_idx in packed.role_pairs_lists[role_idx]:
+        ratio = abs(other_delta + mu[blue_idx] - mu[red_idx]) / math.sqrt(
+            other_variance + sigma2[blue_idx] + sigma2[red_idx]
+        )
+
+        # Broken constraints only add to the cost, so we only check them on promising pairs
+        if ratio >= best_cost + ratio_tolerance:
+            continue
+
+        slots = state.slots.copy()
+        slots[blue_slot_idx], slots[red_slot_idx] = blue_idx, red_idx
+
+        # The cost is re-computed like the state does, as float errors could otherwise make the descent loop
+        cost = state.get_ratio(slots) + constraint_penalty * state.get_violations(slots)
+
+        if cost < best_cost:
+            best_cost, best_slots = cost, slots
+
+    stats.compositions_evaluated += len(packed.role_pairs_lists[role_idx])
+
+    return best_slots
+
+
+def descend(state: LocalSearchState, rng: random.Random, stats: SearchStats):
+    """
+    Changes the pair of players of one role at a time for the best one, until no role can be improved
+    """
+    improved = True
+
+    while improved:
+        improved = False
+
+        for role_idx in rng.sample(range(len(roles_list)), len(roles_list)):
+            slots = get_best_role_slots(state, role_idx, stats)
+
+            if slots is not None:
+                state.move_to(slots)
+                improved = True
+
+
+def find_best_composition(
+    queue_players: List[QueuePlayerSnapshot],
+    required_queue_player: Optional[QueuePlayerSnapshot] = None,
+    good_enough_score: float = good_enough_score,
+    deadline: Optional[float] = None,
+    stats: Optional[SearchStats] = None,
+) -> Optional[Dict[Tuple[str, str], QueuePlayerSnapshot]]:
+    """
+    Iterated local search on compositions, starting from the oldest players of the queue
+
+    We repeatedly pick the best pair of players for one role given the other ones, until no role can be improved
+        The best composition is then kicked with a few random player changes to get out of this local optimum
+
+    It is not exact, but each step only grows with the number of players per role and it works for any queue size
+    """
+    stats = stats if stats is not None else SearchStats()
+
+    packed = LocalSearchQueue(queue_players, required_queue_player)
+
+    if not all(packed.shape):
+        return None
+
+    # A fixed seed makes matchmaking results reproducible
+    rng = random.Random(0)
+
+    state = LocalSearchState(packed, get_initial_slots(packed))
+
+    best_ratio = math.inf
+    best_slots = None
+
+    # A heuristic search never proves its result is the best one
+    stats.proven_optimal = False
+
+    for _ in range(max_kicks):
+        descend(state, rng, stats)
+
+        if not state.violations and state.ratio < best_ratio:
+            best_ratio, best_slots = state.ratio, state.slots
+
+        if best_slots and abs(0.5 - cdf(best_ratio)) < good_enough_score:
+            break
+
+        if deadline is not None and best_slots and time.monotonic() > deadline:
+            stats.timed_out = True
+            break
+
+        # We escape the local optimum by randomly changing a few players of the best composition
+        slots = best_slots or state.slots
+        for _ in range(kick_size):
+            slots = get_move(packed, slots, rng) or slots
+
+        state.move_to(slots)
+
+    if best_slots is None:
+        return None
+
+    return packed.get_composition(best_slots[: len(roles_list)], best_slots[len(roles_list) :])
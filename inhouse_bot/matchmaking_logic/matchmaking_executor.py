@@ -0,0 +1,255 @@
+import asyncio
+import concurrent.futures
+import functools
+import os
+from typing import Optional, List, Dict, Tuple
+
+from inhouse_bot.database_orm import Game
+from inhouse_bot.game_queue import GameQueue, QueuePlayerSnapshot
+from inhouse_bot.inhouse_logger import inhouse_logger
+from inhouse_bot.matchmaking_logic.find_best_game import (
+    find_best_composition,
+    find_best_compositions,
+    get_game,
+    get_candidate_compositions,
+    candidate_compositions_cache,
+)
+from inhouse_bot.matchmaking_logic.matchmaking_memo import get_memo_key, matchmaking_memos
+from inhouse_bot.matchmaking_logic.server_matchmaking import find_server_compositions
+from inhouse_bot.matchmaking_logic.precomputed_pop import (
+    find_precomputed_composition,
+    get_missing_role,
+    precompute_pop,
+    precomputed_pops,
+)
+
+# Matchmaking runs in a "thread" or "process" pool so it never blocks the bot’s event loop
+#   Processes are not limited by the GIL but have a startup cost and need to pickle the queue snapshot
+executor_type = os.environ.get("INHOUSE_BOT_MATCHMAKING_EXECUTOR") or "thread"
+executor_workers = int(os.environ.get("INHOUSE_BOT_MATCHMAKING_WORKERS") or 1)
+
+# Seconds after which the worker returns the best game it found so far
+time_budget = float(os.environ.get("INHOUSE_BOT_MATCHMAKING_TIMEOUT") or 10)
+
+# Seconds given to the search of each candidate game, computed in the background during ready checks
+candidate_time_budget = float(os.environ.get("INHOUSE_BOT_CANDIDATE_MATCHMAKING_TIMEOUT") or 1)
+
+# Busy channels can pop up to this number of games at once, whose ready checks run at the same time
+max_games_per_pop = int(os.environ.get("INHOUSE_BOT_MAX_GAMES_PER_POP") or 1)
+
+# Searches all the queue channels of a server together, so players queued in multiple channels get one game
+server_wide_matchmaking = bool(os.environ.get("INHOUSE_BOT_SERVER_WIDE_MATCHMAKING"))
+
+# Solvers only check the time budget between steps of the search, so we give up on the worker after this delay
+timeout_grace_period = 5
+
+_executor: Optional[concurrent.futures.Executor] = None
+_background_executor: Optional[concurrent.futures.Executor] = None
+
+
+def create_executor(max_workers: int, thread_name_prefix: str) -> concurrent.futures.Executor:
+    if executor_type == "process":
+        return concurrent.futures.ProcessPoolExecutor(max_workers=max_workers)
+    else:
+        return concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=thread_name_prefix
+        )
+
+
+def get_executor() -> concurrent.futures.Executor:
+    """
+    Creates the matchmaking pool on first use
+    """
+    global _executor
+
+    if _executor is None:
+        _executor = create_executor(executor_workers, "matchmaking")
+
+    return _executor
+
+
+def get_background_executor() -> concurrent.futures.Executor:
+    """
+    Creates the pool of the games computed ahead of time on first use
+
+    It has a single worker of its own, so these searches never delay the matchmaking of other channels
+    """
+    global _background_executor
+
+    if _background_executor is None:
+        _background_executor = create_executor(1, "matchmaking_background")
+
+    return _background_executor
+
+
+async def find_best_game_in_executor(queue: GameQueue, **kwargs) -> Optional[Game]:
+    """
+    Same as find_best_game, but runs the matchmaking logic in the matchmaking pool
+
+    The worker only gets a snapshot of the queue, and the Game object is created back in the calling thread
+    """
+    inhouse_logger.info(f"Matchmaking process started with the following queue:\n{queue}")
+
+    queue_snapshot = queue.get_snapshot()
+
+    # The candidate and precomputed games of a search on the same queue are still valid, so we stop there
+    memo_key = get_memo_key(queue_snapshot, 1, **kwargs)
+
+    if memo_key in matchmaking_memos[queue.channel_id]:
+        inhouse_logger.info("Using the result of a previous search on the same queue")
+        return get_game(queue.queue_players, matchmaking_memos[queue.channel_id][memo_key])
+
+    # Candidates of the previous search could include players who are not in queue anymore
+    candidate_compositions_cache.pop(queue.channel_id, None)
+
+    # If the last player of a queue one player short just joined, the game was mostly computed beforehand
+    composition = find_precomputed_composition(queue.channel_id, queue_snapshot, **kwargs)
+
+    if composition:
+        inhouse_logger.info("Using the game precomputed while the queue was one player short")
+
+    else:
+        future = asyncio.get_event_loop().run_in_executor(
+            get_executor(),
+            functools.partial(find_best_composition, queue_snapshot, time_budget=time_budget, **kwargs),
+        )
+
+        try:
+            composition = await asyncio.wait_for(future, timeout=time_budget + timeout_grace_period)
+        except asyncio.TimeoutError:
+            inhouse_logger.warning(f"Matchmaking did not return after {time_budget + timeout_grace_period}s")
+            return None
+
+    matchmaking_memos[queue.channel_id][memo_key] = composition
+
+    # The next games are computed in the background, while players answer the ready check
+    if composition:
+        asyncio.ensure_future(
+            update_candidate_compositions(queue.channel_id, queue_snapshot, composition, **kwargs)
+        )
+
+    # Or while we wait for the last player
+    elif get_missing_role(queue_snapshot):
+        asyncio.ensure_future(update_precomputed_pop(queue.channel_id, queue_snapshot))
+
+    return get_game(queue.queue_players, composition)
+
+
+async def find_best_games_in_executor(queue: GameQueue, max_games=max_games_per_pop, **kwargs) -> List[Game]:
+    """
+    Same as find_best_game_in_executor, but returns up to max_games disjoint games from the queue
+    """
+    if max_games == 1:
+        game = await find_best_game_in_executor(queue, **kwargs)
+        return [game] if game else []
+
+    inhouse_logger.info(f"Multiple games matchmaking started with the following queue:\n{queue}")
+
+    queue_snapshot = queue.get_snapshot()
+    memo_key = get_memo_key(queue_snapshot, max_games, **kwargs)
+
+    if memo_key in matchmaking_memos[queue.channel_id]:
+        inhouse_logger.info("Using the result of a previous search on the same queue")
+        compositions = matchmaking_memos[queue.channel_id][memo_key]
+
+    else:
+        candidate_compositions_cache.pop(queue.channel_id, None)
+
+        future = asyncio.get_event_loop().run_in_executor(
+            get_executor(),
+            functools.partial(
+                find_best_compositions, queue_snapshot, max_games, time_budget=time_budget, **kwargs
+            ),
+        )
+
+        try:
+            compositions = await asyncio.wait_for(future, timeout=time_budget + timeout_grace_period)
+        except asyncio.TimeoutError:
+            inhouse_logger.warning(f"Matchmaking did not return after {time_budget + timeout_grace_period}s")
+            return []
+
+        matchmaking_memos[queue.channel_id][memo_key] = compositions
+
+    return [get_game(queue.queue_players, composition) for composition in compositions]
+
+
+async def find_server_games_in_executor(
+    queues: Dict[int, GameQueue], max_games=max_games_per_pop, **kwargs
+) -> Dict[int, List[Game]]:
+    """
+    Returns the games of every queue channel of a server, found in a single search of all their queues
+
+    queues is a channel_id -> GameQueue dictionary
+    """
+    for channel_id in queues:
+        candidate_compositions_cache.pop(channel_id, None)
+
+    future = asyncio.get_event_loop().run_in_executor(
+        get_executor(),
+        functools.partial(
+            find_server_compositions,
+            {channel_id: queue.get_snapshot() for channel_id, queue in queues.items()},
+            max_games,
+            time_budget=time_budget,
+            **kwargs,
+        ),
+    )
+
+    try:
+        channels_compositions = await asyncio.wait_for(future, timeout=time_budget + timeout_grace_period)
+    except asyncio.TimeoutError:
+        inhouse_logger.warning(
+            f"Server matchmaking did not return after {time_budget + timeout_grace_period}s"
+        )
+        return {}
+
+    return {
+        channel_id: [get_game(queues[channel_id].queue_players, composition) for composition in compositions]
+        for channel_id, compositions in channels_compositions.items()
+    }
+
+
+async def update_candidate_compositions(
+    channel_id: int,
+    queue_snapshot: List[QueuePlayerSnapshot],
+    composition: Dict[Tuple[str, str], QueuePlayerSnapshot],
+    **kwargs,
+):
+    """
+    Fills the candidate games of the channel with the best game without each player of the composition
+    """
+    future = asyncio.get_event_loop().run_in_executor(
+        get_background_executor(),
+        functools.partial(
+            get_candidate_compositions,
+            queue_snapshot,
+            composition,
+            time_budget=candidate_time_budget,
+            **kwargs,
+        ),
+    )
+
+    try:
+        candidate_compositions_cache[channel_id] = await asyncio.wait_for(
+            future, timeout=len(composition) * candidate_time_budget + timeout_grace_period
+        )
+    except asyncio.TimeoutError:
+        inhouse_logger.warning(f"Candidate games of channel {channel_id} could not be computed in time")
+
+
+async def update_precomputed_pop(channel_id: int, queue_snapshot: List[QueuePlayerSnapshot]):
+    """
+    Precomputes the next game of a channel whose queue is one player short
+    """
+    future = asyncio.get_event_loop().run_in_executor(
+        get_background_executor(), precompute_pop, queue_snapshot
+    )
+
+    try:
+        precomputed_pop = await asyncio.wait_for(future, timeout=time_budget + timeout_grace_period)
+    except asyncio.TimeoutError:
+        inhouse_logger.warning(f"Next game of channel {channel_id} could not be precomputed in time")
+        return
+
+    if precomputed_pop:
+        precomputed_pops[channel_id] = precomputed_pop
@@ -0,0 +1,59 @@
+import os
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Hashable, List, Tuple
+
+from inhouse_bot.game_queue import QueuePlayerSnapshot
+
+# Search results kept per channel, the least recently used ones being dropped first
+memo_size = int(os.environ.get("INHOUSE_BOT_MATCHMAKING_MEMO_SIZE") or 8)
+
+
+def get_queue_fingerprint(queue_snapshot: List[QueuePlayerSnapshot]) -> Tuple:
+    """
+    Everything the search result depends on, in queue order
+    """
+    return tuple(
+        (qp.player_id, qp.role, qp.duo_id, qp.trueskill_mu, qp.trueskill_sigma, qp.role_rank)
+        for qp in queue_snapshot
+    )
+
+
+def get_memo_key(queue_snapshot: List[QueuePlayerSnapshot], max_games: int, **kwargs) -> Tuple:
+    """
+    The search arguments are part of the key, as they can change the result
+    """
+    return max_games, tuple(sorted(kwargs.items())), get_queue_fingerprint(queue_snapshot)
+
+
+class MatchmakingMemo:
+    """
+    The last search results of a channel, keyed by the fingerprint of the queue they were computed on
+
+    Duplicate !queue commands and restarts after a cancelled ready check often search the same queue again,
+        which then gets the stored result without running the solver
+    """
+
+    def __init__(self, size: int = memo_size):
+        self.size = size
+        self.results: OrderedDict = OrderedDict()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.results
+
+    def __getitem__(self, key: Hashable) -> Any:
+        self.results.move_to_end(key)
+        return self.results[key]
+
+    def __setitem__(self, key: Hashable, result: Any):
+        self.results[key] = result
+        self.results.move_to_end(key)
+
+        while len(self.results) > self.size:
+            self.results.popitem(last=False)
+
+    def __len__(self):
+        return len(self.results)
+
+
+# channel_id -> MatchmakingMemo
+matchmaking_memos: Dict[int, MatchmakingMemo] = defaultdict(MatchmakingMemo)
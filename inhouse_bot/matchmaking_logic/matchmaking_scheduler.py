@@ -0,0 +1,85 @@
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from inhouse_bot.inhouse_logger import inhouse_logger
+
+# Seconds without queue changes in a channel before its matchmaking runs, so a burst of !queue is one search
+coalescing_window = float(os.environ.get("INHOUSE_BOT_MATCHMAKING_COALESCING_WINDOW") or 1)
+
+
+class MatchmakingScheduler:
+    """
+    Runs the matchmaking of each channel in a single worker task, so one search or ready check runs at a time
+
+    Queue changes mark the channel dirty with the latest context, and its worker runs the matchmaking
+        once no other change came during the coalescing window
+    Changes made while the matchmaking runs mark the channel dirty again, and it runs once more afterwards
+    """
+
+    def __init__(
+        self,
+        run_matchmaking: Callable[[Any], Awaitable],
+        coalescing_window: float = coalescing_window,
+    ):
+        self.run_matchmaking = run_matchmaking
+        self.coalescing_window = coalescing_window
+
+        # channel_id -> context of the last queue change, only for channels that need a new matchmaking
+        self.dirty_channels: Dict[int, Any] = {}
+
+        # channel_id -> event loop time of the last queue change
+        self.last_change: Dict[int, float] = {}
+
+        # channel_id -> worker task
+        self.workers: Dict[int, asyncio.Task] = {}
+
+    def mark_dirty(self, channel_id: int, ctx: Any):
+        """
+        Schedules a matchmaking run in this channel, starting its worker if it is not running
+        """
+        self.dirty_channels[channel_id] = ctx
+        self.last_change[channel_id] = asyncio.get_event_loop().time()
+
+        if channel_id not in self.workers:
+            self.workers[channel_id] = asyncio.ensure_future(self.run_worker(channel_id))
+
+    def is_running(self, channel_id: int) -> bool:
+        return channel_id in self.workers
+
+    async def run_worker(self, channel_id: int):
+        try:
+            while channel_id in self.dirty_channels:
+                await self.wait_for_quiet_channel(channel_id)
+
+                ctx = self.dirty_channels.pop(channel_id)
+
+                # We catch every error here so one bad run does not stop the channel’s matchmaking
+                try:
+                    await self.run_matchmaking(ctx)
+                except Exception as e:
+                    inhouse_logger.error(f"Matchmaking failed in channel {channel_id}: {e}")
+
+        finally:
+            del self.workers[channel_id]
+            self.last_change.pop(channel_id, None)
+
+    async def wait_for_quiet_channel(self, channel_id: int):
+        """
+        Waits until no queue change happened in the channel for the coalescing window
+        """
+        loop = asyncio.get_event_loop()
+
+        while (remaining := self.last_change[channel_id] + self.coalescing_window - loop.time()) > 0:
+            await asyncio.sleep(remaining)
+
+    async def wait_until_idle(self, channel_id: Optional[int] = None):
+        """
+        Waits until the worker of this channel, or of all channels, is done
+        """
+        while workers := [
+            worker
+            for worker_channel_id, worker in self.workers.items()
+            if channel_id in (None, worker_channel_id)
+        ]:
+            await asyncio.gather(*workers, return_exceptions=True)
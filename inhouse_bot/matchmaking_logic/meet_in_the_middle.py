@@ -0,0 +1,253 @@
+import bisect
+import math
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from inhouse_bot.game_queue import QueuePlayerSnapshot
+from inhouse_bot.common_utils.fields import roles_list
+from inhouse_bot.matchmaking_logic.evaluate_game import beta_squared, cdf
+from inhouse_bot.matchmaking_logic.search_stats import SearchStats
+from inhouse_bot.matchmaking_logic.vectorized_search import PackedQueue, get_priority_order, good_enough_score
+
+# The 2 roles of the first half are matched against the 3 roles of the second half
+first_half_roles = (0, 1)
+second_half_roles = (2, 3, 4)
+
+# Bitmasks fit in int64 arrays up to this number of players, else we fall back to Python integers
+max_int64_bits = 62
+
+
+class HalfCompositions:
+    """
+    All valid blue/red assignments of a subset of roles, with their partial mu delta and sigma² sum
+
+    Players who could break the distinct players or duo constraints get one bit in the side masks
+    """
+
+    array_attributes = ("blue", "red", "blue_mask", "red_mask", "blue_duos", "red_duos", "delta", "sum_sigma")
+
+    def __init__(
+        self, packed: PackedQueue, role_indices: Sequence[int], bits: np.ndarray, duo_bits: np.ndarray
+    ):
+        shape = tuple(packed.shape[r] for r in role_indices)
+
+        pair_indices = np.unravel_index(np.arange(math.prod(shape)), shape)
+
+        self.blue = np.stack(
+            [packed.role_pairs[r][idx, 0] for r, idx in zip(role_indices, pair_indices)], axis=1
+        )
+        self.red = np.stack(
+            [packed.role_pairs[r][idx, 1] for r, idx in zip(role_indices, pair_indices)], axis=1
+        )
+
+        zeros = np.zeros(len(self.blue), dtype=bits.dtype)
+        self.blue_mask, self.red_mask = zeros.copy(), zeros.copy()
+        self.blue_duos, self.red_duos = zeros.copy(), zeros.copy()
+        conflict = np.zeros(len(self.blue), dtype=bool)
+
+        for side_mask, side_duos, side in (
+            (self.blue_mask, self.blue_duos, self.blue),
+            (self.red_mask, self.red_duos, self.red),
+        ):
+            for slot in range(side.shape[1]):
+                slot_bits = bits[side[:, slot]]
+
+                # A player already seen in another slot of the half
+                conflict |= ((self.blue_mask | self.red_mask) & slot_bits) != 0
+
+                side_mask |= slot_bits
+                side_duos |= duo_bits[side[:, slot]]
+
+        # Duos split between blue and red inside the half are dropped right away
+        valid = ~conflict & ((self.blue_duos & self.red_mask) == 0) & ((self.red_duos & self.blue_mask) == 0)
+
+        self.blue, self.red = self.blue[valid], self.red[valid]
+        self.blue_mask, self.red_mask = self.blue_mask[valid], self.red_mask[valid]
+        self.blue_duos, self.red_duos = self.blue_duos[valid], self.red_duos[valid]
+
+        self.delta = (packed.mu[self.blue] - packed.mu[self.red]).sum(axis=1)
+        self.sum_sigma = (packed.sigma2[self.blue] + packed.sigma2[self.red]).sum(axis=1)
+
+    def __len__(self):
+        return len(self.delta)
+
+    def sort_by_delta(self):
+        order = np.argsort(self.delta, kind="stable")
+
+        for attribute in self.array_attributes:
+            setattr(self, attribute, getattr(self, attribute)[order])
+
+
+def get_constraint_bits(packed: PackedQueue) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the bit of every queue player and the bit of its duo, 0 for players who cannot break a constraint
+    """
+    role_counts = {}
+    for player_id in packed.player_ids.tolist():
+        role_counts[player_id] = role_counts.get(player_id, 0) + 1
+
+    # Players queued in multiple roles and duo partners are the only ones we need to track
+    tracked_ids = sorted(
+        {player_id for player_id, count in role_counts.items() if count > 1}
+        | {
+            player_id
+            for player_id, duo_id in zip(packed.player_ids.tolist(), packed.duo_ids.tolist())
+            if duo_id >= 0
+        }
+        | {duo_id for duo_id in packed.duo_ids.tolist() if duo_id >= 0}
+    )
+    bit_positions = {player_id: position for position, player_id in enumerate(tracked_ids)}
+
+    dtype = np.int64 if len(tracked_ids) <= max_int64_bits else object
+
+    bits = np.array(
+        [1 << bit_positions[i] if i in bit_positions else 0 for i in packed.player_ids.tolist()], dtype=dtype
+    )
+    duo_bits = np.array(
+        [1 << bit_positions[i] if i >= 0 else 0 for i in packed.duo_ids.tolist()], dtype=dtype
+    )
+
+    return bits, duo_bits
+
+
+def find_best_composition(
+    queue_players: List[QueuePlayerSnapshot],
+    required_queue_player: Optional[QueuePlayerSnapshot] = None,
+    good_enough_score: float = good_enough_score,
+    deadline: Optional[float] = None,
+    stats: Optional[SearchStats] = None,
+) -> Optional[Dict[Tuple[str, str], QueuePlayerSnapshot]]:
+    """
+    Exact search of the most balanced composition, without enumerating the full product of roles
+
+    Blue expected winrate only depends on |blue mu - red mu| / sqrt(10 * BETA² + sum of sigma²)
+        For each first half assignment, we walk the second half sorted by delta from the ideal -delta outwards
+        The walk stops once the delta alone, with the highest possible sigma sum, cannot beat the best game
+
+    As the most promising compositions come first, a time.monotonic() deadline gives a good game early
+    """
+    stats = stats if stats is not None else SearchStats()
+
+    packed = PackedQueue(queue_players, required_queue_player)
+
+    if not all(packed.shape):
+        return None
+
+    bits, duo_bits = get_constraint_bits(packed)
+
+    first_half = HalfCompositions(packed, first_half_roles, bits, duo_bits)
+    second_half = HalfCompositions(packed, second_half_roles, bits, duo_bits)
+
+    if not len(first_half) or not len(second_half):
+        return None
+
+    second_half.sort_by_delta()
+
+    # Python lists are much faster than numpy arrays for scalar access
+    second_delta = second_half.delta.tolist()
+    second_sigma = second_half.sum_sigma.tolist()
+    second_masks = list(
+        zip(
+            second_half.blue_mask.tolist(),
+            second_half.red_mask.tolist(),
+            second_half.blue_duos.tolist(),
+            second_half.red_duos.tolist(),
+        )
+    )
+    second_max_sigma = max(second_sigma)
+
+    size = 2 * len(roles_list)
+    base_variance = size * beta_squared
+
+    # The winrate only depends on this ratio, so we simply minimize it
+    best_ratio = math.inf
+    best_pair = None
+
+    # Starting with the most balanced first halves finds good games earlier, which prunes more
+    #   First halves with close deltas are ordered by age, so a deadline favors older players
+    first_half_order = get_priority_order(first_half.blue, first_half.red, first_half.delta)
+
+    compositions_evaluated = 0
+
+    for first_idx in first_half_order.tolist():
+        if deadline is not None and best_pair is not None and time.monotonic() > deadline:
+            stats.timed_out, stats.proven_optimal = True, False
+            break
+
+        first_delta = float(first_half.delta[first_idx])
+        first_sigma = float(first_half.sum_sigma[first_idx])
+        first_blue_mask, first_red_mask, first_blue_duos, first_red_duos = (
+            int(first_half.blue_mask[first_idx]),
+            int(first_half.red_mask[first_idx]),
+            int(first_half.blue_duos[first_idx]),
+            int(first_half.red_duos[first_idx]),
+        )
+
+        # Highest possible denominator with this first half, which gives the lowest possible ratio for a delta
+        max_denominator = math.sqrt(base_variance + first_sigma + second_max_sigma)
+
+        right = bisect.bisect_left(second_delta, -first_delta)
+        left = right - 1
+
+        while left >= 0 or right < len(second_delta):
+            left_gap = abs(first_delta + second_delta[left]) if left >= 0 else math.inf
+            right_gap = abs(first_delta + second_delta[right]) if right < len(second_delta) else math.inf
+
+            if left_gap <= right_gap:
+                gap, second_idx = left_gap, left
+                left -= 1
+            else:
+                gap, second_idx = right_gap, right
+                right += 1
+
+            # Every next second half has a higher delta gap, so none of them can beat the best game
+            if gap / max_denominator >= best_ratio:
+                break
+
+            compositions_evaluated += 1
+
+            blue_mask, red_mask, blue_duos, red_duos = second_masks[second_idx]
+
+            # Same player on both halves
+            if (first_blue_mask | first_red_mask) & (blue_mask | red_mask):
+                continue
+
+            # Duos have to end up on the same side
+            if (first_blue_duos | blue_duos) & ~(first_blue_mask | blue_mask) or (
+                first_red_duos | red_duos
+            ) & ~(first_red_mask | red_mask):
+                continue
+
+            ratio = gap / math.sqrt(base_variance + first_sigma + second_sigma[second_idx])
+
+            if ratio < best_ratio:
+                best_ratio = ratio
+                best_pair = first_idx, second_idx
+
+        if best_pair and abs(0.5 - cdf(best_ratio)) < good_enough_score:
+            stats.proven_optimal = False
+            break
+
+    stats.compositions_evaluated += compositions_evaluated
+
+    if best_pair is None:
+        return None
+
+    first_idx, second_idx = best_pair
+
+    # Putting the roles back in order
+    blue = np.empty(len(roles_list), dtype=np.intp)
+    red = np.empty(len(roles_list), dtype=np.intp)
+
+    blue[list(first_half_roles)], red[list(first_half_roles)] = (
+        first_half.blue[first_idx],
+        first_half.red[first_idx],
+    )
+    blue[list(second_half_roles)], red[list(second_half_roles)] = (
+        second_half.blue[second_idx],
+        second_half.red[second_idx],
+    )
+
+    return packed.get_composition(blue, red)
@@ -0,0 +1,231 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from inhouse_bot.game_queue import QueuePlayerSnapshot
+from inhouse_bot.common_utils.fields import roles_list
+from inhouse_bot.matchmaking_logic.evaluate_game import beta_squared, get_rating_floats
+from inhouse_bot.matchmaking_logic.find_best_game import get_matchmaking_score
+from inhouse_bot.matchmaking_logic.vectorized_search import PackedQueue, get_chunks
+
+# Above this number of compositions, the sums of the fixed players would take too much memory to be kept
+max_precomputed_compositions = 2 ** 20
+
+# Stands for the player who will fill the queue, as Discord IDs are positive and -1 means no duo
+filler_player_id = -2
+
+# Queues one player short, precomputed while waiting for the last player
+#   channel_id -> PrecomputedPop
+precomputed_pops: Dict[int, "PrecomputedPop"] = {}
+
+
+def get_missing_role(queue_snapshot: List[QueuePlayerSnapshot]) -> Optional[str]:
+    """
+    Returns the role of the only missing player if every other role already has enough players for a game
+    """
+    role_counts = {role: 0 for role in roles_list}
+
+    for qp in queue_snapshot:
+        role_counts[qp.role] += 1
+
+    short_roles = [role for role, count in role_counts.items() if count < 2]
+
+    if len(short_roles) == 1 and role_counts[short_roles[0]] == 1:
+        return short_roles[0]
+
+    return None
+
+
+class PrecomputedPop:
+    """
+    Every composition of a queue one player short, with a filler slot for the player who will complete it
+
+    The filler’s role only has 2 players, so it is in every game of the full queue
+
+    We keep each composition’s mu delta seen from the filler’s side, its sigma² sum without the filler,
+        and the queue position of its newest fixed player
+    Once the filler is known, this gives the score of every composition and the number of oldest players it
+        needs, which is all find_best_composition looks at
+    """
+
+    def __init__(self, queue_snapshot: List[QueuePlayerSnapshot], missing_role: str):
+        self.queue_snapshot = queue_snapshot
+        self.missing_role = missing_role
+
+        # The placeholder rating is not used, as the filler counts as 0 in the sums
+        self.filler = QueuePlayerSnapshot(filler_player_id, missing_role, None, 25, 25 / 3)
+
+        self.packed = PackedQueue(queue_snapshot + [self.filler], self.filler)
+
+        self.flat_indices = np.empty(0, dtype=np.int64)
+        self.filler_delta = np.empty(0, dtype=np.float64)
+        self.sum_sigma = np.empty(0, dtype=np.float64)
+        self.newest_position = np.empty(0, dtype=np.int64)
+
+    @property
+    def compositions_count(self) -> int:
+        return self.packed.compositions_count if all(self.packed.shape) else 0
+
+    def precompute(self):
+        """
+        Computes the sums of every composition, by batches like the vectorized search
+        """
+        filler_idx = len(self.queue_snapshot)
+        role_idx = roles_list.index(self.missing_role)
+
+        mu, sigma2 = self.packed.mu.copy(), self.packed.sigma2.copy()
+        mu[filler_idx], sigma2[filler_idx] = 0, 0
+
+        flat_indices, filler_delta, sum_sigma, newest_position = [], [], [], []
+
+        for start, end in get_chunks(self.compositions_count):
+            chunk_indices = np.arange(start, end)
+            blue, red = self.packed.get_sides(chunk_indices)
+
+            valid = self.packed.get_valid(blue, red)
+            chunk_indices, blue, red = chunk_indices[valid], blue[valid], red[valid]
+
+            delta = (mu[blue] - mu[red]).sum(axis=1)
+
+            flat_indices.append(chunk_indices)
+            filler_delta.append(np.where(blue[:, role_idx] == filler_idx, delta, -delta))
+            sum_sigma.append((sigma2[blue] + sigma2[red]).sum(axis=1))
+
+            # Indices of the packed queue are queue positions, and the filler is not placed yet
+            sides = np.concatenate((blue, red), axis=1)
+            newest_position.append(np.where(sides == filler_idx, -1, sides).max(axis=1))
+
+        if not flat_indices:
+            return
+
+        self.flat_indices = np.concatenate(flat_indices)
+        self.filler_delta = np.concatenate(filler_delta)
+        self.sum_sigma = np.concatenate(sum_sigma)
+        self.newest_position = np.concatenate(newest_position)
+
+    def get_filler(self, queue_snapshot: List[QueuePlayerSnapshot]) -> Optional[QueuePlayerSnapshot]:
+        """
+        Returns the new player if the queue is the precomputed one with only this player added
+
+        The other players have to keep their order, as the filler is only inserted among them
+        """
+        if len(queue_snapshot) != len(self.queue_snapshot) + 1:
+            return None
+
+        # Rows of the precomputed players have to be the same, as their ratings and duos are in the sums
+        precomputed_queue_players = {qp.key: qp for qp in self.queue_snapshot}
+        new_queue_players = [qp for qp in queue_snapshot if precomputed_queue_players.get(qp.key) != qp]
+
+        if len(new_queue_players) != 1:
+            return None
+
+        filler = new_queue_players[0]
+
+        if [qp for qp in queue_snapshot if qp is not filler] != self.queue_snapshot:
+            return None
+
+        # A new duo or a player queuing for a second role changes the precomputed compositions
+        if (
+            filler.role != self.missing_role
+            or filler.duo_id is not None
+            or any(qp.player_id == filler.player_id for qp in self.queue_snapshot)
+        ):
+            return None
+
+        return filler
+
+    def complete(
+        self, queue_snapshot: List[QueuePlayerSnapshot], game_quality_threshold=0.1
+    ) -> Optional[Dict[Tuple[str, str], QueuePlayerSnapshot]]:
+        """
+        Returns the composition find_best_composition would return on the full queue, or None if it is not
+            the precomputed one
+
+        Like find_best_composition, we only look at newer players while the game is above the threshold
+        """
+        filler = self.get_filler(queue_snapshot)
+
+        if filler is None or not len(self.filler_delta):
+            return None
+
+        filler_mu, filler_sigma2 = get_rating_floats(filler.trueskill_mu, filler.trueskill_sigma)
+
+        # The matchmaking score only grows with the absolute value of this ratio
+        ratios = np.abs(filler_mu + self.filler_delta) / np.sqrt(
+            2 * len(roles_list) * beta_squared + filler_sigma2 + self.sum_sigma
+        )
+
+        # Each composition first appears when its newest player is reached, and all include the filler
+        filler_position = next(idx for idx, qp in enumerate(queue_snapshot) if qp is filler)
+
+        newest_position = np.maximum(
+            self.newest_position + (self.newest_position >= filler_position), filler_position
+        )
+
+        # The best composition of each number of oldest players, from the smallest number
+        order = np.lexsort((ratios, newest_position))
+        sorted_positions = newest_position[order]
+        thresholds_best = order[np.flatnonzero(np.r_[True, sorted_positions[1:] != sorted_positions[:-1]])]
+
+        best_composition, best_ratio, best_score = None, None, None
+
+        for idx in thresholds_best:
+            if best_composition is None or ratios[idx] < best_ratio:
+                best_composition, best_ratio = self.get_composition(idx, filler), ratios[idx]
+                best_score = get_matchmaking_score(best_composition)
+
+            if best_score < game_quality_threshold:
+                break
+
+        return best_composition
+
+    def get_composition(
+        self, idx: int, filler: QueuePlayerSnapshot
+    ) -> Dict[Tuple[str, str], QueuePlayerSnapshot]:
+        blue, red = self.packed.get_sides(self.flat_indices[idx : idx + 1])
+
+        return {
+            key: filler if qp is self.filler else qp
+            for key, qp in self.packed.get_composition(blue[0], red[0]).items()
+        }
+
+
+def precompute_pop(queue_snapshot: List[QueuePlayerSnapshot]) -> Optional[PrecomputedPop]:
+    """
+    Precomputes the next game of a queue one player short
+
+    Returns None if it is not one player short, is too big, or has players queued for several roles
+    """
+    # The roles of flex players are assigned on the full queue and can change with the last player
+    if len({qp.player_id for qp in queue_snapshot}) < len(queue_snapshot):
+        return None
+
+    missing_role = get_missing_role(queue_snapshot)
+
+    if missing_role is None:
+        return None
+
+    precomputed_pop = PrecomputedPop(queue_snapshot, missing_role)
+
+    if (
+        not precomputed_pop.compositions_count
+        or precomputed_pop.compositions_count > max_precomputed_compositions
+    ):
+        return None
+
+    precomputed_pop.precompute()
+
+    return precomputed_pop
+
+
+def find_precomputed_composition(
+    channel_id: int, queue_snapshot: List[QueuePlayerSnapshot], game_quality_threshold=0.1, **kwargs
+) -> Optional[Dict[Tuple[str, str], QueuePlayerSnapshot]]:
+    """
+    Completes the game precomputed in this channel with its last player, if the queue only changed by them
+
+    Other find_best_composition arguments are accepted, but exact solvers all give the same game
+    """
+    precomputed_pop = precomputed_pops.pop(channel_id, None)
+
+    return precomputed_pop.complete(queue_snapshot, game_quality_threshold) if precomputed_pop else None
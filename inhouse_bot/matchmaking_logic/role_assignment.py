@@ -0,0 +1,150 @@
+import math
+from collections import defaultdict
+from typing import Dict, List
+
+from inhouse_bot.game_queue import QueuePlayerSnapshot
+from inhouse_bot.common_utils.fields import roles_list
+
+
+def solve_assignment(costs: List[List[float]]) -> List[int]:
+    """
+    Hungarian algorithm, returns the column assigned to each row for the lowest total cost
+
+    There have to be at least as many columns as rows, and math.inf marks forbidden assignments
+        Each row needs enough allowed columns for a full assignment to exist
+    """
+    rows_count, columns_count = len(costs), len(costs[0])
+
+    # Potentials and matching are 1-indexed, column 0 being the row we are currently adding
+    row_potentials = [0.0] * (rows_count + 1)
+    column_potentials = [0.0] * (columns_count + 1)
+    column_rows = [0] * (columns_count + 1)
+    previous_columns = [0] * (columns_count + 1)
+
+    for row in range(1, rows_count + 1):
+        column_rows[0] = row
+        current_column = 0
+
+        min_slacks = [math.inf] * (columns_count + 1)
+        visited = [False] * (columns_count + 1)
+
+        # We grow a tree of tight edges from the new row until it reaches a free column
+        while column_rows[current_column]:
+            visited[current_column] = True
+            current_row = column_rows[current_column]
+
+            delta, next_column = math.inf, None
+
+            for column in range(1, columns_count + 1):
+                if visited[column]:
+                    continue
+
+                slack = (
+                    costs[current_row - 1][column - 1]
+                    - row_potentials[current_row]
+                    - column_potentials[column]
+                )
+
+                if slack < min_slacks[column]:
+                    min_slacks[column], previous_columns[column] = slack, current_column
+
+                if min_slacks[column] < delta:
+                    delta, next_column = min_slacks[column], column
+
+            for column in range(columns_count + 1):
+                if visited[column]:
+                    row_potentials[column_rows[column]] += delta
+                    column_potentials[column] -= delta
+                else:
+                    min_slacks[column] -= delta
+
+            current_column = next_column
+
+        # We flip the matching along the path we found
+        while current_column:
+            previous_column = previous_columns[current_column]
+            column_rows[current_column] = column_rows[previous_column]
+            current_column = previous_column
+
+    assignment = [0] * rows_count
+
+    for column in range(1, columns_count + 1):
+        if column_rows[column]:
+            assignment[column_rows[column] - 1] = column - 1
+
+    return assignment
+
+
+def assign_roles(queue_snapshot: List[QueuePlayerSnapshot]) -> List[QueuePlayerSnapshot]:
+    """
+    Keeps a single role for flex players, so the search does not multiply the compositions with their roles
+
+    Flex players are the ones whose rows all have a role rank, as given by !flex and !fill
+        Other players with several rows, who queued for each role separately, are left to the search
+
+    Roles are filled one game at a time: a player only goes to a role with 2n players or more if none of his
+        roles has less, which makes games pop as soon as possible
+    Between roles which are needed as much, players get their favorite one, older players having priority
+
+    The flex player takes the place of his oldest row in the queue, so he keeps his age in matchmaking
+    """
+    players_roles: Dict[int, List[QueuePlayerSnapshot]] = defaultdict(list)
+
+    for qp in queue_snapshot:
+        players_roles[qp.player_id].append(qp)
+
+    # Players are ordered by age, as dictionaries keep insertion order
+    flex_players = [
+        queue_players
+        for queue_players in players_roles.values()
+        if len(queue_players) > 1 and all(qp.role_rank is not None for qp in queue_players)
+    ]
+
+    if not flex_players:
+        return queue_snapshot
+
+    flex_player_ids = {queue_players[0].player_id for queue_players in flex_players}
+
+    # Players queued for a single role are already assigned
+    fixed_counts = {role: 0 for role in roles_list}
+
+    for queue_players in players_roles.values():
+        if len(queue_players) == 1:
+            fixed_counts[queue_players[0].role] += 1
+
+    # Each role gets one column per flex player, after the players already in it
+    #   The n-th player of a role is needed for game n // 2, and roles are filled one game at a time
+    columns = [
+        (role, (fixed_counts[role] + slot) // 2) for role in roles_list for slot in range(len(flex_players))
+    ]
+
+    # Preference costs of all flex players always stay below the cost of a single game level
+    #   Older players count more, so they get their favorite roles first
+    max_rank = max(qp.role_rank for queue_players in flex_players for qp in queue_players)
+    game_level_cost = max_rank * len(flex_players) ** 2 + 1
+
+    costs = []
+
+    for age_idx, queue_players in enumerate(flex_players):
+        player_roles = {qp.role: qp for qp in queue_players}
+
+        costs.append(
+            [
+                game_level * game_level_cost
+                + player_roles[role].role_rank * (len(flex_players) - age_idx)
+                if role in player_roles
+                else math.inf
+                for role, game_level in columns
+            ]
+        )
+
+    assigned_queue_players = {
+        queue_players[0].player_id: next(qp for qp in queue_players if qp.role == columns[column][0])
+        for queue_players, column in zip(flex_players, solve_assignment(costs))
+    }
+
+    return [
+        assigned_queue_players.get(qp.player_id, qp)
+        for qp in queue_snapshot
+        if qp.player_id not in flex_player_ids or qp is players_roles[qp.player_id][0]
+    ]
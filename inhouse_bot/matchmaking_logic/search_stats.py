@@ -0,0 +1,22 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class SearchStats:
+    """
+    What a matchmaking search went through, filled by the solvers as they go
+
+    proven_optimal means the search did not stop early, either on a good enough game or on the deadline
+        so no composition of the players it looked at is more balanced than the one it returned
+    """
+
+    compositions_evaluated: int = 0
+    proven_optimal: bool = True
+    timed_out: bool = False
+    elapsed: float = 0.0
+
+    def __str__(self):
+        return (
+            f"{self.compositions_evaluated} compositions evaluated in {self.elapsed*1000:.0f}ms"
+            f"{', timed out' if self.timed_out else ''}{', proven optimal' if self.proven_optimal else ''}"
+        )
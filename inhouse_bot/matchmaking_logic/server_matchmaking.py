@@ -0,0 +1,99 @@
+import time
+from typing import Dict, List, Optional, Tuple
+
+from inhouse_bot.game_queue import QueuePlayerSnapshot
+from inhouse_bot.inhouse_logger import inhouse_logger
+from inhouse_bot.matchmaking_logic.find_best_game import (
+    find_best_composition,
+    get_matchmaking_score,
+    get_remaining_queue_players,
+)
+from inhouse_bot.matchmaking_logic.search_stats import SearchStats
+
+
+def find_server_compositions(
+    channels_snapshots: Dict[int, List[QueuePlayerSnapshot]],
+    max_games_per_channel=1,
+    game_quality_threshold=0.1,
+    solver="auto",
+    time_budget: Optional[float] = None,
+    stats: Optional[SearchStats] = None,
+) -> Dict[int, List[Dict[Tuple[str, str], QueuePlayerSnapshot]]]:
+    """
+    Assigns each player to at most one game across all the queue channels of a server, in a single pass
+
+    We look for the best game of every channel, keep the most balanced one and drop its players from all channels
+        Only the channels which shared players with it are searched again, until no channel has a game left
+
+    Like with find_best_compositions, only the first game of a channel can be above game_quality_threshold
+    """
+    start_time = time.monotonic()
+
+    remaining_snapshots = dict(channels_snapshots)
+    channels_compositions = {channel_id: [] for channel_id in channels_snapshots}
+
+    # channel_id -> best composition of its remaining players, only for channels that can still pop a game
+    best_compositions = {}
+    channels_to_search = set(channels_snapshots)
+
+    while True:
+        for channel_id in channels_to_search:
+            remaining_budget = (
+                max(time_budget - (time.monotonic() - start_time), 0) if time_budget is not None else None
+            )
+
+            composition = find_best_composition(
+                remaining_snapshots[channel_id],
+                game_quality_threshold=game_quality_threshold,
+                solver=solver,
+                time_budget=remaining_budget,
+                stats=stats,
+            )
+
+            if composition and (
+                not channels_compositions[channel_id]
+                or get_matchmaking_score(composition) < game_quality_threshold
+            ):
+                best_compositions[channel_id] = composition
+            else:
+                best_compositions.pop(channel_id, None)
+
+        if not best_compositions:
+            break
+
+        channel_id, composition = min(
+            best_compositions.items(), key=lambda item: get_matchmaking_score(item[1])
+        )
+
+        channels_compositions[channel_id].append(composition)
+        del best_compositions[channel_id]
+
+        player_ids = {qp.player_id for qp in composition.values()}
+
+        # Players of the game can also be queued in other channels, whose best games have to be searched again
+        channels_to_search = {
+            other_channel_id
+            for other_channel_id, snapshot in remaining_snapshots.items()
+            if any(qp.player_id in player_ids for qp in snapshot)
+            and len(channels_compositions[other_channel_id]) < max_games_per_channel
+        }
+
+        for other_channel_id, snapshot in remaining_snapshots.items():
+            remaining_snapshots[other_channel_id] = get_remaining_queue_players(snapshot, player_ids)
+
+        # The channel which just got a game can only stop there, or pop its next one
+        if len(channels_compositions[channel_id]) >= max_games_per_channel:
+            channels_to_search.discard(channel_id)
+
+        for other_channel_id in channels_to_search:
+            best_compositions.pop(other_channel_id, None)
+
+    if stats is not None:
+        stats.elapsed = time.monotonic() - start_time
+
+    inhouse_logger.info(
+        f"Server matchmaking done: {sum(len(c) for c in channels_compositions.values())} games "
+        f"in {len(channels_snapshots)} channels"
+    )
+
+    return channels_compositions
@@ -0,0 +1,369 @@
+import itertools
+import math
+import time
+from functools import cached_property
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from inhouse_bot.game_queue import QueuePlayerSnapshot
+from inhouse_bot.common_utils.fields import roles_list
+from inhouse_bot.matchmaking_logic.evaluate_game import evaluate_games, get_blue_winrate, get_rating_floats
+from inhouse_bot.matchmaking_logic.search_stats import SearchStats
+
+# Number of team compositions scored in a single batch, which bounds the memory used by the search
+#   Batches start small and grow, as the search often stops early on a good enough game
+min_chunk_size = 2 ** 10
+max_chunk_size = 2 ** 16
+
+# If the game is seen as being below 51% winrate for one side, we simply stop there (helps with big lists)
+good_enough_score = 0.01
+
+# Array scores this close to the best one are re-computed with Python floats to exactly match evaluate_game
+score_tolerance = 1e-12
+
+# Partial mu deltas in the same bucket are seen as equally balanced, so older players come first
+#   Good enough games have a full mu delta below 0.4 to 0.7, so partial deltas are compared coarsely
+delta_bucket_size = 1.0
+
+
+def get_priority_order(blue: np.ndarray, red: np.ndarray, delta: np.ndarray) -> np.ndarray:
+    """
+    Orders partial assignments from the most promising one, by bucketed |mu delta| then by age
+
+    The age of an assignment is the queue index of its newest player, as queue players are ordered by age
+    """
+    age = np.maximum(blue.max(axis=1), red.max(axis=1))
+
+    return np.lexsort((age, np.floor(np.abs(delta) / delta_bucket_size)))
+
+
+class PackedQueue:
+    """
+    The ratings and duo links of a list of queue players, packed in arrays once per search
+
+    Every role gets an array of its 2-players permutations, with the blue player index first
+    The first role only gets combinations, as a full blue/red -> red/blue mirror has the same score
+    If required_queue_player is given, only compositions including this queue player are considered
+    """
+
+    def __init__(
+        self,
+        queue_players: List[QueuePlayerSnapshot],
+        required_queue_player: Optional[QueuePlayerSnapshot] = None,
+    ):
+        self.queue_players = queue_players
+
+        # Python floats are kept for the exact scalar evaluation of the best candidates
+        ratings = [get_rating_floats(qp.trueskill_mu, qp.trueskill_sigma) for qp in queue_players]
+
+        self.mu_list = [mu for mu, sigma2 in ratings]
+        self.sigma2_list = [sigma2 for mu, sigma2 in ratings]
+
+        self.mu = np.array(self.mu_list, dtype=np.float64)
+        self.sigma2 = np.array(self.sigma2_list, dtype=np.float64)
+
+        # Discord IDs are positive, so -1 is used for players without a duo
+        self.player_ids = np.array([qp.player_id for qp in queue_players], dtype=np.int64)
+        self.duo_ids = np.array(
+            [qp.duo_id if qp.duo_id is not None else -1 for qp in queue_players], dtype=np.int64
+        )
+        self.role_indices = np.array([roles_list.index(qp.role) for qp in queue_players], dtype=np.intp)
+
+        # Only players queued for multiple roles can appear twice in a composition
+        self.has_multiple_roles_players = len(set(self.player_ids.tolist())) < len(queue_players)
+
+        # Same order as itertools.permutations, which keeps the brute-force tie-breaking
+        self.role_pairs = [
+            np.array(
+                list(itertools.permutations([i for i, qp in enumerate(queue_players) if qp.role == role], 2)),
+                dtype=np.intp,
+            ).reshape(-1, 2)
+            for role in roles_list
+        ]
+
+        # We fix the orientation of the first role to only keep one of the two mirrored compositions
+        #   Sides are randomized once, on the chosen game
+        first_role_pairs = self.role_pairs[0]
+        self.role_pairs[0] = first_role_pairs[first_role_pairs[:, 0] < first_role_pairs[:, 1]]
+
+        # The required player’s role only keeps the pairs it is part of
+        if required_queue_player is not None:
+            required_idx = next(i for i, qp in enumerate(queue_players) if qp is required_queue_player)
+            role_idx = roles_list.index(required_queue_player.role)
+
+            role_pairs = self.role_pairs[role_idx]
+            self.role_pairs[role_idx] = role_pairs[(role_pairs == required_idx).any(axis=1)]
+
+        self.shape = tuple(len(pairs) for pairs in self.role_pairs)
+
+    @cached_property
+    def units(self) -> List[Tuple[List[int], np.ndarray, np.ndarray]]:
+        """
+        Roles linked by a duo are enumerated together, and only keep assignments with duos on the same side
+            Compositions breaking a duo are therefore never generated
+
+        Each unit is a (role indices, blue queue player indices, red queue player indices) tuple
+        """
+        return [self.get_unit(roles_group) for roles_group in self.get_duo_roles_groups()]
+
+    @property
+    def units_shape(self) -> Tuple[int, ...]:
+        return tuple(len(unit_blue) for roles_group, unit_blue, unit_red in self.units)
+
+    @property
+    def compositions_count(self) -> int:
+        return math.prod(self.units_shape)
+
+    def sort_units_by_priority(self):
+        """
+        Orders the assignments of each unit from the most promising one, see get_priority_order
+        """
+        units = []
+
+        for roles_group, unit_blue, unit_red in self.units:
+            delta = self.mu[unit_blue].sum(axis=1) - self.mu[unit_red].sum(axis=1)
+            order = get_priority_order(unit_blue, unit_red, delta)
+
+            units.append((roles_group, unit_blue[order], unit_red[order]))
+
+        self.units = units
+
+    def get_duo_roles_groups(self) -> List[List[int]]:
+        """
+        Groups roles linked by a duo, which is the role of the duo and all the roles its partner queues for
+        """
+        groups = [{role_idx} for role_idx in range(len(roles_list))]
+
+        for queue_player_idx in np.flatnonzero(self.duo_ids >= 0):
+            linked_roles = {self.role_indices[queue_player_idx]} | set(
+                self.role_indices[self.player_ids == self.duo_ids[queue_player_idx]].tolist()
+            )
+
+            merged_group = set().union(*(group for group in groups if group & linked_roles))
+            groups = [group for group in groups if not group & linked_roles] + [merged_group]
+
+        return sorted(sorted(group) for group in groups)
+
+    def get_unit(self, roles_group: List[int]) -> Tuple[List[int], np.ndarray, np.ndarray]:
+        """
+        Returns all blue/red assignments of the roles group that respect duos, indexed like itertools.product
+        """
+        blue = self.role_pairs[roles_group[0]][:, :1]
+        red = self.role_pairs[roles_group[0]][:, 1:]
+
+        # Roles are added one at a time, dropping assignments where a duo is already split between sides
+        for role_idx in roles_group[1:]:
+            role_pairs = self.role_pairs[role_idx]
+
+            previous_indices = np.repeat(np.arange(len(blue)), len(role_pairs))
+            pair_indices = np.tile(np.arange(len(role_pairs)), len(blue))
+
+            blue = np.concatenate((blue[previous_indices], role_pairs[pair_indices, :1]), axis=1)
+            red = np.concatenate((red[previous_indices], role_pairs[pair_indices, 1:]), axis=1)
+
+            valid = self.get_valid(blue, red)
+
+            for side, other_side in ((blue, red), (red, blue)):
+                valid &= ~(self.duo_ids[side][:, :, None] == self.player_ids[other_side][:, None, :]).any(
+                    axis=(1, 2)
+                )
+
+            blue, red = blue[valid], red[valid]
+
+        # Duo partners are always in the same roles group, so we can finally check all duos are complete
+        valid = np.ones(len(blue), dtype=bool)
+
+        for side in (blue, red):
+            side_ids, side_duo_ids = self.player_ids[side], self.duo_ids[side]
+
+            # (N, k, k) comparison of every duo id with every player id of the same side
+            duo_found = (side_duo_ids[:, :, None] == side_ids[:, None, :]).any(axis=2)
+            valid &= (duo_found | (side_duo_ids < 0)).all(axis=1)
+
+        blue, red = blue[valid], red[valid]
+
+        return roles_group, blue, red
+
+    def get_sides(self, flat_indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the (N, 5) blue and red queue player indices of compositions, indexed like itertools.product
+        """
+        unit_indices = np.unravel_index(flat_indices, self.units_shape)
+
+        blue = np.empty((len(flat_indices), len(roles_list)), dtype=np.intp)
+        red = np.empty((len(flat_indices), len(roles_list)), dtype=np.intp)
+
+        for (roles_group, unit_blue, unit_red), idx in zip(self.units, unit_indices):
+            blue[:, roles_group] = unit_blue[idx]
+            red[:, roles_group] = unit_red[idx]
+
+        return blue, red
+
+    def get_scores(self, blue: np.ndarray, red: np.ndarray) -> np.ndarray:
+        """
+        Matchmaking scores of the compositions, with the same operations order as evaluate_game
+        """
+        # Close candidates are re-checked with get_exact_score, so we use the faster np.exp
+        winrates = evaluate_games(self.mu[blue], self.mu[red], self.sigma2[blue], self.sigma2[red])
+
+        return np.abs(0.5 - winrates)
+
+    def get_valid(self, blue: np.ndarray, red: np.ndarray) -> np.ndarray:
+        """
+        Flags compositions where all players are different
+        """
+        if not self.has_multiple_roles_players:
+            return np.ones(len(blue), dtype=bool)
+
+        sorted_ids = np.sort(np.concatenate((self.player_ids[blue], self.player_ids[red]), axis=1), axis=1)
+
+        return (sorted_ids[:, 1:] != sorted_ids[:, :-1]).all(axis=1)
+
+    def get_exact_score(self, blue: np.ndarray, red: np.ndarray) -> float:
+        """
+        Scalar version of get_scores, with the exact same result as a Game object
+        """
+        delta_mu = sum(self.mu_list[i] for i in blue) - sum(self.mu_list[i] for i in red)
+
+        sum_sigma = sum(self.sigma2_list[i] for i in itertools.chain(blue, red))
+
+        return abs(0.5 - get_blue_winrate(delta_mu, sum_sigma, len(blue) + len(red)))
+
+    def get_composition(
+        self, blue: np.ndarray, red: np.ndarray
+    ) -> Dict[Tuple[str, str], QueuePlayerSnapshot]:
+        """
+        Returns the {(team, role)} = QueuePlayerSnapshot dictionary of a composition
+        """
+        composition = {}
+
+        for role_idx, role in enumerate(roles_list):
+            composition["BLUE", role] = self.queue_players[blue[role_idx]]
+            composition["RED", role] = self.queue_players[red[role_idx]]
+
+        return composition
+
+
+def get_chunks(compositions_count: int) -> Iterator[Tuple[int, int]]:
+    """
+    Yields (start, end) flat indices of growing batches of compositions
+    """
+    start, chunk_size = 0, min_chunk_size
+
+    while start < compositions_count:
+        yield start, min(start + chunk_size, compositions_count)
+
+        start += chunk_size
+        chunk_size = min(chunk_size * 2, max_chunk_size)
+
+
+def get_priority_chunks(units_shape: Tuple[int, ...]) -> Iterator[np.ndarray]:
+    """
+    Yields flat indices of growing batches of compositions, by shells of the worst rank of their units
+
+    Shell k has all compositions whose worst unit assignment is the k-th one, so compositions made of
+        the most promising assignments of every unit come first
+    """
+    if not all(units_shape):
+        return
+
+    chunk_size = min_chunk_size
+    pending, pending_size = [], 0
+
+    for rank in range(max(units_shape)):
+        # Each composition of the shell is counted once, with the first unit at the rank
+        for unit_idx, size in enumerate(units_shape):
+            if rank >= size:
+                continue
+
+            ranges = [np.arange(min(rank, other_size)) for other_size in units_shape[:unit_idx]]
+            ranges.append(np.array([rank]))
+            ranges += [np.arange(min(rank + 1, other_size)) for other_size in units_shape[unit_idx + 1 :]]
+
+            flat_indices = np.ravel_multi_index(np.ix_(*ranges), units_shape).ravel()
+
+            if not len(flat_indices):
+                continue
+
+            pending.append(flat_indices)
+            pending_size += len(flat_indices)
+
+            while pending_size >= chunk_size:
+                flat_indices = np.concatenate(pending)
+
+                yield flat_indices[:chunk_size]
+
+                pending, pending_size = [flat_indices[chunk_size:]], pending_size - chunk_size
+                chunk_size = min(chunk_size * 2, max_chunk_size)
+
+    if pending_size:
+        yield np.concatenate(pending)
+
+
+def find_best_composition(
+    queue_players: List[QueuePlayerSnapshot],
+    required_queue_player: Optional[QueuePlayerSnapshot] = None,
+    good_enough_score: float = good_enough_score,
+    deadline: Optional[float] = None,
+    stats: Optional[SearchStats] = None,
+) -> Optional[Dict[Tuple[str, str], QueuePlayerSnapshot]]:
+    """
+    Scores every canonical team composition of the queue players by batches and returns the best one
+
+    The result is the same as scoring compositions one by one in itertools.product order of the units:
+        the first composition below good_enough_score if there is one, else the first one with the lowest score
+
+    If a time.monotonic() deadline is given, we return the best composition of the batches scored before it
+        Compositions are then scored from the most promising ones, by balance of their units and age of their
+        players, instead of the itertools.product order
+    """
+    stats = stats if stats is not None else SearchStats()
+
+    packed = PackedQueue(queue_players, required_queue_player)
+
+    if deadline is None:
+        chunks = (np.arange(start, end) for start, end in get_chunks(packed.compositions_count))
+    else:
+        packed.sort_units_by_priority()
+        chunks = get_priority_chunks(packed.units_shape)
+
+    best_score = 1
+    best_sides = None
+
+    for flat_indices in chunks:
+        # We keep going until we have at least one valid composition to return
+        if deadline is not None and best_sides is not None and time.monotonic() > deadline:
+            stats.timed_out, stats.proven_optimal = True, False
+            break
+
+        stats.compositions_evaluated += len(flat_indices)
+
+        blue, red = packed.get_sides(flat_indices)
+
+        valid = packed.get_valid(blue, red)
+
+        if not valid.any():
+            continue
+
+        scores = packed.get_scores(blue, red)
+
+        # Array floats can be a few ULPs away from trueskill’s, so close candidates get checked in order
+        for idx in np.flatnonzero(valid & (scores < good_enough_score + score_tolerance)):
+            if packed.get_exact_score(blue[idx], red[idx]) < good_enough_score:
+                stats.proven_optimal = False
+                return packed.get_composition(blue[idx], red[idx])
+
+        chunk_best_score = scores[valid].min()
+
+        for idx in np.flatnonzero(valid & (scores <= chunk_best_score + score_tolerance)):
+            exact_score = packed.get_exact_score(blue[idx], red[idx])
+
+            if exact_score < best_score:
+                best_score = exact_score
+                best_sides = blue[idx], red[idx]
+
+    if best_sides is None:
+        return None
+
+    return packed.get_composition(*best_sides)
@@ -1,6 +1,7 @@
 import asyncio
 import logging
-from typing import List, Optional
+import os
+from typing import Dict, List, Optional
 
 from discord import Message, Embed, TextChannel
 from discord.ext import commands
@@ -9,10 +10,19 @@ from discord.ext.commands import Bot
 from inhouse_bot import game_queue
 from inhouse_bot.common_utils.embeds import embeds_color
 from inhouse_bot.common_utils.emoji_and_thumbnails import get_role_emoji
+from inhouse_bot.game_queue.queue_feed import apply_queue_changes
+from inhouse_bot.game_queue.queue_snapshot import get_queue_order
 from inhouse_bot.database_orm import session_scope, ChannelInformation
 
 queue_logger = logging.getLogger("queue_channel_handler")
 
+# Minutes after which idle players are removed from queues, for channels without their own TTL
+#   0 never removes them
+default_queue_ttl = int(os.environ.get("INHOUSE_BOT_QUEUE_TTL") or 0)
+
+# Seconds between two sweeps of idle players
+queue_sweep_interval = float(os.environ.get("INHOUSE_BOT_QUEUE_SWEEP_INTERVAL") or 60)
+
 
 class QueueChannelHandler:
     def __init__(self):
@@ -21,14 +31,19 @@ class QueueChannelHandler:
             session.expire_on_commit = False
 
             self._queue_channels = (
-                session.query(ChannelInformation.id, ChannelInformation.server_id)
+                session.query(
+                    ChannelInformation.id, ChannelInformation.server_id, ChannelInformation.queue_ttl
+                )
                 .filter(ChannelInformation.channel_type == "QUEUE")
                 .all()
             )
 
-        # channel_id -> GameQueue
+        # channel_id -> QueueSnapshot of the last queue message
         self._queue_cache = {}
 
+        # channel_id -> version of the queue in the last queue message, None if it was read from the database
+        self._queue_versions = {}
+
         # Helps untag older message that needs to be deleted
         self.latest_queue_message_ids = {}
 
@@ -63,15 +78,24 @@ class QueueChannelHandler:
         If channel is supplied instead of a context (in the case of a bot reboot), send the reboot message instead
         """
 
-        # Creating the queue visualisation requires getting the Player objects from the DB to have the names
-        queue = game_queue.GameQueue(channel.id)
+        # The queue snapshot has the players’ names, so the message is created without any other query
+        if game_queue.queue_store.enabled:
+            queue = self.get_changed_queue(channel.id)
+
+            # Channels whose version did not move since the last message are skipped
+            if queue is None:
+                return
+
+        else:
+            queue = game_queue.GameQueue(channel.id)
+            self._queue_versions[channel.id] = None
 
         # If the new queue is the same as the cache, we simple return
-        if queue == self._queue_cache.get(channel.id):
+        if queue.snapshot == self._queue_cache.get(channel.id):
             return
         else:
             # Else, we update our cache (useful to not send too many messages)
-            self._queue_cache[channel.id] = queue
+            self._queue_cache[channel.id] = queue.snapshot
 
         # Create the queue embed
         embed = Embed(colour=embeds_color)
@@ -81,7 +105,7 @@ class QueueChannelHandler:
 
         for role, role_queue in queue.queue_players_dict.items():
             queue_rows.append(
-                f"{get_role_emoji(role)} " + ", ".join(qp.player.short_name for qp in role_queue)
+                f"{get_role_emoji(role)} " + ", ".join(qp.short_name for qp in role_queue)
             )
 
         embed.add_field(name="Queue", value="\n".join(queue_rows))
@@ -93,7 +117,7 @@ class QueueChannelHandler:
             for duo in queue.duos:
 
                 duos_strings.append(
-                    " + ".join(f"{qp.player.short_name} {get_role_emoji(qp.role)}" for qp in duo)
+                    " + ".join(f"{qp.short_name} {get_role_emoji(qp.role)}" for qp in duo)
                 )
 
             embed.add_field(name="Duos", value=", ".join(duos_strings))
@@ -115,6 +139,31 @@ class QueueChannelHandler:
 
         self.latest_queue_message_ids[channel.id] = new_queue_message.id
 
+    def get_changed_queue(self, channel_id: int) -> Optional[game_queue.GameQueue]:
+        """
+        Returns the queue of the channel if it changed since the last message, or None
+
+        The queue is rebuilt from the last message’s one and the changes of the feed when they are all kept
+        """
+        feed = game_queue.queue_store.feed
+
+        version = feed.get_version(channel_id)
+        cached_version = self._queue_versions.get(channel_id)
+
+        if channel_id in self._queue_cache and cached_version == version:
+            return None
+
+        self._queue_versions[channel_id] = version
+
+        changes = feed.get_changes(channel_id, cached_version) if cached_version is not None else None
+
+        if channel_id not in self._queue_cache or changes is None:
+            return game_queue.GameQueue(channel_id)
+
+        queue_players = apply_queue_changes(self._queue_cache[channel_id], changes)
+
+        return game_queue.GameQueue(channel_id, queue_players=sorted(queue_players, key=get_queue_order))
+
     @property
     def queue_channel_ids(self) -> List[int]:
         return [c.id for c in self._queue_channels]
@@ -122,6 +171,26 @@ class QueueChannelHandler:
     def get_server_queues(self, server_id: int) -> List[int]:
         return [c.id for c in self._queue_channels if c.server_id == server_id]
 
+    def get_queue_ttls(self) -> Dict[int, int]:
+        """
+        Returns channel_id -> minutes after which idle players are removed from its queue
+        """
+        return {
+            c.id: c.queue_ttl if c.queue_ttl is not None else default_queue_ttl for c in self._queue_channels
+        }
+
+    def set_queue_ttl(self, channel_id: int, queue_ttl: Optional[int]):
+        """
+        Sets the TTL of the queue channel in minutes, None going back to the default one
+        """
+        with session_scope() as session:
+            session.expire_on_commit = False
+
+            channel = session.query(ChannelInformation).filter(ChannelInformation.id == channel_id).one()
+            channel.queue_ttl = queue_ttl
+
+        self._queue_channels = [c if c.id != channel_id else channel for c in self._queue_channels]
+
     def is_queue_channel(self, channel_id) -> bool:
         return channel_id in self.queue_channel_ids
 
@@ -1,5 +1,8 @@
 import os
+
+import pytest
 import sqlalchemy
+from sqlalchemy import event
 
 db_name = "inhouse_bot"
 
@@ -8,3 +11,24 @@ no_db_engine = sqlalchemy.create_engine(os.environ["INHOUSE_BOT_CONNECTION_STRIN
 no_db_engine.execution_options(isolation_level="AUTOCOMMIT").execute(f"DROP DATABASE IF EXISTS {db_name};")
 no_db_engine.execution_options(isolation_level="AUTOCOMMIT").execute(f"CREATE DATABASE {db_name};")
 del no_db_engine
+
+
+@pytest.fixture
+def sql_statements():
+    """
+    Captures the SQL statements sent to the database during the test, the list can be cleared at any time
+    """
+    # Imported here, as the database has to be created first
+    from inhouse_bot.database_orm.session.session_handler import ghost_session_maker
+
+    statements = []
+
+    def capture_statement(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    engine = ghost_session_maker.session_maker.kw["bind"]
+    event.listen(engine, "before_cursor_execute", capture_statement)
+
+    yield statements
+
+    event.remove(engine, "before_cursor_execute", capture_statement)
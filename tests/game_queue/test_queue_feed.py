@@ -0,0 +1,29 @@
+from inhouse_bot.game_queue.queue_feed import QueueFeed, apply_queue_changes
+from inhouse_bot.game_queue.queue_snapshot import QueuePlayerSnapshot
+
+
+def test_queue_feed_history():
+    feed = QueueFeed(history_size=2)
+
+    top = QueuePlayerSnapshot(0, "TOP", None, 25, 25 / 3, name="0")
+    jgl = QueuePlayerSnapshot(0, "JGL", None, 25, 25 / 3, name="0")
+
+    # Rows that do not change are not published
+    assert feed.publish(0, 0, (top,), (top,)) is None
+    assert feed.get_version(0) == 0
+
+    assert feed.publish(0, 0, (), (top,)).kind == "added"
+    assert feed.publish(0, 0, (top,), (jgl,)).kind == "role_change"
+    assert feed.publish(0, 0, (jgl,), (jgl.replace(duo_id=1),)).kind == "duo_link"
+
+    assert feed.get_version(0) == 3
+    assert feed.get_changes(0, 3) == []
+    assert apply_queue_changes([top], feed.get_changes(0, 1)) == [jgl.replace(duo_id=1)]
+
+    # Only the last changes are kept, so older readers have to read the whole queue again
+    assert feed.get_changes(0, 0) is None
+
+    feed.invalidate([1])
+
+    assert feed.get_version(0) == 4 and feed.get_version(1) == 1
+    assert feed.get_changes(0, 3) is None
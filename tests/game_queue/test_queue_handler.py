@@ -1,8 +1,21 @@
+import time
+from datetime import datetime, timedelta
+
 import pytest
 
 from inhouse_bot.common_utils.fields import roles_list
 from inhouse_bot import game_queue
 from inhouse_bot.game_queue import GameQueue
+from inhouse_bot.game_queue.queue_handler import (
+    SameRolesForDuo,
+    get_players_in_ready_check,
+    is_in_ready_check,
+)
+from inhouse_bot.game_queue.queue_feed import apply_queue_changes
+from inhouse_bot.game_queue.queue_snapshot import get_queue_order
+from inhouse_bot.game_queue.queue_store import queue_store
+from inhouse_bot.matchmaking_logic import find_best_game
+from inhouse_bot.database_orm import session_scope, Game, GameParticipant, PlayerRating
 
 # Ideally, that should not be hardcoded
 # This needs to be called after the first part is it creates a session
@@ -117,3 +130,399 @@ def test_duo_queue():
 
     assert len(GameQueue(0)) == 10
     assert len(GameQueue(0).duos) == 0
+
+
+def test_flex_queue():
+    game_queue.reset_queue()
+
+    game_queue.add_player(0, "TOP", 0, 0, name="0")
+
+    # Flex queuing replaces the roles the player was queued for
+    game_queue.add_flex_player(0, ["MID", "SUP", "JGL"], 0, 0, name="0")
+
+    assert {qp.role: qp.role_rank for qp in GameQueue(0).get_snapshot()} == {"MID": 0, "SUP": 1, "JGL": 2}
+
+    # Queuing for a single role has no preference
+    game_queue.add_player(0, "BOT", 0, 0, name="0")
+
+    assert {qp.role: qp.role_rank for qp in GameQueue(0).get_snapshot()}["BOT"] is None
+
+    # Duo partners cannot flex queue, as it would drop their duo
+    game_queue.add_duo(1, "TOP", 2, "SUP", 0, 0, first_player_name="1", second_player_name="2")
+
+    with pytest.raises(game_queue.PlayerInDuo):
+        game_queue.add_flex_player(2, ["SUP", "MID"], 0, 0, name="2")
+
+    assert len(GameQueue(0).duos) == 1
+
+
+@pytest.fixture
+def database_queue_store(monkeypatch):
+    """
+    Runs the test with the queues read and written in the database, then loads them back in memory
+    """
+    queue_store.flush()
+    monkeypatch.setattr(queue_store, "enabled", False)
+
+    yield
+
+    queue_store.load()
+
+
+def test_queue_loading_statements(database_queue_store, sql_statements):
+    game_queue.reset_queue()
+
+    # Players 100 to 109 never played, so they have no rating yet
+    for player_id in range(100, 110):
+        game_queue.add_player(player_id, roles_list[player_id % 5], 0, 0, name=str(player_id))
+        game_queue.add_player(player_id, roles_list[player_id % 5], 1, 0, name=str(player_id))
+
+    game_queue.start_ready_check(list(range(100, 110)), 1, 0)
+    game_queue.add_player(110, roles_list[0], 0, 0, name="110")
+
+    # Missing ratings are created with a single insert
+    sql_statements.clear()
+    queue = GameQueue(0)
+    assert len(sql_statements) == 2
+
+    # Players in a ready check in another channel are not in queue
+    assert [qp.player_id for qp in queue.queue_players] == [110]
+    assert queue.queue_players[0].name == "110"
+
+    sql_statements.clear()
+    GameQueue(0)
+    assert len(sql_statements) == 1
+
+    with session_scope() as session:
+        assert session.query(PlayerRating).filter(PlayerRating.player_id == 110).one().trueskill_mu == 25
+
+
+def test_queue_validation_statements(database_queue_store, sql_statements):
+    game_queue.reset_queue()
+
+    for player_id in range(0, 10):
+        game_queue.add_player(player_id, roles_list[player_id % 5], 0, 0, name=str(player_id))
+
+    game_queue.start_ready_check(list(range(0, 10)), 0, 0)
+
+    # Games and ready checks are checked with a single query, then players and queue rows are written
+    sql_statements.clear()
+    game_queue.add_player(10, "TOP", 0, 0, name="10")
+    assert len(sql_statements) == 3
+
+    with pytest.raises(game_queue.PlayerInReadyCheck):
+        game_queue.add_player(0, "MID", 1, 0, name="0")
+
+    game_queue.cancel_all_ready_checks()
+
+    # Players whose last game has no winner cannot queue either
+    for player_id in range(400, 410):
+        game_queue.add_player(player_id, roles_list[player_id % 5], 1, 0, name=str(player_id))
+
+    with session_scope() as session:
+        session.add(find_best_game(GameQueue(1)))
+
+    try:
+        with pytest.raises(game_queue.PlayerInGame):
+            game_queue.add_player(400, "TOP", 0, 0, name="400")
+
+    finally:
+        with session_scope() as session:
+            game_ids = session.query(GameParticipant.game_id).filter(GameParticipant.player_id == 400)
+            session.query(Game).filter(Game.id.in_(game_ids.subquery())).delete(synchronize_session=False)
+
+
+@pytest.fixture
+def memory_queue_store(monkeypatch):
+    """
+    Runs the test with the queues in memory, then writes their changes before going back to the database
+    """
+    queue_store.load()
+    monkeypatch.setattr(queue_store, "enabled", True)
+
+    yield
+
+    queue_store.flush()
+
+
+def test_queue_store(memory_queue_store, sql_statements):
+    game_queue.reset_queue()
+
+    for player_id in range(0, 10):
+        game_queue.add_player(player_id, roles_list[player_id % 5], 0, 0, name=str(player_id))
+
+    game_queue.add_player(0, roles_list[1], 1, 0, name="0")
+    game_queue.add_duo(10, "TOP", 11, "SUP", 1, 0, first_player_name="10", second_player_name="11")
+    game_queue.start_ready_check(list(range(0, 10)), 0, 0)
+
+    queue_store.flush()
+    sql_statements.clear()
+
+    # Queues are read from memory
+    assert len(GameQueue(0)) == 0
+    assert [qp.player_id for qp in GameQueue(1).queue_players] == [10, 11]
+    assert not sql_statements
+
+    # Changes are written to the database in the background, which gives the same queues once flushed
+    queue_store.flush()
+
+    for channel_id in (0, 1):
+        assert GameQueue(channel_id, from_database=True) == GameQueue(channel_id)
+
+    # The queues and ready checks are recovered from the database after a restart
+    queue_1 = GameQueue(1)
+    queue_store.load()
+
+    assert GameQueue(1) == queue_1
+    assert len(GameQueue(1).duos) == 1
+
+    with pytest.raises(game_queue.PlayerInReadyCheck):
+        game_queue.add_player(0, roles_list[0], 2, 0, name="0")
+
+    game_queue.cancel_all_ready_checks()
+
+
+def test_ready_checks_in_memory(memory_queue_store, sql_statements):
+    game_queue.reset_queue()
+
+    for player_id in range(0, 11):
+        game_queue.add_player(player_id, roles_list[player_id % 5], 0, 0, name=str(player_id))
+
+    game_queue.start_ready_check(list(range(0, 10)), 0, 0)
+
+    queue_store.flush()
+    sql_statements.clear()
+
+    # Ready checks are answered by the registry, without any query
+    assert is_in_ready_check(0, 0) and is_in_ready_check(9) and not is_in_ready_check(10, 0)
+    assert not is_in_ready_check(0, 1)
+    assert [qp.player_id for qp in GameQueue(0).queue_players] == [10]
+
+    assert get_players_in_ready_check({0, 9, 10}, 0, session=None) == {0, 9}
+
+    assert not sql_statements
+
+    game_queue.cancel_all_ready_checks()
+
+
+def test_queue_store_single_write(memory_queue_store, monkeypatch, sql_statements):
+    game_queue.reset_queue()
+    queue_store.flush()
+
+    writes = []
+    monkeypatch.setattr(queue_store, "write", lambda function, *args: writes.append(function.__name__))
+
+    sql_statements.clear()
+    game_queue.add_player(0, "TOP", 0, 0, name="0")
+
+    # Players are only read right away, and everything is written in a single background transaction
+    assert len(sql_statements) == 2
+    assert all(statement.lstrip().upper().startswith("SELECT") for statement in sql_statements)
+    assert writes == ["_add_queue_players_in_database"]
+
+    assert [qp.player_id for qp in GameQueue(0).queue_players] == [0]
+
+
+def test_queue_feed(memory_queue_store):
+    game_queue.reset_queue()
+
+    feed = queue_store.feed
+    versions = {channel_id: feed.get_version(channel_id) for channel_id in (0, 1)}
+
+    for player_id in range(0, 10):
+        game_queue.add_player(player_id, roles_list[player_id % 5], 0, 0, name=str(player_id))
+
+    game_queue.add_player(0, roles_list[1], 1, 0, name="0")
+    game_queue.add_duo(10, "TOP", 11, "SUP", 1, 0, first_player_name="10", second_player_name="11")
+    game_queue.add_flex_player(1, ["JGL", "MID"], 0, 0, name="1")
+    game_queue.remove_duo(10, 1)
+
+    # Starting a ready check in channel 0 removes player 0 from the queue of channel 1 until it is cancelled
+    game_queue.start_ready_check(list(range(0, 10)), 0, 0)
+    game_queue.cancel_ready_check(0, [9], channel_id=0)
+
+    # Removing a player who is not in queue is not a change
+    game_queue.remove_players({100}, channel_id=1)
+
+    changes = {channel_id: feed.get_changes(channel_id, versions[channel_id]) for channel_id in (0, 1)}
+
+    assert [change.kind for change in changes[1]] == [
+        "added",
+        "added",
+        "added",
+        "duo_link",
+        "duo_link",
+        "ready_check_start",
+        "ready_check_end",
+    ]
+
+    assert {change.kind for change in changes[0]} == {
+        "added",
+        "role_change",
+        "ready_check_start",
+        "ready_check_end",
+        "removed",
+    }
+
+    # The changes give the queues without reading them again
+    for channel_id in (0, 1):
+        queue_players = apply_queue_changes([], changes[channel_id])
+
+        assert GameQueue(channel_id, queue_players=sorted(queue_players, key=get_queue_order)) == GameQueue(
+            channel_id
+        )
+
+    # The rows of each player and of his duo partner are found without going through the other rows
+    rows = [
+        (channel_id, qp)
+        for channel_id, channel_queue in queue_store.channels.items()
+        for qp in channel_queue.values()
+    ]
+
+    player_ids = {qp.player_id for channel_id, qp in rows} | {qp.duo_id for channel_id, qp in rows} - {None}
+
+    for player_id in player_ids:
+        assert sorted(queue_store.get_player_rows(player_id), key=str) == sorted(
+            ((channel_id, qp) for channel_id, qp in rows if qp.player_id == player_id), key=str
+        )
+        assert sorted(queue_store.get_duo_rows(player_id), key=str) == sorted(
+            ((channel_id, qp) for channel_id, qp in rows if qp.duo_id == player_id), key=str
+        )
+
+    # Loading the queues again moves their versions without any change
+    queue_store.load()
+
+    assert feed.get_changes(0, versions[0]) is None
+
+
+@pytest.mark.parametrize("store", ["memory_queue_store", "database_queue_store"])
+def test_atomic_duo_queue(store, request, sql_statements):
+    request.getfixturevalue(store)
+    game_queue.reset_queue()
+
+    game_queue.add_player(0, "TOP", 0, 0, name="0")
+    game_queue.add_player(0, "MID", 0, 0, name="0")
+
+    for player_id in range(1, 11):
+        game_queue.add_player(player_id, roles_list[player_id % 5], 1, 0, name=str(player_id))
+
+    game_queue.start_ready_check(list(range(1, 11)), 1, 0)
+
+    # Player 1 is in a ready check, so nothing changes for player 0 either
+    with pytest.raises(game_queue.PlayerInReadyCheck):
+        game_queue.add_duo(0, "TOP", 1, "JGL", 0, 0, first_player_name="0", second_player_name="1")
+
+    assert [qp.role for qp in GameQueue(0).queue_players] == ["TOP", "MID"]
+
+    queue_store.flush()
+    sql_statements.clear()
+
+    # The checks, then the players upsert and the delete, unlink and insert of the queue rows in a transaction
+    #   In memory, ready checks are not read but games and ratings are read separately
+    game_queue.add_duo(0, "TOP", 11, "SUP", 0, 0, first_player_name="0", second_player_name="11")
+    queue_store.flush()
+
+    assert len(sql_statements) == (6 if queue_store.enabled else 5)
+
+    queue = GameQueue(0)
+
+    assert [(qp.player_id, qp.role) for qp in queue.queue_players] == [(0, "TOP"), (11, "SUP")]
+    assert len(queue.duos) == 1
+    assert GameQueue(0, from_database=True) == queue
+
+    game_queue.cancel_all_ready_checks()
+
+
+def test_bulk_queue(sql_statements):
+    game_queue.reset_queue()
+
+    queue_store.flush()
+    sql_statements.clear()
+
+    # 30 players are queued with the same statements as a single one
+    game_queue.add_queue_players(
+        [
+            game_queue.QueueRequest(player_id, roles_list[player_id % 5], str(player_id))
+            for player_id in range(200, 230)
+        ],
+        channel_id=0,
+        server_id=0,
+    )
+    queue_store.flush()
+
+    # The checks, the players upsert and the queue rows insert, with the default ratings insert in memory
+    assert len(sql_statements) == (5 if queue_store.enabled else 3)
+
+    assert len(GameQueue(0)) == 30
+
+    # Players 200 to 203 become two duos, which replaces their solo roles
+    game_queue.add_duos(
+        [
+            (game_queue.QueueRequest(200, "TOP", "200"), game_queue.QueueRequest(201, "JGL", "201")),
+            (game_queue.QueueRequest(202, "MID", "202"), game_queue.QueueRequest(203, "BOT", "203")),
+        ],
+        channel_id=0,
+        server_id=0,
+    )
+
+    assert len(GameQueue(0)) == 30
+    assert len(GameQueue(0).duos) == 2
+
+    with pytest.raises(SameRolesForDuo):
+        game_queue.add_duos(
+            [(game_queue.QueueRequest(204, "SUP"), game_queue.QueueRequest(209, "SUP"))],
+            channel_id=0,
+            server_id=0,
+        )
+
+    # Removing players drops them and unlinks their duos
+    game_queue.remove_players({200, 202, 210}, channel_id=0)
+
+    queue = GameQueue(0)
+
+    assert len(queue) == 27
+    assert not queue.duos
+
+    queue_store.flush()
+    assert GameQueue(0, from_database=True) == queue
+
+
+@pytest.mark.parametrize("store", ["memory_queue_store", "database_queue_store"])
+def test_expire_queue_players(store, request):
+    request.getfixturevalue(store)
+    game_queue.reset_queue()
+
+    # Players 300 and 301 queue alone, 302 and 303 as a duo, and 310 to 319 get in a ready check
+    game_queue.add_player(300, "TOP", 0, 0, name="300")
+    game_queue.add_player(301, "JGL", 0, 0, name="301")
+    game_queue.add_duo(302, "MID", 303, "BOT", 0, 0, "302", "303")
+
+    for player_id in range(310, 320):
+        game_queue.add_player(player_id, roles_list[player_id % 5], 0, 0, name=str(player_id))
+
+    game_queue.start_ready_check(list(range(310, 320)), 0, 1)
+
+    time.sleep(0.01)
+    sweep_time = datetime.now() + timedelta(minutes=60)
+    time.sleep(0.01)
+
+    # Player 305 is put ahead in queue and player 303 re-queues for another role, which keeps him in queue
+    game_queue.add_player(305, "TOP", 0, 0, name="305", jump_ahead=True)
+    game_queue.add_player(303, "SUP", 0, 0, name="303")
+
+    assert game_queue.expire_queue_players({0: 60, 1: 0}, now=sweep_time) == {0}
+
+    queue = GameQueue(0)
+
+    assert {(qp.player_id, qp.role) for qp in queue.queue_players} == {
+        (303, "BOT"),
+        (303, "SUP"),
+        (305, "TOP"),
+    }
+    assert not queue.duos
+    assert all(is_in_ready_check(player_id) for player_id in range(310, 320))
+
+    assert game_queue.expire_queue_players({0: 60}, now=sweep_time) == set()
+
+    queue_store.flush()
+    assert GameQueue(0, from_database=True) == queue
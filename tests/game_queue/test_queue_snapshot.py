@@ -0,0 +1,36 @@
+import pickle
+
+import pytest
+
+from inhouse_bot.common_utils.fields import roles_list
+from inhouse_bot.game_queue.queue_snapshot import QueuePlayerSnapshot, QueueSnapshot
+
+
+def test_queue_snapshot_indexes():
+    queue_players = [
+        QueuePlayerSnapshot(player_id, roles_list[player_id % 5], None, 25, 25 / 3, name=str(player_id))
+        for player_id in range(10)
+    ]
+
+    # Players 0 and 1 are a duo, and player 2 also queues for SUP
+    queue_players[0] = queue_players[0].replace(duo_id=1)
+    queue_players[1] = queue_players[1].replace(duo_id=0)
+    queue_players.append(QueuePlayerSnapshot(2, "SUP", None, 25, 25 / 3, name="2"))
+
+    queue_snapshot = QueueSnapshot(queue_players)
+
+    assert list(queue_snapshot.roles) == roles_list
+    assert [qp.player_id for qp in queue_snapshot.roles["SUP"]] == [4, 9, 2]
+    assert [qp.role for qp in queue_snapshot.players[2]] == ["MID", "SUP"]
+
+    assert queue_snapshot.duos == ((queue_players[0], queue_players[1]),)
+    assert queue_snapshot.get_duo(queue_players[1]) == queue_players[0]
+
+    # Snapshots are immutable and picklable, so they can be shared with matchmaking workers
+    with pytest.raises(AttributeError):
+        queue_players[0].duo_id = None
+
+    with pytest.raises(AttributeError):
+        queue_snapshot.duos = ()
+
+    assert pickle.loads(pickle.dumps(queue_snapshot)) == queue_snapshot
@@ -0,0 +1,32 @@
+from inhouse_bot.game_queue.ready_check_registry import ReadyCheckRegistry
+
+
+def test_ready_check_registry():
+    registry = ReadyCheckRegistry()
+
+    registry.start(ready_check_id=0, server_id=0, channel_id=0, player_ids=range(10))
+    registry.start(ready_check_id=1, server_id=1, channel_id=1, player_ids=range(5, 15))
+
+    assert registry.is_in_ready_check(0, server_id=0)
+    assert not registry.is_in_ready_check(0, server_id=1)
+    assert registry.is_in_ready_check(5, server_id=1)
+    assert registry.is_in_ready_check(14)
+    assert not registry.is_in_ready_check(15)
+
+    # Dropping a player from the channel of a ready check removes him from it
+    registry.remove_player(14, channel_id=1)
+
+    assert not registry.is_in_ready_check(14)
+    assert registry.get(1).player_ids == set(range(5, 14))
+
+    # Players in both ready checks stay in the one of the other server
+    assert registry.cancel(0).player_ids == set(range(10))
+    assert 0 not in registry
+
+    assert not registry.is_in_ready_check(0)
+    assert registry.is_in_ready_check(5) and not registry.is_in_ready_check(5, server_id=0)
+
+    registry.cancel_channel(1)
+
+    assert len(registry) == 0
+    assert not registry.is_in_ready_check(5)
@@ -0,0 +1,107 @@
+import itertools
+import random
+from datetime import datetime, timedelta
+from typing import List
+
+from inhouse_bot.database_orm import QueuePlayer, Player, PlayerRating
+from inhouse_bot.common_utils.fields import roles_list
+from inhouse_bot.game_queue import QueuePlayerSnapshot
+from inhouse_bot.matchmaking_logic.find_best_game import get_matchmaking_score
+
+
+def get_in_memory_queue_players(
+    players_per_role: int, duos_count: int = 0, seed: int = 0, multi_roles_count: int = 0
+) -> List[QueuePlayer]:
+    """
+    Creates QueuePlayer objects with random ratings without going through the database
+
+    The last multi_roles_count players also queue for the next role
+    """
+    rng = random.Random(seed)
+
+    players_count = players_per_role * len(roles_list)
+
+    queue_players = []
+
+    for queue_idx in range(players_count + multi_roles_count):
+        if queue_idx < players_count:
+            player_id = queue_idx
+            role = roles_list[player_id % len(roles_list)]
+            player = Player(id=player_id, server_id=0, name=str(player_id))
+
+        else:
+            player_id = queue_idx - multi_roles_count
+            role = roles_list[(player_id + 1) % len(roles_list)]
+            player = queue_players[player_id].player
+
+        player.ratings[role] = PlayerRating(player, role)
+        player.ratings[role].trueskill_mu = rng.gauss(25, 5)
+        player.ratings[role].trueskill_sigma = rng.uniform(2, 25 / 3)
+
+        queue_player = QueuePlayer(
+            channel_id=0,
+            player_id=player_id,
+            player_server_id=0,
+            role=role,
+            queue_time=datetime.now() + timedelta(seconds=queue_idx),
+        )
+        queue_player.player = player
+
+        queue_players.append(queue_player)
+
+    # Duos are made of consecutive players, which always have different roles
+    for duo_idx in range(duos_count):
+        first_qp, second_qp = queue_players[2 * duo_idx], queue_players[2 * duo_idx + 1]
+
+        first_qp.duo_id = second_qp.player_id
+        second_qp.duo_id = first_qp.player_id
+
+    return queue_players
+
+
+def get_in_memory_queue_snapshot(*args, **kwargs) -> List[QueuePlayerSnapshot]:
+    """
+    Same arguments as get_in_memory_queue_players, returns the snapshot matchmaking solvers work on
+    """
+    return [QueuePlayerSnapshot.from_queue_player(qp) for qp in get_in_memory_queue_players(*args, **kwargs)]
+
+
+def brute_force_best_composition(queue_players, good_enough_score=0.01):
+    """
+    The previous matchmaking logic, scoring every composition of the snapshot in both blue/red orientations
+    """
+    role_permutations = [
+        list(itertools.permutations([qp for qp in queue_players if qp.role == role], 2))
+        for role in roles_list
+    ]
+
+    best_score = 1
+    best_composition = None
+
+    for team_composition in itertools.product(*role_permutations):
+        composition = {
+            (team, roles_list[role_idx]): queue_players_tuple[tuple_idx]
+            for role_idx, queue_players_tuple in enumerate(team_composition)
+            for tuple_idx, team in enumerate(("BLUE", "RED"))
+        }
+
+        if any(
+            qp.duo_id is not None
+            and not any(t == team and duo_qp.player_id == qp.duo_id for (t, r), duo_qp in composition.items())
+            for (team, role), qp in composition.items()
+        ):
+            continue
+
+        if len({qp.player_id for qp in composition.values()}) != 10:
+            continue
+
+        score = get_matchmaking_score(composition)
+
+        if score < best_score:
+            best_composition = composition
+            best_score = score
+
+            if best_score < good_enough_score:
+                break
+
+    return best_composition
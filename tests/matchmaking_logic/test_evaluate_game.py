@@ -0,0 +1,87 @@
+import itertools
+import math
+import random
+from types import SimpleNamespace
+
+import numpy as np
+import trueskill
+
+from inhouse_bot.matchmaking_logic.evaluate_game import (
+    _cdf,
+    cdf,
+    evaluate_teams,
+    evaluate_games,
+    get_rating_floats,
+)
+
+
+def evaluate_teams_with_ratings(blue_team, red_team) -> float:
+    """
+    The original evaluation going through trueskill.Rating objects
+    """
+    blue_team_ratings = [trueskill.Rating(mu=p.trueskill_mu, sigma=p.trueskill_sigma) for p in blue_team]
+    red_team_ratings = [trueskill.Rating(mu=p.trueskill_mu, sigma=p.trueskill_sigma) for p in red_team]
+
+    delta_mu = sum(r.mu for r in blue_team_ratings) - sum(r.mu for r in red_team_ratings)
+
+    sum_sigma = sum(r.sigma ** 2 for r in itertools.chain(blue_team_ratings, red_team_ratings))
+
+    size = len(blue_team_ratings) + len(red_team_ratings)
+
+    denominator = math.sqrt(size * (trueskill.BETA * trueskill.BETA) + sum_sigma)
+
+    return trueskill.global_env().cdf(delta_mu / denominator)
+
+
+def get_random_teams(rng: random.Random):
+    return [
+        [
+            SimpleNamespace(trueskill_mu=rng.uniform(10, 40), trueskill_sigma=rng.uniform(0.5, 25 / 3))
+            for _ in range(5)
+        ]
+        for _ in range(2)
+    ]
+
+
+def test_cdf_same_as_trueskill():
+    # Normalized deltas go well beyond the tails, where the erfc approximation changes branch
+    x = np.concatenate((np.linspace(-10, 10, 20001), [-40, -1e-12, 0, 1e-12, 40]))
+
+    expected = [trueskill.global_env().cdf(value) for value in x.tolist()]
+
+    assert [cdf(value) for value in x.tolist()] == expected
+    assert _cdf(x, exact=True).tolist() == expected
+    assert np.allclose(_cdf(x), expected, rtol=1e-12, atol=0)
+
+
+def test_evaluate_teams_same_as_ratings():
+    rng = random.Random(0)
+
+    for _ in range(1000):
+        blue_team, red_team = get_random_teams(rng)
+
+        assert evaluate_teams(blue_team, red_team) == evaluate_teams_with_ratings(blue_team, red_team)
+
+
+def test_evaluate_games_same_as_evaluate_teams():
+    rng = random.Random(0)
+
+    games = [get_random_teams(rng) for _ in range(1000)]
+
+    # (N, 5, 2) arrays of (mu, sigma²) floats for each side
+    blue, red = (
+        np.array(
+            [[get_rating_floats(p.trueskill_mu, p.trueskill_sigma) for p in game[side]] for game in games]
+        )
+        for side in range(2)
+    )
+
+    winrates = evaluate_games(blue[:, :, 0], red[:, :, 0], blue[:, :, 1], red[:, :, 1], exact=True)
+    expected_winrates = [evaluate_teams(blue_team, red_team) for blue_team, red_team in games]
+
+    assert winrates.tolist() == expected_winrates
+
+    # The default numpy path is within a few ULPs
+    assert np.allclose(
+        evaluate_games(blue[:, :, 0], red[:, :, 0], blue[:, :, 1], red[:, :, 1]), expected_winrates, rtol=1e-12
+    )
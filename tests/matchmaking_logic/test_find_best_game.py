@@ -0,0 +1,167 @@
+import asyncio
+import pickle
+import threading
+
+import pytest
+
+from inhouse_bot.matchmaking_logic import (
+    find_best_game,
+    find_best_games,
+    find_best_game_in_executor,
+    find_best_games_in_executor,
+    find_candidate_game,
+    SearchStats,
+)
+from inhouse_bot.matchmaking_logic import matchmaking_executor
+from inhouse_bot.matchmaking_logic.find_best_game import (
+    find_best_composition,
+    get_candidate_compositions,
+    candidate_compositions_cache,
+)
+
+from benchmarks.queue_utils import get_in_memory_queue
+from tests.matchmaking_logic.matchmaking_test_utils import get_in_memory_queue_players
+
+
+@pytest.mark.parametrize("solver", ["vectorized", "meet_in_the_middle"])
+def test_incremental_search(solver):
+    for seed in range(5):
+        queue = get_in_memory_queue(
+            get_in_memory_queue_players(3, duos_count=seed % 3, seed=seed, multi_roles_count=2)
+        )
+
+        # A threshold of 0 makes the search go through all players thresholds
+        incremental_game = find_best_game(queue, game_quality_threshold=0, solver=solver, incremental=True)
+        full_game = find_best_game(queue, game_quality_threshold=0, solver=solver, incremental=False)
+
+        # Both searches stop on the first game below 51% winrate, which does not have to be the same
+        if full_game.matchmaking_score >= 0.01:
+            assert incremental_game.matchmaking_score == pytest.approx(full_game.matchmaking_score, abs=1e-9)
+        else:
+            assert incremental_game.matchmaking_score < 0.01
+
+
+def test_find_best_game_in_executor():
+    queue = get_in_memory_queue(get_in_memory_queue_players(2, duos_count=1, seed=0))
+
+    # The snapshot is all the worker gets, so it has to survive a trip to another process
+    snapshot = pickle.loads(pickle.dumps(queue.get_snapshot()))
+    assert [qp.key for qp in snapshot] == [(qp.player_id, qp.role) for qp in queue.queue_players]
+
+    game = asyncio.run(find_best_game_in_executor(queue))
+
+    assert len(set(game.player_ids_list)) == 10
+    assert game.matchmaking_score == pytest.approx(find_best_game(queue).matchmaking_score, abs=1e-12)
+
+
+@pytest.mark.parametrize("solver", ["vectorized", "meet_in_the_middle", "local_search"])
+def test_time_budget(solver):
+    queue = get_in_memory_queue(get_in_memory_queue_players(6, duos_count=2, seed=0, multi_roles_count=2))
+
+    # Without any time left, we still get the best game found in the first step of the search
+    stats = SearchStats()
+    game = find_best_game(queue, game_quality_threshold=0, solver=solver, time_budget=0, stats=stats)
+
+    assert len(set(game.player_ids_list)) == 10
+    assert stats.timed_out and not stats.proven_optimal
+    assert stats.compositions_evaluated > 0
+
+    small_queue = get_in_memory_queue(get_in_memory_queue_players(2, seed=0))
+
+    stats = SearchStats()
+    find_best_game(small_queue, game_quality_threshold=0, solver=solver, stats=stats)
+
+    assert not stats.timed_out
+
+
+def test_candidate_games():
+    queue_players = get_in_memory_queue_players(3, duos_count=1, seed=0)
+    queue = get_in_memory_queue(queue_players)
+
+    queue_snapshot = queue.get_snapshot()
+    composition = find_best_composition(queue_snapshot)
+
+    candidate_compositions_cache[queue.channel_id] = get_candidate_compositions(queue_snapshot, composition)
+
+    # A player cancels the ready check and gets dropped from the queue, and his duo gets unlinked
+    dropped_player_id = composition["BLUE", "TOP"].player_id
+
+    for qp in queue_players:
+        if qp.duo_id == dropped_player_id:
+            qp.duo_id = None
+
+    queue = get_in_memory_queue([qp for qp in queue_players if qp.player_id != dropped_player_id])
+
+    # The candidate game is the one a new search would find
+    candidate_game = find_candidate_game(queue)
+    game = find_best_game(queue)
+
+    assert dropped_player_id not in candidate_game.player_ids_list
+    assert candidate_game.matchmaking_score == pytest.approx(game.matchmaking_score, abs=1e-12)
+
+    # With two players dropped, all candidates include one of them and we have to run a new search
+    queue.queue_players = [
+        qp for qp in queue.queue_players if qp.player_id != composition["RED", "TOP"].player_id
+    ]
+
+    assert find_candidate_game(queue) is None
+
+
+def test_candidate_games_in_background(monkeypatch):
+    calls = []
+
+    def get_candidate_compositions_in_thread(queue_snapshot, composition, **kwargs):
+        calls.append((threading.current_thread().name, kwargs["time_budget"]))
+        return get_candidate_compositions(queue_snapshot, composition, **kwargs)
+
+    monkeypatch.setattr(
+        matchmaking_executor, "get_candidate_compositions", get_candidate_compositions_in_thread
+    )
+
+    queue = get_in_memory_queue(get_in_memory_queue_players(3, duos_count=1, seed=0))
+    queue_snapshot = queue.get_snapshot()
+    composition = find_best_composition(queue_snapshot)
+
+    asyncio.run(
+        matchmaking_executor.update_candidate_compositions(queue.channel_id, queue_snapshot, composition)
+    )
+
+    # Candidates get a small budget in their own pool, so the matchmaking pool stays free for other channels
+    assert calls == [(calls[0][0], matchmaking_executor.candidate_time_budget)]
+    assert calls[0][0].startswith("matchmaking_background")
+    assert matchmaking_executor.get_background_executor() is not matchmaking_executor.get_executor()
+
+    assert candidate_compositions_cache[queue.channel_id]
+
+
+def test_multiple_games():
+    queue_players = get_in_memory_queue_players(5, duos_count=2, seed=0, multi_roles_count=2)
+    queue = get_in_memory_queue(queue_players)
+
+    games = find_best_games(queue, max_games=3)
+
+    assert 1 < len(games) <= 3
+
+    player_ids = [player_id for game in games for player_id in game.player_ids_list]
+
+    # Games are disjoint and the next ones are above the quality threshold
+    assert len(player_ids) == len(set(player_ids))
+    assert all(game.matchmaking_score < 0.1 for game in games[1:])
+
+    # The first game is the one find_best_game would have popped
+    assert games[0].matchmaking_score == pytest.approx(find_best_game(queue).matchmaking_score, abs=1e-12)
+
+    # Duo partners stay together
+    for game in games:
+        for qp in queue_players:
+            if qp.player_id in game.player_ids_list and qp.duo_id is not None:
+                assert qp.duo_id in game.player_ids_list
+
+    executor_games = asyncio.run(find_best_games_in_executor(queue, max_games=3))
+
+    assert [game.matchmaking_score for game in executor_games] == pytest.approx(
+        [game.matchmaking_score for game in games], abs=1e-12
+    )
+
+    # A single game goes through find_best_game_in_executor
+    assert len(asyncio.run(find_best_games_in_executor(queue, max_games=1))) == 1
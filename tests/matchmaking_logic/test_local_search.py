@@ -0,0 +1,38 @@
+from inhouse_bot.matchmaking_logic import local_search, meet_in_the_middle
+from inhouse_bot.matchmaking_logic.find_best_game import get_matchmaking_score, get_solver
+
+from tests.matchmaking_logic.matchmaking_test_utils import get_in_memory_queue_snapshot
+
+
+def test_local_search_close_to_optimal():
+    for seed in range(10):
+        queue_players = get_in_memory_queue_snapshot(
+            2 + seed % 3, duos_count=seed % 3, seed=seed, multi_roles_count=seed % 4
+        )
+
+        expected = meet_in_the_middle.find_best_composition(queue_players, good_enough_score=0)
+        composition = local_search.find_best_composition(queue_players, good_enough_score=0)
+
+        # Less than 0.1% winrate away from the best game
+        assert get_matchmaking_score(composition) <= get_matchmaking_score(expected) + 1e-3
+
+
+def test_local_search_big_queue():
+    queue_players = get_in_memory_queue_snapshot(20, duos_count=6, seed=0, multi_roles_count=5)
+    required_queue_player = queue_players[-1]
+
+    composition = local_search.find_best_composition(queue_players, required_queue_player)
+
+    assert get_matchmaking_score(composition) < 0.01
+    assert required_queue_player in composition.values()
+    assert len({qp.player_id for qp in composition.values()}) == 10
+
+    for (team, role), qp in composition.items():
+        if qp.duo_id is not None:
+            assert qp.duo_id in [duo_qp.player_id for (t, r), duo_qp in composition.items() if t == team]
+
+
+def test_auto_solver():
+    assert get_solver("auto", 10) == "vectorized"
+    assert get_solver("auto", 100) == "local_search"
+    assert get_solver("meet_in_the_middle", 100) == "meet_in_the_middle"
@@ -0,0 +1,62 @@
+import asyncio
+
+from inhouse_bot.matchmaking_logic import matchmaking_executor
+from inhouse_bot.matchmaking_logic.matchmaking_memo import MatchmakingMemo, matchmaking_memos
+
+from benchmarks.queue_utils import get_in_memory_queue
+from tests.matchmaking_logic.matchmaking_test_utils import get_in_memory_queue_players
+
+
+def test_matchmaking_memo_eviction():
+    memo = MatchmakingMemo(size=2)
+
+    memo["first"] = None
+    memo["second"] = 2
+
+    # Reading an entry makes it the most recently used one
+    assert memo["first"] is None
+
+    memo["third"] = 3
+
+    assert "first" in memo and "third" in memo
+    assert "second" not in memo
+    assert len(memo) == 2
+
+
+def test_memoized_search(monkeypatch):
+    solver_calls = []
+
+    def find_best_composition(*args, **kwargs):
+        solver_calls.append(args)
+        return original_find_best_composition(*args, **kwargs)
+
+    original_find_best_composition = matchmaking_executor.find_best_composition
+    monkeypatch.setattr(matchmaking_executor, "find_best_composition", find_best_composition)
+
+    matchmaking_memos.clear()
+
+    queue_players = get_in_memory_queue_players(3, duos_count=1, seed=0)
+    queue = get_in_memory_queue(queue_players)
+
+    game = asyncio.run(matchmaking_executor.find_best_game_in_executor(queue))
+
+    # The same queue gets the same game without running the solver again
+    memoized_game = asyncio.run(matchmaking_executor.find_best_game_in_executor(queue))
+
+    assert len(solver_calls) == 1
+    assert set(memoized_game.player_ids_list) == set(game.player_ids_list)
+    assert memoized_game.matchmaking_score == game.matchmaking_score
+
+    # A new rating changes the queue fingerprint
+    queue_players[0].player.ratings[queue_players[0].role].trueskill_mu += 1
+    queue = get_in_memory_queue(queue_players)
+
+    asyncio.run(matchmaking_executor.find_best_game_in_executor(queue))
+
+    assert len(solver_calls) == 2
+
+    # Multiple games searches are stored separately
+    asyncio.run(matchmaking_executor.find_best_games_in_executor(queue, max_games=2))
+    asyncio.run(matchmaking_executor.find_best_games_in_executor(queue, max_games=2))
+
+    assert len(matchmaking_memos[queue.channel_id]) == 3
@@ -0,0 +1,85 @@
+import asyncio
+
+from inhouse_bot.matchmaking_logic.matchmaking_scheduler import MatchmakingScheduler
+
+
+def test_matchmaking_scheduler_coalesces_changes():
+    runs = []
+
+    async def run_matchmaking(ctx):
+        runs.append(ctx)
+
+    async def spam_queue():
+        scheduler = MatchmakingScheduler(run_matchmaking, coalescing_window=0.05)
+
+        # Ten players queue in a burst in channel 0, one in channel 1
+        for player_id in range(10):
+            scheduler.mark_dirty(0, f"queue {player_id}")
+            await asyncio.sleep(0.01)
+
+        scheduler.mark_dirty(1, "other channel")
+
+        await scheduler.wait_until_idle()
+
+        assert not scheduler.workers
+
+    asyncio.run(spam_queue())
+
+    # Only one run per channel, with the last context
+    assert sorted(runs) == ["other channel", "queue 9"]
+
+
+def test_matchmaking_scheduler_one_run_at_a_time():
+    running = set()
+    runs = []
+
+    async def run_matchmaking(ctx):
+        # A channel never runs two matchmakings at the same time
+        assert ctx["channel_id"] not in running
+
+        running.add(ctx["channel_id"])
+        runs.append(ctx["name"])
+
+        # Like a ready check, queue changes can happen while this runs
+        await asyncio.sleep(0.1)
+
+        running.remove(ctx["channel_id"])
+
+    async def queue_during_ready_check():
+        scheduler = MatchmakingScheduler(run_matchmaking, coalescing_window=0.01)
+
+        scheduler.mark_dirty(0, {"channel_id": 0, "name": "first"})
+        await asyncio.sleep(0.05)
+
+        assert scheduler.is_running(0)
+
+        scheduler.mark_dirty(0, {"channel_id": 0, "name": "second"})
+        scheduler.mark_dirty(0, {"channel_id": 0, "name": "third"})
+
+        await scheduler.wait_until_idle(0)
+
+    asyncio.run(queue_during_ready_check())
+
+    # Changes made during the first run give a single new run once it is over
+    assert runs == ["first", "third"]
+
+
+def test_matchmaking_scheduler_survives_errors():
+    runs = []
+
+    async def run_matchmaking(ctx):
+        runs.append(ctx)
+        raise ValueError
+
+    async def failing_matchmaking():
+        scheduler = MatchmakingScheduler(run_matchmaking, coalescing_window=0)
+
+        scheduler.mark_dirty(0, "first")
+        await scheduler.wait_until_idle()
+
+        scheduler.mark_dirty(0, "second")
+        await scheduler.wait_until_idle()
+
+    asyncio.run(failing_matchmaking())
+
+    assert runs == ["first", "second"]
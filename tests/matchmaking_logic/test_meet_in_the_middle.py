@@ -0,0 +1,40 @@
+import pytest
+
+from inhouse_bot.matchmaking_logic.find_best_game import get_matchmaking_score
+from inhouse_bot.matchmaking_logic import meet_in_the_middle
+
+from tests.matchmaking_logic.matchmaking_test_utils import (
+    get_in_memory_queue_snapshot,
+    brute_force_best_composition,
+)
+
+
+def test_meet_in_the_middle_optimal():
+    for seed in range(10):
+        queue_players = get_in_memory_queue_snapshot(
+            2 + seed % 2, duos_count=seed % 3, seed=seed, multi_roles_count=seed % 4
+        )
+
+        expected = brute_force_best_composition(queue_players)
+        composition = meet_in_the_middle.find_best_composition(queue_players, good_enough_score=0)
+
+        # The brute force stops on the first game below 51% winrate, so it can only be worse
+        if get_matchmaking_score(expected) < 0.01:
+            assert get_matchmaking_score(composition) <= get_matchmaking_score(expected) + 1e-9
+        else:
+            assert get_matchmaking_score(composition) == pytest.approx(
+                get_matchmaking_score(expected), abs=1e-9
+            )
+
+
+def test_meet_in_the_middle_big_queue():
+    # 8 players per role is 56^5 compositions for a full product
+    queue_players = get_in_memory_queue_snapshot(8, duos_count=4, seed=0, multi_roles_count=3)
+
+    composition = meet_in_the_middle.find_best_composition(queue_players)
+
+    assert len({qp.player_id for qp in composition.values()}) == 10
+
+    for (team, role), qp in composition.items():
+        if qp.duo_id is not None:
+            assert qp.duo_id in [duo_qp.player_id for (t, r), duo_qp in composition.items() if t == team]
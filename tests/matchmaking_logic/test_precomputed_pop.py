@@ -0,0 +1,123 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+from inhouse_bot.common_utils.fields import roles_list
+from inhouse_bot.game_queue import GameQueue
+from inhouse_bot.game_queue.queue_snapshot import get_queue_order
+from inhouse_bot.matchmaking_logic.find_best_game import find_best_composition, get_matchmaking_score
+from inhouse_bot.matchmaking_logic.matchmaking_executor import update_precomputed_pop
+from inhouse_bot.matchmaking_logic.vectorized_search import good_enough_score
+from inhouse_bot.matchmaking_logic.precomputed_pop import (
+    find_precomputed_composition,
+    get_missing_role,
+    precompute_pop,
+    precomputed_pops,
+)
+
+from tests.matchmaking_logic.matchmaking_test_utils import get_in_memory_queue_snapshot
+
+
+def get_queue_snapshot(queue_players):
+    """
+    Returns the queue players in the order of GameQueue, which puts the oldest players of each role first
+    """
+    return GameQueue(0, queue_players=sorted(queue_players, key=get_queue_order)).get_snapshot()
+
+
+def get_one_short_queue(players_per_role: int, duos_count: int, seed: int, missing_role: str):
+    """
+    Returns a queue with a single player in the missing role, and the player of this role who will complete it
+    """
+    queue_players = get_in_memory_queue_snapshot(players_per_role, duos_count=duos_count, seed=seed)
+
+    role_queue_players = [qp for qp in queue_players if qp.role == missing_role]
+
+    # Duos are made of the first players, so the last player of the role is never part of one
+    filler = role_queue_players[-1]
+    queue_players = [qp for qp in queue_players if qp not in role_queue_players[1:]]
+
+    # The filler queues after everybody else
+    filler = filler.replace(queue_time=max(qp.queue_time for qp in queue_players) + timedelta(seconds=1))
+
+    return get_queue_snapshot(queue_players), filler
+
+
+def get_players_count(queue_snapshot, composition) -> int:
+    """
+    Returns the number of oldest players of the queue the composition is made of
+    """
+    return max(queue_snapshot.index(qp) for qp in composition.values()) + 1
+
+
+@pytest.mark.parametrize("missing_role", roles_list)
+@pytest.mark.parametrize("game_quality_threshold", [0.1, 0])
+def test_precomputed_pop_same_as_search(missing_role, game_quality_threshold):
+    for seed in range(4):
+        queue_snapshot, filler = get_one_short_queue(2 + seed % 2, seed % 3, seed, missing_role)
+
+        assert get_missing_role(queue_snapshot) == missing_role
+
+        # Without duos, the filler is part of the oldest players of the full queue as his role has 2 players
+        full_queue_snapshot = get_queue_snapshot(queue_snapshot + [filler])
+        assert full_queue_snapshot.index(filler) < 10 or seed % 3
+
+        composition = precompute_pop(queue_snapshot).complete(full_queue_snapshot, game_quality_threshold)
+
+        assert filler in composition.values()
+
+        expected = find_best_composition(
+            full_queue_snapshot, game_quality_threshold=game_quality_threshold, solver="vectorized"
+        )
+
+        # Solvers stop on the first game below good_enough_score, which does not have to be the same
+        if get_matchmaking_score(expected) < good_enough_score:
+            assert get_matchmaking_score(composition) < good_enough_score
+        else:
+            assert get_matchmaking_score(composition) == pytest.approx(
+                get_matchmaking_score(expected), abs=1e-9
+            )
+
+        # Both games need the same number of oldest players
+        if game_quality_threshold:
+            assert get_players_count(full_queue_snapshot, composition) == get_players_count(
+                full_queue_snapshot, expected
+            )
+
+
+def test_precomputed_pop_other_queue():
+    queue_snapshot, filler = get_one_short_queue(3, 2, 0, "MID")
+
+    precomputed_pop = precompute_pop(queue_snapshot)
+
+    # Another player left, or the other players are not in the same order anymore
+    assert not precomputed_pop.complete(get_queue_snapshot(queue_snapshot[1:] + [filler]))
+    assert not precomputed_pop.complete([filler] + queue_snapshot[::-1])
+
+    # The filler queued for a role which already had enough players, or with a duo
+    assert not precomputed_pop.complete(queue_snapshot + [filler.replace(role="TOP")])
+    assert not precomputed_pop.complete(queue_snapshot + [filler.replace(duo_id=queue_snapshot[0].player_id)])
+
+    # A player of the precomputed queue changed, for example with a new rating
+    assert not precomputed_pop.complete(
+        [queue_snapshot[0].replace(trueskill_mu=0)] + queue_snapshot[1:] + [filler]
+    )
+
+    # Full queues and queues two players short are not precomputed
+    assert not precompute_pop(queue_snapshot + [filler])
+    assert not precompute_pop([qp for qp in queue_snapshot if qp.role != "MID"])
+
+
+def test_update_precomputed_pop():
+    queue_snapshot, filler = get_one_short_queue(3, 1, 0, "TOP")
+
+    asyncio.run(update_precomputed_pop(0, queue_snapshot))
+
+    assert 0 in precomputed_pops
+
+    composition = find_precomputed_composition(0, get_queue_snapshot(queue_snapshot + [filler]))
+
+    # The precomputed game is only used once
+    assert composition
+    assert 0 not in precomputed_pops
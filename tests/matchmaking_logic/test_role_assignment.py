@@ -0,0 +1,91 @@
+import itertools
+import math
+import random
+
+from inhouse_bot.common_utils.fields import roles_list
+from inhouse_bot.game_queue import QueuePlayerSnapshot
+from inhouse_bot.matchmaking_logic.find_best_game import find_best_composition
+from inhouse_bot.matchmaking_logic.role_assignment import assign_roles, solve_assignment
+
+from tests.matchmaking_logic.matchmaking_test_utils import get_in_memory_queue_snapshot
+
+
+def test_solve_assignment_same_as_brute_force():
+    rng = random.Random(0)
+
+    for _ in range(50):
+        rows_count = rng.randint(1, 5)
+        columns_count = rng.randint(rows_count, 7)
+
+        costs = [
+            [rng.randint(0, 9) if rng.random() < 0.8 else math.inf for _ in range(columns_count)]
+            for _ in range(rows_count)
+        ]
+
+        # Every row can at least get its own column
+        for row in range(rows_count):
+            costs[row][row] = rng.randint(0, 9)
+
+        assignment = solve_assignment(costs)
+
+        assert len(set(assignment)) == rows_count
+
+        best_cost = min(
+            sum(costs[row][column] for row, column in enumerate(columns))
+            for columns in itertools.permutations(range(columns_count), rows_count)
+        )
+
+        assert sum(costs[row][column] for row, column in enumerate(assignment)) == best_cost
+
+
+def get_player(player_id: int, role: str, role_rank: int = None) -> QueuePlayerSnapshot:
+    return QueuePlayerSnapshot(player_id, role, None, 25, 25 / 3, role_rank)
+
+
+def test_assign_roles():
+    # Two players per role except SUP, which only has one
+    queue_snapshot = [get_player(player_id, roles_list[player_id % 4]) for player_id in range(8)]
+    queue_snapshot.append(get_player(8, "SUP"))
+
+    # The oldest flex player prefers MID and the newest one JGL, but one of them is needed in SUP
+    queue_snapshot += [get_player(9, "MID", 0), get_player(9, "SUP", 1)]
+    queue_snapshot += [get_player(10, "JGL", 0), get_player(10, "SUP", 1)]
+
+    assigned_snapshot = assign_roles(queue_snapshot)
+
+    assert [qp.player_id for qp in assigned_snapshot] == list(range(11))
+    assert {qp.player_id: qp.role for qp in assigned_snapshot}[9] == "MID"
+    assert {qp.player_id: qp.role for qp in assigned_snapshot}[10] == "SUP"
+
+    # Without flex players, the queue is kept as it is
+    assert assign_roles(queue_snapshot[:9]) == queue_snapshot[:9]
+
+    # Players who queued for each role separately are left to the search
+    multiple_roles_snapshot = queue_snapshot[:9] + [get_player(9, "MID"), get_player(9, "SUP")]
+
+    assert assign_roles(multiple_roles_snapshot) == multiple_roles_snapshot
+
+
+def test_assign_roles_age_priority():
+    # TOP and SUP both miss one player
+    queue_snapshot = [get_player(player_id, roles_list[player_id % 5]) for player_id in range(5)]
+    queue_snapshot += [get_player(player_id, roles_list[player_id % 5]) for player_id in range(6, 9)]
+
+    # Both players prefer SUP, but only one of them can get it
+    queue_snapshot += [get_player(9, "TOP", 1), get_player(9, "SUP", 0)]
+    queue_snapshot += [get_player(10, "SUP", 0), get_player(10, "TOP", 1)]
+
+    assigned_roles = {qp.player_id: qp.role for qp in assign_roles(queue_snapshot)}
+
+    assert assigned_roles[9] == "SUP"
+    assert assigned_roles[10] == "TOP"
+
+
+def test_find_best_composition_with_flex_players():
+    for seed in range(5):
+        queue_snapshot = get_in_memory_queue_snapshot(2, duos_count=seed % 3, seed=seed, multi_roles_count=4)
+
+        composition = find_best_composition(queue_snapshot)
+
+        assert len({qp.player_id for qp in composition.values()}) == 10
+        assert all(qp in queue_snapshot for qp in composition.values())
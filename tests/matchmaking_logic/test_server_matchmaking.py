@@ -0,0 +1,55 @@
+from typing import List
+
+from inhouse_bot.game_queue import QueuePlayerSnapshot
+from inhouse_bot.matchmaking_logic.find_best_game import find_best_composition, get_matchmaking_score
+from inhouse_bot.matchmaking_logic.server_matchmaking import find_server_compositions
+
+from tests.matchmaking_logic.matchmaking_test_utils import get_in_memory_queue_snapshot
+
+
+def get_channel_snapshot(players_per_role: int, channel_id: int) -> List[QueuePlayerSnapshot]:
+    """
+    A queue whose players are only in this channel
+    """
+    return [
+        QueuePlayerSnapshot(
+            qp.player_id + 100 * channel_id, qp.role, None, qp.trueskill_mu, qp.trueskill_sigma
+        )
+        for qp in get_in_memory_queue_snapshot(players_per_role, seed=channel_id)
+    ]
+
+
+def test_server_matchmaking_assigns_players_once():
+    # Half of the players of the first channel also queue in the second one
+    first_channel = get_channel_snapshot(3, 0)
+    second_channel = get_channel_snapshot(2, 1) + first_channel[:8]
+
+    channels_compositions = find_server_compositions(
+        {0: first_channel, 1: second_channel}, max_games_per_channel=2
+    )
+
+    player_ids = [
+        qp.player_id
+        for compositions in channels_compositions.values()
+        for composition in compositions
+        for qp in composition.values()
+    ]
+
+    assert len(player_ids) == len(set(player_ids))
+
+    # Only the first game of a channel can be above the quality threshold
+    for compositions in channels_compositions.values():
+        assert 1 <= len(compositions) <= 2
+        assert all(get_matchmaking_score(composition) < 0.1 for composition in compositions[1:])
+
+
+def test_server_matchmaking_independent_channels():
+    snapshots = {channel_id: get_channel_snapshot(3, channel_id) for channel_id in range(3)}
+
+    channels_compositions = find_server_compositions(snapshots)
+
+    # Channels without shared players get the same games as separate searches
+    for channel_id, snapshot in snapshots.items():
+        assert get_matchmaking_score(channels_compositions[channel_id][0]) == get_matchmaking_score(
+            find_best_composition(snapshot)
+        )
@@ -0,0 +1,152 @@
+import math
+import time
+
+import numpy as np
+import pytest
+
+from inhouse_bot.matchmaking_logic.find_best_game import get_matchmaking_score
+from inhouse_bot.matchmaking_logic.find_best_game import find_best_composition as find_best_game_composition
+from inhouse_bot.matchmaking_logic.vectorized_search import (
+    find_best_composition,
+    get_priority_chunks,
+    get_priority_order,
+    PackedQueue,
+)
+
+from tests.matchmaking_logic.matchmaking_test_utils import (
+    get_in_memory_queue_snapshot,
+    brute_force_best_composition,
+)
+
+
+def test_vectorized_search_same_as_brute_force():
+    for seed in range(10):
+        queue_players = get_in_memory_queue_snapshot(2 + seed % 2, duos_count=seed % 3, seed=seed)
+
+        expected = brute_force_best_composition(queue_players)
+        composition = find_best_composition(queue_players)
+
+        # Both searches stop on the first game below 51% winrate, which can be a different one
+        if get_matchmaking_score(expected) < 0.01:
+            assert get_matchmaking_score(composition) < 0.01
+        else:
+            assert get_matchmaking_score(composition) == pytest.approx(
+                get_matchmaking_score(expected), abs=1e-9
+            )
+
+
+def get_teams(composition):
+    """
+    Teams of a composition regardless of their side, as brute force goes through both orientations
+    """
+    return {
+        frozenset((role, qp.player_id) for (team, role), qp in composition.items() if team == side)
+        for side in ("BLUE", "RED")
+    }
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_same_best_game_as_brute_force(seed):
+    # Every other seed has duos, and the queue grows from 2 to 3 players per role
+    queue_players = get_in_memory_queue_snapshot(2 + seed % 2, duos_count=seed % 3, seed=seed)
+
+    expected = brute_force_best_composition(queue_players, good_enough_score=0)
+
+    # Scoring in itertools.product order, then in priority order like searches with a time budget
+    for deadline in (None, time.monotonic() + 60):
+        composition = find_best_composition(queue_players, good_enough_score=0, deadline=deadline)
+
+        assert get_teams(composition) == get_teams(expected)
+        assert get_matchmaking_score(composition) == pytest.approx(get_matchmaking_score(expected), abs=1e-12)
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_time_budget_same_best_game_as_brute_force(seed, monkeypatch):
+    queue_players = get_in_memory_queue_snapshot(2, duos_count=seed % 3, seed=seed)
+
+    # Searches given a time budget, like the ones of the matchmaking executor, use the priority order
+    priority_sorts = []
+    sort_units_by_priority = PackedQueue.sort_units_by_priority
+
+    def spy_sort_units_by_priority(packed):
+        priority_sorts.append(packed)
+        sort_units_by_priority(packed)
+
+    monkeypatch.setattr(PackedQueue, "sort_units_by_priority", spy_sort_units_by_priority)
+
+    composition = find_best_game_composition(
+        queue_players, game_quality_threshold=0, solver="vectorized", time_budget=10
+    )
+
+    assert priority_sorts
+
+    expected = brute_force_best_composition(queue_players, good_enough_score=0)
+
+    # The search stops on the first game below 51% winrate, else it has to find the most balanced one
+    if get_matchmaking_score(expected) < 0.01:
+        assert get_matchmaking_score(composition) < 0.01
+    else:
+        assert get_teams(composition) == get_teams(expected)
+        assert get_matchmaking_score(composition) == pytest.approx(get_matchmaking_score(expected), abs=1e-12)
+
+
+def test_canonical_compositions_same_optimal_score():
+    for seed in range(10):
+        queue_players = get_in_memory_queue_snapshot(
+            2, duos_count=seed % 3, seed=seed, multi_roles_count=seed % 6
+        )
+
+        # We go through all compositions in both orientations to get the true optimal score
+        expected = brute_force_best_composition(queue_players, good_enough_score=0)
+        composition = find_best_composition(queue_players, good_enough_score=0)
+
+        assert get_matchmaking_score(composition) == pytest.approx(get_matchmaking_score(expected), abs=1e-12)
+
+        # The first role always has the oldest player of the pair on blue side
+        top_players = [composition["BLUE", "TOP"], composition["RED", "TOP"]]
+        assert top_players == sorted(top_players, key=queue_players.index)
+
+
+def test_duo_constraints_prune_compositions():
+    queue_players = get_in_memory_queue_snapshot(3, duos_count=3, seed=0)
+
+    packed = PackedQueue(queue_players)
+
+    # Compositions breaking duos are not generated at all
+    assert packed.compositions_count < math.prod(packed.shape)
+
+    blue, red = packed.get_sides(np.arange(packed.compositions_count))
+
+    for side in np.concatenate((blue, red)):
+        side_player_ids = [queue_players[idx].player_id for idx in side]
+
+        for idx in side:
+            if queue_players[idx].duo_id is not None:
+                assert queue_players[idx].duo_id in side_player_ids
+
+
+def test_priority_order():
+    queue_players = get_in_memory_queue_snapshot(3, duos_count=2, seed=0)
+
+    packed = PackedQueue(queue_players)
+    packed.sort_units_by_priority()
+
+    # Close partial deltas are ordered by age, the newest player of the first assignment being the 5th one
+    blue, red = np.array([[4], [2], [1]]), np.array([[0], [3], [0]])
+    assert get_priority_order(blue, red, np.array([0.1, 0.6, 3])).tolist() == [1, 0, 2]
+
+    # Every composition is scored exactly once, starting with the most promising assignment of each unit
+    flat_indices = np.concatenate(list(get_priority_chunks(packed.units_shape)))
+
+    assert sorted(flat_indices.tolist()) == list(range(packed.compositions_count))
+    assert flat_indices[0] == 0
+
+    # With a deadline, the search goes through all compositions in this order and finds the same best score
+    for seed in range(5):
+        queue_players = get_in_memory_queue_snapshot(2 + seed % 2, duos_count=seed % 3, seed=seed)
+
+        expected = find_best_composition(queue_players, good_enough_score=0)
+        deadline = time.monotonic() + 60
+        composition = find_best_composition(queue_players, good_enough_score=0, deadline=deadline)
+
+        assert get_matchmaking_score(composition) == pytest.approx(get_matchmaking_score(expected), abs=1e-12)
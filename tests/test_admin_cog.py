@@ -0,0 +1,50 @@
+import asyncio
+from types import SimpleNamespace
+
+from discord.ext import commands
+
+from inhouse_bot.cogs.admin_cog import AdminCog
+
+
+class FakeContext:
+    def __init__(self):
+        self.messages = []
+
+    async def send(self, message):
+        self.messages.append(message)
+
+
+def test_get_players_roles(monkeypatch):
+    members = {
+        "<@123456789012345678>": SimpleNamespace(id=1, display_name="Top"),
+        "Midas": SimpleNamespace(id=2, display_name="Midas"),
+        "234567890123456789": SimpleNamespace(id=3, display_name="sup"),
+    }
+
+    async def convert(self, ctx, argument):
+        if argument not in members:
+            raise commands.BadArgument
+
+        return members[argument]
+
+    monkeypatch.setattr(commands.MemberConverter, "convert", convert)
+
+    ctx = FakeContext()
+
+    # Players whose names look like a role are still players, and roles are not case sensitive
+    players_roles = asyncio.run(
+        AdminCog.get_players_roles(
+            ctx, ("<@123456789012345678>", "top", "Midas", "SUP", "adc", "234567890123456789", "jungle")
+        )
+    )
+
+    assert [(member.id, roles) for member, roles in players_roles] == [
+        (1, ["TOP"]),
+        (2, ["SUP", "BOT"]),
+        (3, ["JGL"]),
+    ]
+    assert not ctx.messages
+
+    # Misspelled roles are not understood
+    assert asyncio.run(AdminCog.get_players_roles(ctx, ("Midas", "mdi"))) is None
+    assert ctx.messages == ["`mdi` was not understood as a player or a role"]